@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# bench_query_plans.py
+# Show the query plans and timings of the synchronizer's hot queries before and after the indexes added by
+# migrations/0005_query_indexes.py, on tables laid out as Django lays out the models.
+# Syntax: bench_query_plans.py [--rows N] [--images-per-instance N] [--queries N] [--dsn DSN]
+#
+# By default the tables are built in an in-memory sqlite database. With --dsn they are built in a PostgreSQL
+# database instead, which is what XOS runs on; this needs psycopg2, and drops and recreates the tables. Note that
+# sqlite appends the rowid to every index, so the foreign key index on embedded images is already ordered by id
+# there, and only PostgreSQL shows the benefit of the (serviceinstance_id, id) index.
+
+import argparse
+import random
+import sqlite3
+import time
+
+# Same as INDEXES in migrations/0005_query_indexes.py, which can't be imported without Django. The lookup of
+# instances by name is measured too, but the index it needs is on the core's table and up to the core.
+INDEXES = [
+    ("simpleexampleservice_embeddedimagenew_serviceinstance_id_id", "simpleexampleservice_embeddedimagenew",
+     "serviceinstance_id, id"),
+]
+
+TABLES = [
+    ("core_serviceinstance",
+     "id integer primary key, name varchar(200), owner_id integer, leaf_model_name varchar(1024)"),
+    ("simpleexampleservice_serviceinstancewithcompute2",
+     "serviceinstance_ptr_id integer primary key, compute_instance_id integer"),
+    ("simpleexampleservice_simpleexampleserviceinstance",
+     "serviceinstancewithcompute2_ptr_id integer primary key, tenant_message varchar(256), "
+     "foreground_color_id integer, background_color_id integer"),
+    ("simpleexampleservice_embeddedimagenew",
+     "id integer primary key, name varchar(256), url varchar(256), serviceinstance_id integer"),
+]
+
+# The indexes Django creates for the foreign keys with db_index
+FOREIGN_KEY_INDEXES = [
+    ("sesi_compute_instance_id", "simpleexampleservice_serviceinstancewithcompute2", "compute_instance_id"),
+    ("seei_serviceinstance_id", "simpleexampleservice_embeddedimagenew", "serviceinstance_id"),
+]
+
+# (name, sql with %(p)s for each parameter, function returning the parameters for a random row)
+QUERIES = [
+    ("instance by name",
+     "SELECT si.serviceinstancewithcompute2_ptr_id, si.tenant_message"
+     " FROM simpleexampleservice_simpleexampleserviceinstance si"
+     " JOIN simpleexampleservice_serviceinstancewithcompute2 c"
+     " ON si.serviceinstancewithcompute2_ptr_id = c.serviceinstance_ptr_id"
+     " JOIN core_serviceinstance s ON c.serviceinstance_ptr_id = s.id"
+     " WHERE s.name = %(p)s",
+     lambda bench: ["instance%d" % bench.random_instance()]),
+    ("images by instance and id range",
+     "SELECT id, name, url FROM simpleexampleservice_embeddedimagenew"
+     " WHERE serviceinstance_id = %(p)s AND id >= %(p)s AND id <= %(p)s ORDER BY id",
+     lambda bench: bench.random_image_range()),
+    ("instance by compute instance",
+     "SELECT serviceinstance_ptr_id FROM simpleexampleservice_serviceinstancewithcompute2"
+     " WHERE compute_instance_id = %(p)s",
+     lambda bench: [bench.random_instance() + bench.rows]),
+]
+
+
+class Bench(object):
+    def __init__(self, args):
+        self.rows = args.rows
+        self.images_per_instance = args.images_per_instance
+        self.queries = args.queries
+        self.random = random.Random(1)
+
+        if args.dsn:
+            import psycopg2
+            self.conn = psycopg2.connect(args.dsn)
+            self.placeholder = "%s"
+            self.explain = "EXPLAIN "
+        else:
+            self.conn = sqlite3.connect(":memory:")
+            self.placeholder = "?"
+            self.explain = "EXPLAIN QUERY PLAN "
+
+    def sql(self, text):
+        return text % {"p": self.placeholder}
+
+    def random_instance(self):
+        return self.random.randint(1, self.rows)
+
+    def random_image_range(self):
+        # images of instance i have ids i*k .. i*k+k-1; ask for the middle of them, as a page of ids would
+        instance = self.random_instance()
+        first = instance * self.images_per_instance
+        return [instance, first + 1, first + self.images_per_instance - 2]
+
+    def create(self):
+        cursor = self.conn.cursor()
+        for (table, columns) in TABLES:
+            cursor.execute("DROP TABLE IF EXISTS %s" % table)
+            cursor.execute("CREATE TABLE %s (%s)" % (table, columns))
+
+        instances = range(1, self.rows + 1)
+        insert = lambda table, count, rows: cursor.executemany(
+            "INSERT INTO %s VALUES (%s)" % (table, ", ".join([self.placeholder] * count)), rows)
+        insert("core_serviceinstance", 4,
+               [(i, "instance%d" % i, 1, "SimpleExampleServiceInstance") for i in instances])
+        insert("simpleexampleservice_serviceinstancewithcompute2", 2, [(i, i + self.rows) for i in instances])
+        insert("simpleexampleservice_simpleexampleserviceinstance", 4, [(i, "hello", None, None) for i in instances])
+        # Images are created over time, so the images of one instance are not next to each other
+        images = [(i * self.images_per_instance + j, "image%d" % j, "http://example.com/%d/%d.png" % (i, j), i)
+                  for i in instances for j in range(self.images_per_instance)]
+        self.random.shuffle(images)
+        insert("simpleexampleservice_embeddedimagenew", 4, images)
+
+        for (name, table, columns) in FOREIGN_KEY_INDEXES:
+            cursor.execute("CREATE INDEX %s ON %s (%s)" % (name, table, columns))
+        cursor.execute("ANALYZE")
+        self.conn.commit()
+
+    def add_indexes(self):
+        cursor = self.conn.cursor()
+        for (name, table, columns) in INDEXES:
+            cursor.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % (name, table, columns))
+        cursor.execute("ANALYZE")
+        self.conn.commit()
+
+    def plan(self, sql, params):
+        cursor = self.conn.cursor()
+        cursor.execute(self.explain + self.sql(sql), params)
+        return [" ".join([str(column) for column in row]) for row in cursor.fetchall()]
+
+    def run(self, sql, make_params):
+        cursor = self.conn.cursor()
+        sql = self.sql(sql)
+        params = [make_params(self) for i in range(self.queries)]
+        start = time.time()
+        for p in params:
+            cursor.execute(sql, p)
+            cursor.fetchall()
+        return (time.time() - start) / self.queries
+
+    def measure(self, label):
+        results = {}
+        for (name, sql, make_params) in QUERIES:
+            plan = self.plan(sql, make_params(self))
+            seconds = self.run(sql, make_params)
+            results[name] = seconds
+            print("%-8s %-34s %10.1f us/query" % (label, name, seconds * 1e6))
+            for line in plan:
+                print("         plan: %s" % line)
+        return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query plans of the hot queries before and after migration 0005")
+    parser.add_argument("--rows", type=int, default=100000, help="number of service instances")
+    parser.add_argument("--images-per-instance", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=1000, help="number of times to run each query")
+    parser.add_argument("--dsn", help="PostgreSQL connection string; an in-memory sqlite database if not given")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    bench = Bench(args)
+
+    start = time.time()
+    bench.create()
+    print("created %d instances and %d images in %.1f s" % (args.rows, args.rows * args.images_per_instance,
+                                                           time.time() - start))
+
+    before = bench.measure("before")
+    bench.add_indexes()
+    after = bench.measure("after")
+
+    for (name, _, _) in QUERIES:
+        print("%-34s speedup %.1fx" % (name, before[name] / after[name]))
+
+
+if __name__ == "__main__":
+    main()
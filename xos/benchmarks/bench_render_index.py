@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# bench_render_index.py
+# Compare renders per second of index.html.j2 and its fragments when the templates are recompiled on every render,
+# when they are served from the cached TemplateEngine, and when the rendered fragments are cached as well.
+# Syntax: bench_render_index.py [count]
+
+import os
+import sys
+import time
+import jinja2
+
+SYNCHRONIZER_DIR = os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))), "../synchronizer")
+sys.path.append(SYNCHRONIZER_DIR)
+
+import index_page
+from template_engine import TemplateEngine
+
+TEMPLATE_DIR = os.path.join(SYNCHRONIZER_DIR, "model_policies")
+
+FIELDS = {"tenant_message": "world",
+          "service_message": "hello",
+          "foreground_color": "#000000",
+          "background_color": "#FFFFFF",
+          "images": [{"name": "image%d" % i, "url": "http://example.com/image%d.png" % i} for i in range(10)]}
+
+
+class Service(object):
+    name = "simpleexampleservice"
+
+
+def render_page(get_template, fields):
+    layout_fields = dict(fields)
+    for (name, template, inputs) in index_page.FRAGMENTS:
+        layout_fields[name] = get_template(template).render(dict([(k, fields[k]) for k in inputs if k in fields]))
+    return get_template(index_page.TEMPLATE_NAME).render(layout_fields)
+
+
+def render_uncached(fields):
+    return render_page(lambda name: jinja2.Template(open(os.path.join(TEMPLATE_DIR, name)).read()), fields)
+
+
+def bench(name, func, count):
+    start = time.time()
+    for i in range(count):
+        func(FIELDS)
+    elapsed = time.time() - start
+    rate = count / elapsed
+    print("%-10s %8d renders %8.3f s %10.1f renders/s" % (name, count, elapsed, rate))
+    return rate
+
+
+def main():
+    count = 2000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+
+    engine = TemplateEngine()
+    cached = lambda fields: render_page(engine.get_template, fields)
+    fragments = lambda fields: index_page.render_index(Service(), fields)
+
+    if not (render_uncached(FIELDS) == cached(FIELDS) == fragments(FIELDS)):
+        print("Cached and uncached renders differ")
+        sys.exit(-1)
+
+    before = bench("uncached", render_uncached, count)
+    after = bench("cached", cached, count)
+    print("speedup %.1fx" % (after / before))
+    after = bench("fragments", fragments, count)
+    print("speedup %.1fx" % (after / before))
+
+
+if __name__ == "__main__":
+    main()
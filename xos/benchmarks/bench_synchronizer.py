@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# bench_synchronizer.py
+# Benchmark the hot paths of the model policy and the event step against the mock model accessor used by the unit
+# tests. Every call to the accessor (objects.all/filter/get/first/count, and save/delete of a model) is counted, and
+# is delayed by --latency milliseconds to simulate a gRPC round trip to the core.
+#
+# For each scenario and scale the benchmark reports throughput, p50/p99 latency per operation, accessor calls per
+# operation and the growth of the process' peak RSS. Results are compared against baselines.json: a scenario that
+# makes more accessor calls per operation than its baseline, or whose throughput falls below
+# (1 - --tolerance) of its baseline, fails the run. Use --update-baseline to record new baselines. Scenarios
+# without a baseline are only reported. With --ci, the run is skipped with a warning if no baselines are recorded
+# for the --latency at all, since the throughput baselines only mean something on the machine that runs CI; once
+# some are recorded, a scenario without one fails the run, so that stale baselines can't make the check pass.
+#
+# Relations between mock objects are plain attributes, so following a foreign key is not counted, although it
+# costs a round trip against a real core.
+#
+# Like the unit tests, this needs the xos and kubernetes-service xprotos to build the mock model accessor.
+#
+# Syntax: bench_synchronizer.py [--scales 10,100,1000,10000] [--latency ms] [--scenario name] [--update-baseline]
+#                               [--ci]
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+SYNCHRONIZER_DIR = os.path.join(BENCHMARKS_DIR, "../synchronizer")
+TESTS_DIR = os.path.join(SYNCHRONIZER_DIR, "tests")
+BASELINE_FN = os.path.join(BENCHMARKS_DIR, "baselines.json")
+
+sys.path.append(TESTS_DIR)
+from unit_test_common import setup_sync_unit_test
+
+MODELS = [("simpleexampleservice", "simpleexampleservice.xproto"),
+          ("kubernetes-service", "kubernetes.xproto")]
+
+
+class AccessorTracer(object):
+    """ Counts, and optionally delays, the calls made to the mock model accessor. """
+
+    LIST_METHODS = ["all", "filter", "get", "first", "count"]
+    OBJECT_METHODS = ["save", "delete"]
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        # Mock methods call each other (get calls filter); only the outermost call is a round trip
+        self.depth = 0
+
+    def wrap(self, func):
+        tracer = self
+
+        def traced(*args, **kwargs):
+            if tracer.depth == 0:
+                tracer.calls += 1
+                if tracer.latency:
+                    time.sleep(tracer.latency)
+            tracer.depth += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.depth -= 1
+        return traced
+
+    def install(self, MockObjectList, MockObject):
+        for name in self.LIST_METHODS:
+            setattr(MockObjectList, name, self.wrap(getattr(MockObjectList, name)))
+        for name in self.OBJECT_METHODS:
+            setattr(MockObject, name, self.wrap(getattr(MockObject, name)))
+
+
+class Event(object):
+    topic = "SimpleExampleEvent"
+
+    def __init__(self, name, tenant_message):
+        self.value = json.dumps({"service_instance": name, "tenant_message": tenant_message})
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100.0))]
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Bench(object):
+    def __init__(self, args):
+        setup = setup_sync_unit_test(TESTS_DIR, globals(), MODELS)
+        self.model_accessor = setup["model_accessor"]
+        self.MockObjectList = setup["MockObjectList"]
+
+        sys.path.append(SYNCHRONIZER_DIR)
+        sys.path.append(os.path.join(SYNCHRONIZER_DIR, "model_policies"))
+        sys.path.append(os.path.join(SYNCHRONIZER_DIR, "event_steps"))
+
+        from mock_modelaccessor import MockObject
+        self.tracer = AccessorTracer(args.latency / 1000.0)
+        self.tracer.install(self.MockObjectList, MockObject)
+
+        from model_policy_simpleexampleserviceinstance import SimpleExampleServiceInstancePolicy
+        from simpleexampleevent import SimpleExampleEventStep
+        self.policy_class = SimpleExampleServiceInstancePolicy
+        self.policy_class.reconcile_on_first_update = False
+        self.event_step_class = SimpleExampleEventStep
+
+        self.max_ops = args.max_ops
+
+    def reset_caches(self):
+        from fingerprints import index_fingerprints, service_fingerprints
+        from fragment_cache import embedded_image_lists, index_fragments
+        from instance_index import service_instance_index
+        from lookup_cache import service_lookups
+        from metrics import registry
+        from secret_data import secret_fingerprints
+        for cache in [index_fingerprints, service_fingerprints, service_instance_index, service_lookups, registry,
+                      index_fragments, embedded_image_lists, secret_fingerprints]:
+            cache.clear()
+
+    def make_world(self, count, with_compute):
+        """ Build a service with `count` instances, and fill the mock object stores with them. """
+        k8s_service = KubernetesService(id=1, name="kubernetes")
+        k8s_service.get_service_instance_class = lambda: KubernetesServiceInstance
+        service = SimpleExampleService(id=2, name="simpleexampleservice", service_message="hello",
+                                       service_secret="p@ssw0rd")
+        trust_domain = TrustDomain(id=3, owner=k8s_service, name="test-trust")
+        image = Image(id=4, name="test-image", tag="1.2", kind="container")
+        slice = Slice(id=5, trust_domain=trust_domain, service=service, default_image=image)
+        service.slices = self.MockObjectList([slice])
+
+        instances = []
+        computes = []
+        config_maps = []
+        mounts = []
+        for i in range(count):
+            id = 1000 + i
+            si = SimpleExampleServiceInstance(id=id, name="simpleexampleserviceinstance-%d" % id, owner=service,
+                                              owner_id=service.id, tenant_message="world", tenant_secret="l3tm31n",
+                                              foreground_color=None, background_color=None)
+            si.embedded_images = self.MockObjectList([])
+            if with_compute:
+                ksi = KubernetesServiceInstance(id=100000 + i, owner=k8s_service, slice=slice, image=image,
+                                                name="simpleexampleserviceinstance-%d" % id)
+                cfm = KubernetesConfigMap(id=200000 + i, trust_domain=trust_domain,
+                                          name="simpleexampleserviceinstance-map-%d" % id, data="")
+                mnt = KubernetesConfigVolumeMount(id=300000 + i, config=cfm, config_id=cfm.id, service_instance=ksi,
+                                                  service_instance_id=ksi.id)
+                ksi.kubernetes_config_volume_mounts = self.MockObjectList([mnt])
+                si.compute_instance = ksi
+                si.compute_instance_id = ksi.id
+                computes.append(ksi)
+                config_maps.append(cfm)
+                mounts.append(mnt)
+            else:
+                si.compute_instance = None
+            instances.append(si)
+
+        KubernetesService.objects.item_list = [k8s_service]
+        Service.objects.item_list = [k8s_service, service]
+        SimpleExampleServiceInstance.objects.item_list = list(instances)
+        KubernetesServiceInstance.objects.item_list = computes
+        KubernetesConfigMap.objects.item_list = config_maps
+        KubernetesConfigVolumeMount.objects.item_list = mounts
+        for model in [KubernetesSecret, KubernetesSecretVolumeMount]:
+            model.objects.item_list = []
+
+        return instances
+
+    def run(self, name, count):
+        self.reset_caches()
+        ops = min(count, self.max_ops)
+        policy = self.policy_class(model_accessor=self.model_accessor)
+
+        if name == "handle_create":
+            instances = self.make_world(count, with_compute=False)
+            op = lambda i: policy.handle_create(instances[i])
+        elif name == "render_index":
+            instances = self.make_world(count, with_compute=True)
+            op = lambda i: policy.render_index(instances[i])
+        elif name == "handle_update_changed":
+            instances = self.make_world(count, with_compute=True)
+
+            def op(i):
+                instances[i].tenant_message = "changed %d" % i
+                policy.handle_update(instances[i])
+        elif name == "handle_update_unchanged":
+            instances = self.make_world(count, with_compute=True)
+            # Warm up the fingerprints, as a running synchronizer would have
+            for si in instances[:ops]:
+                policy.handle_update(si)
+            op = lambda i: policy.handle_update(instances[i])
+        elif name == "handle_delete":
+            instances = self.make_world(count, with_compute=True)
+            op = lambda i: policy.handle_delete(instances[i])
+        elif name == "process_event":
+            instances = self.make_world(count, with_compute=True)
+            step = self.event_step_class(model_accessor=self.model_accessor, log=None)
+            op = lambda i: step.process_event(Event(instances[i].name, "changed %d" % i))
+        else:
+            raise Exception("unknown scenario %s" % name)
+
+        rss_before = peak_rss_kb()
+        self.tracer.calls = 0
+        latencies = []
+        start = time.time()
+        for i in range(ops):
+            op_start = time.time()
+            op(i)
+            latencies.append(time.time() - op_start)
+        elapsed = time.time() - start
+
+        return {"ops": ops,
+                "ops_per_sec": ops / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "calls_per_op": float(self.tracer.calls) / ops,
+                "peak_rss_growth_kb": peak_rss_kb() - rss_before}
+
+
+SCENARIOS = ["render_index", "handle_create", "handle_update_changed", "handle_update_unchanged", "handle_delete",
+             "process_event"]
+
+
+def check(key, result, baseline, tolerance):
+    """ Return a list of the ways `result` is worse than `baseline`. """
+    problems = []
+    if result["calls_per_op"] > baseline["calls_per_op"] + 1e-9:
+        problems.append("%s: %.2f accessor calls per op, baseline %.2f" %
+                        (key, result["calls_per_op"], baseline["calls_per_op"]))
+    if result["ops_per_sec"] < baseline["ops_per_sec"] * (1 - tolerance):
+        problems.append("%s: %.1f ops/s, baseline %.1f" % (key, result["ops_per_sec"], baseline["ops_per_sec"]))
+    return problems
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the simpleexampleservice synchronizer")
+    parser.add_argument("--scales", default="10,100,1000", help="comma-separated numbers of instances")
+    parser.add_argument("--latency", type=float, default=0.5, help="delay added to each accessor call, in ms")
+    parser.add_argument("--max-ops", type=int, default=1000, help="maximum operations measured per scale")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only this scenario")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="fraction of baseline throughput that may be lost before the run fails")
+    parser.add_argument("--update-baseline", action="store_true", help="record the results as the new baselines")
+    parser.add_argument("--ci", action="store_true",
+                        help="skip the run if no baselines are recorded, and fail it if a scenario has none")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scales = [int(s) for s in args.scales.split(",")]
+
+    baselines = {}
+    if os.path.exists(BASELINE_FN):
+        baselines = json.load(open(BASELINE_FN))
+    baselines_key = "latency=%s" % args.latency
+    if args.ci and (not args.update_baseline) and (not baselines.get(baselines_key)):
+        sys.stderr.write("WARNING: no baselines recorded for %s in %s, skipping the benchmark; run with "
+                         "--update-baseline on the CI machine to record them\n" % (baselines_key, BASELINE_FN))
+        return
+
+    bench = Bench(args)
+
+    print("%-26s %6s %6s %10s %9s %9s %8s %10s" %
+          ("scenario", "scale", "ops", "ops/s", "p50 ms", "p99 ms", "calls", "rss kb"))
+    results = {}
+    problems = []
+    for name in (args.scenario or SCENARIOS):
+        for count in scales:
+            key = "%s/%d" % (name, count)
+            result = bench.run(name, count)
+            results[key] = result
+            print("%-26s %6d %6d %10.1f %9.3f %9.3f %8.2f %10d" %
+                  (name, count, result["ops"], result["ops_per_sec"], result["p50_ms"], result["p99_ms"],
+                   result["calls_per_op"], result["peak_rss_growth_kb"]))
+
+            baseline = baselines.get(baselines_key, {}).get(key)
+            if baseline:
+                problems.extend(check(key, result, baseline, args.tolerance))
+            elif args.ci:
+                problems.append("%s: no baseline recorded for %s in %s" % (key, baselines_key, BASELINE_FN))
+
+    if args.update_baseline:
+        baselines.setdefault(baselines_key, {}).update(results)
+        with open(BASELINE_FN, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print("Wrote baselines to %s" % BASELINE_FN)
+    elif not baselines.get(baselines_key):
+        print("No baselines recorded for %s; run with --update-baseline to record them" % baselines_key)
+
+    if problems and not args.update_baseline:
+        print("REGRESSIONS:")
+        for problem in problems:
+            print("  " + problem)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
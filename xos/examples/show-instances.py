@@ -16,50 +16,319 @@
 
 # show-instances.py
 # Show the SimpleExampleServiceInstances and their ip addresses in a human-readable table.
-# Syntax: show-instances.py <base_url> <username> <password>
+# Syntax: show-instances.py [--format table|json|csv] [--concurrency N] [--watch] <base_url> <username> <password>
 #
 # Example: show-instances.py http://192.168.42.253:30006 admin@opencord.org letmein
+#
+# All requests share one HTTP session, so connections to the API are kept alive and reused. When a page of service
+# instances refers to more than --bulk-threshold compute instances, the whole compute instance collection is listed
+# once and joined locally; otherwise the compute instances are fetched one by one, by a pool of --concurrency
+# threads. Each page of rows is printed as soon as it is ready.
+#
+# With --watch, the instances are polled every --interval seconds and only rows that changed are printed. The first
+# poll lists both collections; later polls only ask for the service instances and compute instances updated since
+# the latest update seen, and merge them into what is already known. A compute instance changes without its service
+# instance being updated, for example when its pod is restarted with a new ip address, so both collections are
+# polled. Deleted instances never show up as updated, so both collections are listed again every --full-interval
+# seconds to forget them.
 
+import argparse
+import csv
+import itertools
+import json
 import sys
 import time
+from multiprocessing.pool import ThreadPool
+
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
+try:
+    from urllib import urlencode
+    from urlparse import urljoin
+except ImportError:
+    from urllib.parse import urlencode, urljoin
+
 DELAY=1
 
-def main():
-    if len(sys.argv)<4:
-        print "Syntax: xos-instances.py <base_url> <username> <password>"
-        sys.exit(-1)
+INSTANCES_URL = "/xosapi/v1/simpleexampleservice/simpleexampleserviceinstances"
+COMPUTE_INSTANCES_URL = "/xosapi/v1/kubernetes/kubernetesserviceinstances"
+COMPUTE_INSTANCE_URL = COMPUTE_INSTANCES_URL + "/%s"
+
+FIELDS = ["id", "name", "compute_instance_id", "pod_ip"]
+
 
-    base_url = sys.argv[1]
-    username = sys.argv[2]
-    password = sys.argv[3]
+class APIError(Exception):
+    def __init__(self, message, response):
+        super(APIError, self).__init__(message)
+        self.response = response
 
-    auth = HTTPBasicAuth(username, password)
 
-    r = requests.get(base_url + "/xosapi/v1/simpleexampleservice/simpleexampleserviceinstances", auth=auth)
+def make_session(username, password, pool_size):
+    session = requests.Session()
+    session.auth = HTTPBasicAuth(username, password)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
+
+def get_json(session, url, timeout, what):
+    r = session.get(url, timeout=timeout)
     if r.status_code != 200:
-        print "Received error response", r.status_code
-        print r.text
-        sys.exit(-1)
+        raise APIError("Received error response when fetching %s" % what, r)
+    return r.json()
+
+
+def list_pages(session, base_url, path, timeout, what, query=None):
+    """ Yield pages of a collection, following "next" links if the list endpoint paginates. `query` filters the
+        collection, for example {"updated__gt": timestamp}.
+    """
+    url = base_url + path
+    if query:
+        url += "?" + urlencode(query)
+    while url:
+        page = get_json(session, url, timeout, what)
+        yield page["items"]
+        url = page.get("next")
+        if url:
+            url = urljoin(base_url + "/", url)
 
 
-    print "%-4s %-40s %-4s %-4s" % ("id", "Name", "Comp", "IP")
-    for item in r.json()["items"]:
-        name = item.get("name")
-        compute_id = item["compute_instance_id"]
-        if compute_id:
-            r_compute = requests.get(base_url + "/xosapi/v1/kubernetes/kubernetesserviceinstances/%s" % compute_id, auth=auth)
-            if r_compute.status_code != 200:
-                print "Received error response when fetching compute instance", r_compute.status_code
-                print r_compute.text
-                sys.exit(-1)
-            pod_ip = r_compute.json().get("pod_ip", "")
+class ComputeInstances(object):
+    """ Cache of compute instances by id, filled either one instance at a time or by listing the collection. """
+
+    def __init__(self, session, base_url, timeout, pool, bulk_threshold):
+        self.session = session
+        self.base_url = base_url
+        self.timeout = timeout
+        self.pool = pool
+        self.bulk_threshold = bulk_threshold
+        self.by_id = {}
+        # Set once the collection has been listed, or brought up to date, in the current poll; later pages of the
+        # poll can use it as is
+        self.listed = False
+
+    def fetch_one(self, compute_id):
+        return get_json(self.session, self.base_url + COMPUTE_INSTANCE_URL % compute_id, self.timeout,
+                        "compute instance")
+
+    def fetch(self, ids):
+        """ Fetch the compute instances in `ids`, with one request for the collection if there are many. """
+        if self.listed:
+            return
+        if len(ids) > self.bulk_threshold:
+            self.listed = True
+            self.by_id = {}
+            for items in list_pages(self.session, self.base_url, COMPUTE_INSTANCES_URL, self.timeout,
+                                    "compute instances"):
+                for compute in items:
+                    self.by_id[compute["id"]] = compute
         else:
-            pod_ip = ""
-        print "%4s %-40s %4s %s" % (item["id"], name, compute_id, pod_ip)
+            for compute in self.pool.imap(self.fetch_one, ids):
+                self.by_id[compute["id"]] = compute
+
+    def fetch_updated(self, since):
+        """ Merge the compute instances updated after `since` into the cache, and return their ids. """
+        updated = []
+        for items in list_pages(self.session, self.base_url, COMPUTE_INSTANCES_URL, self.timeout,
+                                "compute instances", {"updated__gt": since}):
+            for compute in items:
+                self.by_id[compute["id"]] = compute
+                updated.append(compute["id"])
+        self.listed = True
+        return updated
+
+    def get(self, compute_id):
+        return self.by_id.get(compute_id, {})
+
+
+def latest_update(objects):
+    """ Return the latest updated timestamp of `objects`, or 0 if there is none. """
+    return max([obj["updated"] for obj in objects if obj.get("updated")] or [0])
+
+
+def make_row(item, compute):
+    return {"id": item["id"], "name": item.get("name"), "compute_instance_id": item["compute_instance_id"],
+            "pod_ip": compute.get("pod_ip", "")}
+
+
+def join_page(items, computes, seen):
+    """ Return the rows of `items` that are new or changed since they were recorded in `seen`, fetching their
+        compute instances. `seen` maps service instance id to the updated timestamps of the service instance and
+        its compute instance, and the compute instance's ip address, and is updated in place.
+    """
+    computes.fetch([item["compute_instance_id"] for item in items if item["compute_instance_id"]])
+
+    rows = []
+    for item in items:
+        compute = computes.get(item["compute_instance_id"]) if item["compute_instance_id"] else {}
+        version = (item.get("updated"), compute.get("updated"), compute.get("pod_ip"))
+        if seen.get(item["id"]) != version:
+            seen[item["id"]] = version
+            rows.append(make_row(item, compute))
+    return rows
+
+
+class TableWriter(object):
+    def begin(self):
+        print "%-4s %-40s %-4s %-4s" % ("id", "Name", "Comp", "IP")
+
+    def write(self, row):
+        print "%4s %-40s %4s %s" % (row["id"], row["name"], row["compute_instance_id"], row["pod_ip"])
+
+    def end(self):
+        pass
+
+
+class JSONWriter(object):
+    """ Writes a JSON list, one row per line, as the rows arrive. """
+
+    def begin(self):
+        self.first = True
+        sys.stdout.write("[")
+
+    def write(self, row):
+        sys.stdout.write(("\n" if self.first else ",\n") + json.dumps(row, sort_keys=True))
+        self.first = False
+
+    def end(self):
+        sys.stdout.write("\n]\n")
+
+
+class JSONLinesWriter(object):
+    """ Writes one JSON object per line. Used by --watch, where the output never ends. """
+
+    def begin(self):
+        pass
+
+    def write(self, row):
+        sys.stdout.write(json.dumps(row, sort_keys=True) + "\n")
+
+    def end(self):
+        pass
+
+
+class CSVWriter(object):
+    def begin(self):
+        self.writer = csv.DictWriter(sys.stdout, FIELDS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def end(self):
+        pass
+
+
+WRITERS = {"table": TableWriter, "json": JSONWriter, "csv": CSVWriter}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Show the SimpleExampleServiceInstances and their ip addresses")
+    parser.add_argument("base_url")
+    parser.add_argument("username")
+    parser.add_argument("password")
+    parser.add_argument("--format", choices=sorted(WRITERS.keys()), default="table", help="output format")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="maximum number of compute instances to fetch at once")
+    parser.add_argument("--timeout", type=float, default=30, help="timeout of each request, in seconds")
+    parser.add_argument("--bulk-threshold", type=int, default=20,
+                        help="list all compute instances at once when a page needs more than this many")
+    parser.add_argument("--watch", action="store_true", help="keep polling and print rows as they change")
+    parser.add_argument("--interval", type=float, default=DELAY, help="seconds between polls with --watch")
+    parser.add_argument("--full-interval", type=float, default=60,
+                        help="seconds between full listings with --watch, which notice deleted instances")
+    return parser.parse_args()
+
+
+def poll_all(session, args, computes, writer, seen, begin):
+    """ List all the service instances and print the rows that changed. Returns the service instances by id. """
+    pages = list_pages(session, args.base_url, INSTANCES_URL, args.timeout, "service instances")
+    # Fetch the first page before printing anything, so that a failed listing does not leave a partial table
+    first_page = next(pages)
+    begin()
+
+    computes.listed = False
+    instances = {}
+    for items in itertools.chain([first_page], pages):
+        instances.update([(item["id"], item) for item in items])
+        for row in join_page(items, computes, seen):
+            writer.write(row)
+        sys.stdout.flush()
+
+    # Forget deleted instances, so that they are printed again if they come back
+    for id in list(seen.keys()):
+        if id not in instances:
+            del seen[id]
+    return instances
+
+
+def poll_updated(session, args, computes, writer, seen, instances):
+    """ Fetch the service instances and compute instances updated since the latest update seen, merge them into
+        `instances` and `computes`, and print the rows that changed.
+    """
+    since = latest_update(instances.values())
+    changed = {}
+    for items in list_pages(session, args.base_url, INSTANCES_URL, args.timeout, "service instances",
+                            {"updated__gt": since}):
+        changed.update([(item["id"], item) for item in items])
+    instances.update(changed)
+
+    compute_ids = set(computes.fetch_updated(latest_update(computes.by_id.values())))
+    for item in instances.values():
+        if item["compute_instance_id"] in compute_ids:
+            changed.setdefault(item["id"], item)
+
+    for row in join_page([changed[id] for id in sorted(changed)], computes, seen):
+        writer.write(row)
+    sys.stdout.flush()
+
+
+def main():
+    args = parse_args()
+    concurrency = max(1, args.concurrency)
+
+    session = make_session(args.username, args.password, concurrency)
+    pool = ThreadPool(concurrency)
+    # A full listing in watch mode is followed by polls that keep every compute instance up to date, so the whole
+    # collection is listed at once rather than only the compute instances of each page
+    bulk_threshold = -1 if args.watch else args.bulk_threshold
+    computes = ComputeInstances(session, args.base_url, args.timeout, pool, bulk_threshold)
+    if args.watch and args.format == "json":
+        writer = JSONLinesWriter()
+    else:
+        writer = WRITERS[args.format]()
+
+    started = []
+
+    def begin():
+        if not started:
+            writer.begin()
+            started.append(True)
+
+    seen = {}
+    try:
+        instances = poll_all(session, args, computes, writer, seen, begin)
+        listed_at = time.time()
+        while args.watch:
+            time.sleep(args.interval)
+            if time.time() - listed_at >= args.full_interval:
+                instances = poll_all(session, args, computes, writer, seen, begin)
+                listed_at = time.time()
+            else:
+                poll_updated(session, args, computes, writer, seen, instances)
+        writer.end()
+    except APIError as e:
+        sys.stdout.flush()
+        print >> sys.stderr, e, e.response.status_code
+        print >> sys.stderr, e.response.text
+        sys.exit(-1)
+    except KeyboardInterrupt:
+        writer.end()
+    finally:
+        pool.terminate()
 
 
 if __name__=="__main__":
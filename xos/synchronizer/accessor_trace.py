@@ -0,0 +1,132 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" accessor_trace.py
+
+    Count the round trips to the core made by each model policy or event step invocation.
+
+    Every call the xosapi ORM makes to the core, whether from objects.filter/get/first/all, a related manager,
+    following a foreign key, save or delete, goes through ORMStub.invoke. install() wraps that method so each call
+    is attributed, with its wall time, to the operation that is running on the current thread. Operations are
+    marked with the @traced decorator; when a traced operation calls another one, the calls are attributed to the
+    outer operation.
+
+    When an operation finishes, its duration is added to the operation_seconds histogram, and the number of calls
+    and the time spent in them to the accessor_calls and accessor_seconds histograms, and they are logged.
+    Operations that make at least `many_calls` calls are logged at info level, to make N+1 patterns easy to find.
+    Operations that raise are counted in operation_failures_total. Every call is also counted in
+    accessor_calls_total, labelled with the operation and the name of the gRPC method, for example
+    GetKubernetesServiceInstance.
+"""
+
+import functools
+import threading
+import time
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+from metrics import registry
+
+log = create_logger(Config().get('logging'))
+
+CALL_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+SECONDS_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10]
+
+# Operations that make this many calls are logged at info level
+many_calls = 20
+
+_local = threading.local()
+
+
+class Trace(object):
+    def __init__(self, operation):
+        self.operation = operation
+        self.calls = 0
+        self.seconds = 0.0
+        self.rpcs = {}
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def record_call(rpc, seconds):
+    """ Attribute one call to the core to the operation running on this thread. """
+    trace = current_trace()
+    registry.inc("accessor_calls_total", operation=trace.operation if trace else "untraced", rpc=rpc)
+    if trace:
+        trace.calls += 1
+        trace.seconds += seconds
+        trace.rpcs[rpc] = trace.rpcs.get(rpc, 0) + 1
+
+
+def finish_trace(trace, elapsed):
+    registry.observe("operation_seconds", elapsed, SECONDS_BUCKETS, operation=trace.operation)
+    registry.observe("accessor_calls", trace.calls, CALL_BUCKETS, operation=trace.operation)
+    registry.observe("accessor_seconds", trace.seconds, SECONDS_BUCKETS, operation=trace.operation)
+
+    if trace.calls >= many_calls:
+        log_func = log.info
+    else:
+        log_func = log.debug
+    log_func("Accessor calls", operation=trace.operation, accessor_calls=trace.calls,
+             accessor_seconds=round(trace.seconds, 6), elapsed_seconds=round(elapsed, 6), rpcs=trace.rpcs)
+
+
+def traced(operation):
+    """ Decorator that attributes the calls to the core made by the decorated function to `operation`. """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_trace() is not None:
+                return func(*args, **kwargs)
+
+            trace = _local.trace = Trace(operation)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                registry.inc("operation_failures_total", operation=operation)
+                raise
+            finally:
+                _local.trace = None
+                finish_trace(trace, time.time() - start)
+        return wrapper
+    return decorator
+
+
+def make_traced_invoke(invoke):
+    def traced_invoke(self, name, request, *args, **kwargs):
+        start = time.time()
+        try:
+            return invoke(self, name, request, *args, **kwargs)
+        finally:
+            record_call(name, time.time() - start)
+    traced_invoke.traced = True
+    return traced_invoke
+
+
+def install():
+    """ Start counting calls made through the xosapi ORM. Safe to call more than once. Returns False if the ORM is
+        not available, as with the mock model accessor.
+    """
+    try:
+        from xosapi.orm import ORMStub
+    except ImportError:
+        return False
+
+    if not getattr(ORMStub.invoke, "traced", False):
+        ORMStub.invoke = make_traced_invoke(ORMStub.invoke)
+    return True
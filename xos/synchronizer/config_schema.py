@@ -0,0 +1,60 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" config_schema.py
+
+    config.yaml holds both the standard synchronizer settings and this synchronizer's own sections. xosconfig
+    validates it against a single schema, and the standard synchronizer schema does not allow keys that it does not
+    know. Rather than keep a copy of the standard schema, simpleexampleservice-config-schema.yaml only describes the
+    synchronizer's own sections, and init_config() adds them to the standard schema from the installed xosconfig
+    before it initializes the config.
+"""
+
+import os
+import tempfile
+
+import yaml
+from xosconfig import Config
+
+STANDARD_SCHEMA = "synchronizer-config-schema.yaml"
+
+
+def extend_schema(schema, extension):
+    """ Return `schema` with the top-level keys of `extension` added. A key may not be in both. """
+    keys = set(schema["map"].keys()) & set(extension["map"].keys())
+    if keys:
+        raise Exception("Config sections %s are already in the standard synchronizer config schema" %
+                        ", ".join(sorted(keys)))
+    extended = dict(schema)
+    extended["map"] = dict(schema["map"])
+    extended["map"].update(extension["map"])
+    return extended
+
+
+def init_config(config_file, extension_schema, override_config_file=None):
+    """ Initialize the config from `config_file`, and `override_config_file` if it is given, validating them against
+        the standard synchronizer schema extended with `extension_schema`.
+    """
+    with open(Config.get_abs_path(STANDARD_SCHEMA)) as f:
+        schema = yaml.safe_load(f)
+    with open(extension_schema) as f:
+        extension = yaml.safe_load(f)
+
+    (fd, schema_file) = tempfile.mkstemp(prefix="config-schema-", suffix=".yaml")
+    try:
+        with os.fdopen(fd, "w") as f:
+            yaml.safe_dump(extend_schema(schema, extension), f, default_flow_style=False)
+        Config.init(config_file, schema_file, override_config_file)
+    finally:
+        os.remove(schema_file)
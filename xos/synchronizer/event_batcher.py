@@ -0,0 +1,100 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" event_batcher.py
+
+    Collect events into a window and hand them to a flush function in one batch. Within a window only the last
+    value for each key is kept, so a burst of updates to the same object results in a single write.
+
+    A window is flushed when it holds `max_events` distinct keys, or `max_delay` seconds after its first event
+    arrived, whichever comes first. Flushes are serialized, so batches are always processed in arrival order.
+"""
+
+import threading
+from collections import OrderedDict
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+log = create_logger(Config().get('logging'))
+
+
+class EventBatcher(object):
+    def __init__(self, flush_func, max_events=100, max_delay=0.5):
+        self.flush_func = flush_func
+        self.max_events = max_events
+        self.max_delay = max_delay
+
+        self.pending = OrderedDict()
+        self.timer = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+        self.received = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+
+    def add(self, key, value):
+        with self.lock:
+            self.received += 1
+            if key in self.pending:
+                # keep only the latest value, but move the key to the end so batches stay in arrival order
+                self.coalesced += 1
+                del self.pending[key]
+            self.pending[key] = value
+
+            full = len(self.pending) >= self.max_events
+            if (not full) and (self.timer is None):
+                self.timer = threading.Timer(self.max_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                batch = self.pending
+                self.pending = OrderedDict()
+
+            if not batch:
+                return
+
+            try:
+                failed = self.flush_func(batch)
+            except Exception:
+                log.exception("Failed to flush event batch", events=len(batch))
+                failed = len(batch)
+
+            with self.lock:
+                self.batches += 1
+                self.flushed += len(batch)
+                self.failed += failed or 0
+
+            log.info("Flushed event batch", batch_events=len(batch), batch_failed=failed, **self.stats())
+
+    def stats(self):
+        with self.lock:
+            return {"received": self.received,
+                    "coalesced": self.coalesced,
+                    "flushed": self.flushed,
+                    "failed": self.failed,
+                    "batches": self.batches,
+                    "coalesce_ratio": float(self.coalesced) / self.received if self.received else 0.0}
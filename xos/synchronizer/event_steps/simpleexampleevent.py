@@ -1,4 +1,3 @@
-
 # Copyright 2017-present Open Networking Foundation
 #
 # Licensed under the Apache License, Version 2.0 (the "License");
@@ -15,29 +14,250 @@
 
 
 import json
+import numbers
+import threading
+import time
 from xossynchronizer.event_steps.eventstep import EventStep
 from xosconfig import Config
 from multistructlog import create_logger
 
+import sharding
+import shutdown
+from accessor_trace import traced
+from event_batcher import EventBatcher
+from instance_index import service_instance_index
+from metrics import registry
+from sharded_executor import ShardedExecutor
+
 log = create_logger(Config().get('logging'))
 
+LAG_SECONDS_BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600]
+
+events_config = Config.get("events") or {}
+
 
 class SimpleExampleEventStep(EventStep):
     topics = ["SimpleExampleEvent"]
     technology = "kafka"
 
+    # With batch_size = 1 every event is written as soon as it arrives. With a larger batch_size, events are
+    # collected for up to batch_window seconds, only the last tenant_message for each instance is kept, and each
+    # instance is saved once per batch. Both are set in the `events` section of config.yaml.
+    batch_size = events_config.get("batch_size", 1)
+    batch_window = events_config.get("batch_window", 0.5)
+
+    # Batches that name more instances than this fetch all instances with one List call, rather than running one
+    # filter per name.
+    bulk_lookup_threshold = 20
+
+    # With workers > 0, events that are not batched are applied by a pool of worker threads. Events are sharded by
+    # service_instance name, so updates to one instance stay in order while different instances are updated
+    # concurrently. Each worker queues at most worker_queue_size events before the Kafka consumer is blocked, and
+    # at exit the workers are given drain_timeout seconds to finish what is queued. All three are set in the
+    # `events` section of config.yaml.
+    workers = events_config.get("workers", 0)
+    worker_queue_size = events_config.get("worker_queue_size", 100)
+    drain_timeout = events_config.get("drain_timeout", 10)
+
+    # The event engine creates a new step object for every event, so the batcher and executor are shared by the
+    # class
+    batcher = None
+    batcher_lock = threading.Lock()
+    executor = None
+    executor_lock = threading.Lock()
+
     def __init__(self, *args, **kwargs):
         super(SimpleExampleEventStep, self).__init__(*args, **kwargs)
 
+    @traced("SimpleExampleEventStep.process_event")
     def process_event(self, event):
         value = json.loads(event.value)
         service_instance_name = value["service_instance"]
         tenant_message = value["tenant_message"]
 
-        objs = self.model_accessor.SimpleExampleServiceInstance.objects.filter(name=service_instance_name)
+        registry.inc("events_received_total", topic=event.topic)
+
+        # Kafka timestamps are in milliseconds. The age of the event when it reaches us is the consumer's lag.
+        timestamp = getattr(event, "timestamp", None)
+        if isinstance(timestamp, numbers.Number):
+            registry.observe("event_lag_seconds", max(0, time.time() - timestamp / 1000.0), LAG_SECONDS_BUCKETS,
+                             topic=event.topic)
+
+        # With sharding, every replica sees every event and applies those for the instances it owns
+        if sharding.enabled() and not self.owns_event(service_instance_name):
+            registry.inc("events_not_owned_total", topic=event.topic)
+            return
+
+        if self.batch_size > 1:
+            self.get_batcher().add(service_instance_name, (tenant_message, event.topic))
+        elif self.workers > 0:
+            self.get_executor().submit(service_instance_name, self.apply_event_async,
+                                       service_instance_name, tenant_message, event.topic)
+        else:
+            try:
+                self.apply_event(service_instance_name, tenant_message, event.topic)
+            except Exception:
+                registry.inc("events_failed_total", topic=event.topic)
+                raise
+
+    def owns_event(self, service_instance_name):
+        """ Return True if this replica owns an instance named `service_instance_name`. Events are sharded by the
+            id of the instance, like its model policies, so the replica that applies an event is the one whose index
+            the model policy keeps current. Names that match no instance are left to the replica that owns the name,
+            which reports them.
+        """
+        objs = self.lookup_instances([service_instance_name]).get(service_instance_name)
+        if not objs:
+            return sharding.owns_instance_name(service_instance_name)
+        return any([sharding.owns_instance(obj.id) for obj in objs])
+
+    def apply_event(self, service_instance_name, tenant_message, topic):
+        objs = self.lookup_instances([service_instance_name]).get(service_instance_name)
         if not objs:
             raise Exception("failed to find %s" % service_instance_name)
 
-        for obj in objs:
-            obj.tenant_message = tenant_message
-            obj.save(always_update_timestamp=True)
+        for obj in sharding.owned_instances(objs):
+            self.update_instance(obj, tenant_message, topic)
+
+    @traced("SimpleExampleEventStep.apply_event_async")
+    def apply_event_async(self, service_instance_name, tenant_message, topic):
+        # Runs on a worker thread, where nobody else will see the exception
+        try:
+            self.apply_event(service_instance_name, tenant_message, topic)
+        except Exception:
+            log.exception("failed to apply event", service_instance=service_instance_name, topic=topic)
+            registry.inc("events_failed_total", topic=topic)
+
+    def get_executor(self):
+        cls = self.__class__
+        with cls.executor_lock:
+            if cls.executor is None:
+                executor = ShardedExecutor(cls.workers, queue_size=cls.worker_queue_size, name=cls.__name__)
+                shutdown.register(executor.shutdown, cls.drain_timeout)
+                registry.add_collector("event_executor",
+                                       lambda: [("event_queue_depth", {}, executor.queue_depth())])
+                cls.executor = executor
+        return cls.executor
+
+    def get_batcher(self):
+        cls = self.__class__
+        with cls.batcher_lock:
+            if cls.batcher is None:
+                model_accessor = self.model_accessor
+                step_log = self.log
+
+                def flush_func(batch):
+                    return cls(model_accessor=model_accessor, log=step_log).flush_batch(batch)
+
+                batcher = cls.batcher = EventBatcher(flush_func, max_events=cls.batch_size,
+                                                     max_delay=cls.batch_window)
+                # write out the partially filled window rather than dropping it
+                shutdown.register(batcher.flush)
+                registry.add_collector("event_batcher", lambda: cls.collect_batcher(batcher))
+        return cls.batcher
+
+    def lookup_instances(self, names):
+        """ Return a dictionary that maps each of `names` that exists to its list of SimpleExampleServiceInstances.
+
+            Names are resolved from the in-process index where possible. The index is filled with one List call on
+            first use, unless it was restored from a snapshot, and names that are missing from it are looked up in
+            the core and added.
+        """
+        index = service_instance_index
+        if not (index.loaded or index.restored):
+            index.load(self.model_accessor.SimpleExampleServiceInstance.objects.all())
+
+        instances = {}
+        missing = set()
+        for name in names:
+            objs = index.get(name) or self.fetch_restored(name)
+            if objs:
+                instances[name] = objs
+            else:
+                missing.add(name)
+
+        if len(missing) > self.bulk_lookup_threshold:
+            for obj in self.model_accessor.SimpleExampleServiceInstance.objects.all():
+                if obj.name in missing:
+                    instances.setdefault(obj.name, []).append(obj)
+                    index.update(obj)
+        else:
+            for name in missing:
+                objs = self.model_accessor.SimpleExampleServiceInstance.objects.filter(name=name)
+                if objs:
+                    instances[name] = objs
+                    for obj in objs:
+                        index.update(obj)
+        return instances
+
+    def fetch_restored(self, name):
+        """ Fetch the instances that the index restored for `name` by id, keeping those that still have that name. """
+        objs = []
+        for id in service_instance_index.pop_restored(name):
+            for obj in self.model_accessor.SimpleExampleServiceInstance.objects.filter(id=id):
+                if obj.name == name:
+                    objs.append(obj)
+                    service_instance_index.update(obj)
+        return objs
+
+    def refetch(self, obj):
+        """ Return the core's current copy of obj, and put it in the index in place of obj. """
+        objs = self.model_accessor.SimpleExampleServiceInstance.objects.filter(id=obj.id)
+        if not objs:
+            service_instance_index.remove(obj.id)
+            raise Exception("failed to find %s" % obj.name)
+        service_instance_index.update(objs[0])
+        return objs[0]
+
+    def update_instance(self, obj, tenant_message, topic):
+        """ Set tenant_message on obj. Returns False if obj already had that message and nothing was written. """
+        if obj.tenant_message == tenant_message:
+            # obj may come from the index, and the instance may have been changed through the API since, so check
+            # the copy in the core before deciding that there is nothing to write
+            obj = self.refetch(obj)
+        if obj.tenant_message == tenant_message:
+            # Replayed and duplicate events are common after a consumer rebalance. Saving would run the model
+            # policy again for no change, so drop the write.
+            registry.inc("events_noop_total", topic=topic)
+            return False
+
+        # obj may come from the index and be older than the copy in the core, so only write tenant_message
+        obj.tenant_message = tenant_message
+        try:
+            obj.save(update_fields=["tenant_message"], always_update_timestamp=True)
+        except Exception:
+            # The object may have been deleted behind our back; look it up again next time
+            service_instance_index.remove(obj.id)
+            raise
+
+        registry.inc("events_written_total", topic=topic)
+        return True
+
+    @traced("SimpleExampleEventStep.flush_batch")
+    def flush_batch(self, batch):
+        """ Apply a batch of coalesced tenant_message updates. Returns the number of updates that failed. """
+        instances = self.lookup_instances(batch.keys())
+
+        failed = 0
+        for (service_instance_name, (tenant_message, topic)) in batch.items():
+            objs = instances.get(service_instance_name)
+            if not objs:
+                log.error("failed to find %s" % service_instance_name)
+                registry.inc("events_failed_total", topic=topic)
+                failed += 1
+                continue
+
+            for obj in sharding.owned_instances(objs):
+                try:
+                    self.update_instance(obj, tenant_message, topic)
+                except Exception:
+                    log.exception("failed to update %s" % service_instance_name)
+                    registry.inc("events_failed_total", topic=topic)
+                    failed += 1
+        return failed
+
+    @staticmethod
+    def collect_batcher(batcher):
+        stats = batcher.stats()
+        return [("events_coalesced_total", {}, stats["coalesced"]),
+                ("event_batches_total", {}, stats["batches"])]
@@ -0,0 +1,109 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" fingerprints.py
+
+    Fingerprints of the inputs that were used to generate a config map, kept per object id. If the fingerprint
+    of the current inputs matches the stored one, the config map does not need to be re-rendered or compared.
+
+    A fingerprint may be tagged with the `updated` timestamp of the object it was computed for, which lets it be
+    saved in a snapshot (see snapshot.py). Fingerprints restored from a snapshot are not trusted until verify() has
+    seen that the object still has the same timestamp.
+"""
+
+import hashlib
+import json
+
+
+def compute_fingerprint(*parts):
+    """ Return a hex digest of the json-serializable `parts`. """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class FingerprintCache(object):
+    def __init__(self):
+        self.fingerprints = {}
+        self.tags = {}
+        self.unverified = {}
+        self.hits = 0
+        self.misses = 0
+
+    def matches(self, key, fingerprint):
+        if self.fingerprints.get(key) == fingerprint:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def get(self, key):
+        return self.fingerprints.get(key)
+
+    def set(self, key, fingerprint, tag=None):
+        self.fingerprints[key] = fingerprint
+        self.unverified.pop(key, None)
+        if tag is None:
+            self.tags.pop(key, None)
+        else:
+            self.tags[key] = tag
+
+    def discard(self, key):
+        self.fingerprints.pop(key, None)
+        self.tags.pop(key, None)
+        self.unverified.pop(key, None)
+
+    def restore(self, entries):
+        """ Hold the (fingerprint, tag) of each key in `entries` until verify() is called for it. """
+        for (key, (fingerprint, tag)) in entries.items():
+            if key not in self.fingerprints:
+                self.unverified[key] = (fingerprint, tag)
+
+    def verify(self, key, tag):
+        """ Trust the restored fingerprint of `key` if it was tagged with `tag`, and drop it otherwise. """
+        entry = self.unverified.pop(key, None)
+        if entry and (tag is not None) and (entry[1] == tag):
+            self.set(key, entry[0], tag)
+
+    def snapshot(self):
+        """ Return the (fingerprint, tag) of each key that has a tag, including those not verified yet. """
+        # Called from the snapshot thread; copy the dictionaries first, since the policies may be changing them
+        entries = dict(self.unverified)
+        fingerprints = dict(self.fingerprints)
+        for (key, tag) in list(self.tags.items()):
+            if key in fingerprints:
+                entries[key] = (fingerprints[key], tag)
+        return entries
+
+    def clear(self):
+        self.fingerprints = {}
+        self.tags = {}
+        self.unverified = {}
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.fingerprints),
+                "hit_rate": float(self.hits) / total if total else 0.0}
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+
+# Fingerprints of the index.html config maps, keyed by SimpleExampleServiceInstance id
+index_fingerprints = FingerprintCache()
+
+# Fingerprints of the service-wide settings that are copied into every instance, keyed by SimpleExampleService id
+service_fingerprints = FingerprintCache()
@@ -0,0 +1,103 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" fragment_cache.py
+
+    Caches used to build index.html incrementally: the rendered html of each fragment of the page, keyed by its
+    template and a digest of its fields, and the embedded images of each instance, keyed by instance id. A gallery
+    can hold up to max_images images, so both are bounded by the size of their values as well as by their number
+    of entries, and evict the least recently used entries when either is exceeded.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    def __init__(self, max_entries, max_bytes=None, sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                value = self.entries.pop(key)
+                self.entries[key] = value
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self.lock:
+            self.remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Would evict everything else and still not fit
+                return
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.bytes += size
+            while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        # Called with the lock held
+        if key in self.entries:
+            del self.entries[key]
+            self.bytes -= self.sizes.pop(key)
+
+    def discard(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.sizes = {}
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "size": len(self.entries),
+                    "bytes": self.bytes,
+                    "hit_rate": float(self.hits) / total if total else 0.0}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def image_list_size(value):
+    """ Roughly the number of bytes held by an entry of embedded_image_lists. """
+    (image_ids, images) = value
+    return 8 * len(image_ids) + sum([len(image["name"] or "") + len(image["url"] or "") for image in images])
+
+
+# Rendered html of the fragments of index.html, keyed by the compiled fragment template and a digest of its fields
+index_fragments = LRUCache(max_entries=4096, max_bytes=16 * 1024 * 1024)
+
+# (sorted image ids, image fields) of each SimpleExampleServiceInstance, keyed by instance id
+embedded_image_lists = LRUCache(max_entries=4096, max_bytes=16 * 1024 * 1024, sizeof=image_list_size)
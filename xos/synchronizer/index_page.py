@@ -0,0 +1,248 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" index_page.py
+
+    Build the index.html page served by a SimpleExampleServiceInstance, and the config map payload that holds it.
+    Shared by the model policies and the bulk reconciler.
+
+    The page is rendered in fragments: the header and colors, the messages, and the image gallery each have a
+    template of their own, and index.html.j2 lays out the rendered fragments. The html of each fragment is cached
+    against its template and its fields, so an update that only changes a message re-renders only
+    the messages. The images of each instance are also cached against the ids of its embedded images, which come
+    with the instance, so the gallery is built without querying the images unless they were added or removed.
+    A per-service override of index.html.j2 still receives every field, and need not use the fragments.
+
+    The memory used for an instance with many images is bounded: images are fetched from the core image_fetch_size
+    at a time, and at most max_images of them are shown. With images_per_page set, the gallery is split over
+    several pages, index.html, index-2.html, ..., that are all held in the config map. These are set in the
+    `index_page` section of config.yaml, which read_config() reads when the synchronizer starts.
+"""
+
+import hashlib
+import json
+import time
+
+from xosconfig import Config
+
+from fingerprints import compute_fingerprint
+from fragment_cache import embedded_image_lists, index_fragments
+from metrics import registry
+from template_engine import get_template_engine
+
+TEMPLATE_NAME = "index.html.j2"
+
+# (layout field, template, fields the fragment depends on)
+FRAGMENTS = [("header_html", "index_header.html.j2", ["foreground_color", "background_color"]),
+             ("messages_html", "index_messages.html.j2", ["service_message", "tenant_message"]),
+             ("gallery_html", "index_gallery.html.j2", ["images", "more_images", "page", "pages"])]
+
+# Number of images fetched from the core per query. These are read from config.yaml by read_config().
+image_fetch_size = 100
+
+# Images past this many are left out of the page, which says how many were left out
+max_images = 1000
+
+# If set, split the gallery into pages of this many images
+images_per_page = None
+
+RENDER_SECONDS_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5]
+
+
+def read_config():
+    """ Read the image settings from config.yaml. """
+    global image_fetch_size, max_images, images_per_page
+    index_page_config = Config.get("index_page") or {}
+    image_fetch_size = index_page_config.get("image_fetch_size", image_fetch_size)
+    max_images = index_page_config.get("max_images", max_images)
+    images_per_page = index_page_config.get("images_per_page", images_per_page)
+
+
+def make_index_fields(service, tenant_message, foreground_color=None, background_color=None, images=None):
+    """ Return the template fields for a page. The colors are html codes, images is a list of EmbeddedImageNew. """
+    fields = {}
+    fields['tenant_message'] = tenant_message
+    fields['service_message'] = service.service_message
+
+    if foreground_color:
+        fields["foreground_color"] = foreground_color
+
+    if background_color:
+        fields["background_color"] = background_color
+
+    images = images or []
+    set_image_fields(fields, make_image_fields(images[:max_images]), len(images))
+
+    return fields
+
+
+def make_image_fields(images):
+    return [{"name": image.name, "url": image.url} for image in images]
+
+
+def set_image_fields(fields, images, total):
+    """ Add `images`, which are the first of `total` images of the instance, to the template fields. """
+    fields["images"] = images
+    if total > len(images):
+        fields["more_images"] = total - len(images)
+
+
+def iter_images(model_accessor, service_instance, image_ids):
+    """ Yield the images of service_instance with ids in the sorted list `image_ids`, fetching image_fetch_size
+        of them with each query.
+    """
+    for start in range(0, len(image_ids), image_fetch_size):
+        chunk = image_ids[start:start + image_fetch_size]
+        # The images of the instance in this range of ids are the ones in the chunk, unless some were added since
+        # the instance was read
+        wanted = set(chunk)
+        images = model_accessor.EmbeddedImageNew.objects.filter(serviceinstance_id=service_instance.id,
+                                                                id__gte=chunk[0], id__lte=chunk[-1])
+        for image in sorted(images, key=lambda image: image.id):
+            if image.id in wanted:
+                yield image
+
+
+def get_image_fields(service_instance, model_accessor=None):
+    """ Return (image fields, total number of images) for service_instance, reusing the cached image fields if
+        its set of images is unchanged.
+    """
+    # The ORM carries the ids of related objects with the instance; the mock model accessor does not
+    image_ids = getattr(service_instance, "embedded_images_ids", None)
+    if image_ids is None:
+        images = service_instance.embedded_images.all()
+        return (make_image_fields(images[:max_images]), len(images))
+
+    image_ids = sorted(image_ids)
+    cached = embedded_image_lists.get(service_instance.id)
+    if cached and (cached[0] == image_ids):
+        return (cached[1], len(image_ids))
+
+    if model_accessor is not None:
+        # One query per image_fetch_size images, instead of one per image, and only for the images that are shown
+        images = make_image_fields(iter_images(model_accessor, service_instance, image_ids[:max_images]))
+    else:
+        images = make_image_fields(service_instance.embedded_images.all()[:max_images])
+    embedded_image_lists.set(service_instance.id, (image_ids, images))
+    return (images, len(image_ids))
+
+
+def remember_images(service_instance_id, images):
+    """ Cache the images of an instance that were fetched some other way, such as by the bulk reconciler. """
+    embedded_image_lists.set(service_instance_id, (sorted([image.id for image in images]),
+                                                   make_image_fields(images[:max_images])))
+
+
+def forget_images(service_instance_id):
+    """ Drop the cached images of an instance, after one of them was changed in place. """
+    embedded_image_lists.discard(service_instance_id)
+
+
+def get_index_fields(service_instance, model_accessor=None):
+    """ Return the template fields for service_instance, following its relations to fetch colors and images. """
+    service = service_instance.owner.leaf_model
+
+    foreground_color = None
+    if service_instance.foreground_color:
+        foreground_color = service_instance.foreground_color.html_code
+
+    background_color = None
+    if service_instance.background_color:
+        background_color = service_instance.background_color.html_code
+
+    fields = make_index_fields(service, service_instance.tenant_message,
+                               foreground_color=foreground_color,
+                               background_color=background_color)
+    (images, total) = get_image_fields(service_instance, model_accessor)
+    set_image_fields(fields, images, total)
+    return fields
+
+
+def get_template_versions(service):
+    """ Return the versions of the layout and fragment templates used for `service`. """
+    engine = get_template_engine()
+    return [engine.get_version(name, service_name=service.name)
+            for name in [TEMPLATE_NAME] + [template for (_, template, _) in FRAGMENTS]]
+
+
+def get_index_fingerprint(service, compute_instance_id, fields):
+    return compute_fingerprint(compute_instance_id, get_template_versions(service), fields)
+
+
+def digest_fields(fields):
+    """ Return a digest of the json-like template `fields`. """
+    return hashlib.sha1(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def render_fragment(service, template, fields):
+    """ Return the html of one fragment, from the cache if it was rendered before with the same fields. """
+    # The compiled template is replaced when its file changes, so it stands in for the template version. The
+    # fields are digested rather than used in the key as is: a gallery's fields hold the names and urls of up to
+    # max_images images, which the key would otherwise keep alive next to the html.
+    compiled = get_template_engine().get_template(template, service_name=service.name)
+    key = (compiled, digest_fields(fields))
+    html = index_fragments.get(key)
+    if html is None:
+        html = compiled.render(fields)
+        index_fragments.set(key, html)
+    return html
+
+
+def render_index(service, fields):
+    start = time.time()
+    layout_fields = dict(fields)
+    for (name, template, inputs) in FRAGMENTS:
+        fragment_fields = dict([(k, fields[k]) for k in inputs if k in fields])
+        layout_fields[name] = render_fragment(service, template, fragment_fields)
+    page = get_template_engine().render(TEMPLATE_NAME, layout_fields, service_name=service.name)
+    registry.observe("template_render_seconds", time.time() - start, RENDER_SECONDS_BUCKETS, template=TEMPLATE_NAME)
+    return page
+
+
+def page_file_name(number):
+    return "index.html" if number == 1 else "index-%d.html" % number
+
+
+def render_pages(service, fields):
+    """ Return the pages of an instance, keyed by file name. There is more than one page only if images_per_page
+        is set and the instance has more images than that.
+    """
+    images = fields["images"]
+    if (not images_per_page) or (len(images) <= images_per_page):
+        return {"index.html": render_index(service, fields)}
+
+    page_count = (len(images) + images_per_page - 1) // images_per_page
+    links = [{"number": number, "url": page_file_name(number)} for number in range(1, page_count + 1)]
+    pages = {}
+    for number in range(1, page_count + 1):
+        page_fields = dict(fields)
+        page_fields["images"] = images[(number - 1) * images_per_page:number * images_per_page]
+        page_fields["page"] = number
+        page_fields["pages"] = links
+        if number < page_count:
+            # only the last page says how many images were left out
+            page_fields.pop("more_images", None)
+        pages[page_file_name(number)] = render_index(service, page_fields)
+    return pages
+
+
+def make_config_data(service, fields):
+    """ Return the data of the KubernetesConfigMap that holds the pages. """
+    return json.dumps(render_pages(service, fields), sort_keys=True)
+
+
+def count_config_write(data):
+    """ Record that a config map holding `data` was written. """
+    registry.inc("configmap_writes_total")
+    registry.inc("configmap_bytes_written_total", len(data))
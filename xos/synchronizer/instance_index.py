@@ -0,0 +1,141 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" instance_index.py
+
+    In-process index of SimpleExampleServiceInstances by name, so that events which name an instance can be
+    handled without asking the core to filter by name.
+
+    The index is filled in bulk with a single List call the first time it is used, and is kept current by the
+    model policy, which sees every create, update and delete of a SimpleExampleServiceInstance. Names are not
+    unique, so each name maps to a list of objects.
+
+    The index can also be restored from the ids and names in a snapshot (see snapshot.py). The objects are then
+    fetched by id the first time their name is looked up, and are only used if they still have that name.
+"""
+
+import threading
+
+
+class NameIndex(object):
+    def __init__(self):
+        self.by_name = {}
+        self.name_by_id = {}
+        self.restored = {}
+        self.restored_names = {}
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def load(self, objs):
+        """ Replace the contents of the index with `objs`. """
+        with self.lock:
+            self.by_name = {}
+            self.name_by_id = {}
+            self.restored = {}
+            self.restored_names = {}
+            for obj in objs:
+                self._add(obj)
+            self.loaded = True
+
+    def _add(self, obj):
+        old_name = self.name_by_id.get(obj.id)
+        if old_name is not None:
+            self._remove(obj.id)
+        objs = self.by_name.setdefault(obj.name, [])
+        objs.append(obj)
+        self.name_by_id[obj.id] = obj.name
+
+    def _remove(self, id):
+        restored_name = self.restored_names.pop(id, None)
+        if restored_name is not None:
+            ids = [i for i in self.restored.get(restored_name, []) if i != id]
+            if ids:
+                self.restored[restored_name] = ids
+            else:
+                self.restored.pop(restored_name, None)
+
+        name = self.name_by_id.pop(id, None)
+        if name is None:
+            return
+        objs = [o for o in self.by_name.get(name, []) if o.id != id]
+        if objs:
+            self.by_name[name] = objs
+        else:
+            self.by_name.pop(name, None)
+
+    def update(self, obj):
+        """ Add `obj` to the index, replacing any previous entry with the same id. """
+        with self.lock:
+            self._add(obj)
+
+    def remove(self, id):
+        with self.lock:
+            self._remove(id)
+
+    def get(self, name):
+        """ Return the list of objects named `name`, or None if the name is not in the index. """
+        with self.lock:
+            objs = self.by_name.get(name)
+            if objs:
+                self.hits += 1
+                return list(objs)
+            self.misses += 1
+            return None
+
+    def restore(self, names):
+        """ Remember the ids and names in `names`, a dictionary of id to name, to be fetched on first lookup. """
+        with self.lock:
+            for (id, name) in names.items():
+                if id not in self.name_by_id:
+                    self.restored.setdefault(name, []).append(id)
+                    self.restored_names[id] = name
+
+    def pop_restored(self, name):
+        """ Return the restored ids for `name` that have not been fetched yet, and forget them. """
+        with self.lock:
+            ids = self.restored.pop(name, [])
+            for id in ids:
+                self.restored_names.pop(id, None)
+            return ids
+
+    def snapshot(self):
+        """ Return a dictionary of id to name of every instance in the index, including restored ones. """
+        with self.lock:
+            names = dict(self.restored_names)
+            names.update(self.name_by_id)
+            return names
+
+    def clear(self):
+        with self.lock:
+            self.by_name = {}
+            self.name_by_id = {}
+            self.restored = {}
+            self.restored_names = {}
+            self.loaded = False
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "size": len(self.name_by_id),
+                    "hit_rate": float(self.hits) / total if total else 0.0}
+
+
+# SimpleExampleServiceInstances by name
+service_instance_index = NameIndex()
@@ -0,0 +1,75 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" lookup_cache.py
+
+    Per-process cache for the results of lookups against the core that rarely change, such as the compute service,
+    slice and image used by a service. Entries expire after a TTL and may be invalidated explicitly.
+"""
+
+import threading
+import time
+
+
+class TTLCache(object):
+    def __init__(self, ttl, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        """ Return the value cached for `key`, calling `loader()` to compute it if it is missing or expired. """
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and (entry[0] > now):
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Call the loader without holding the lock; two threads missing at the same time will both load, and the
+        # last one wins. That is cheaper than serializing every lookup behind a slow round trip.
+        value = loader()
+        with self.lock:
+            self.entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        """ Drop the entry for `key`, or all entries if `key` is None. """
+        with self.lock:
+            if key is None:
+                self.entries = {}
+            else:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "size": len(self.entries),
+                    "hit_rate": float(self.hits) / total if total else 0.0}
+
+
+# Compute service, compute service instance class, slice and image, keyed by the id of the owning service
+service_lookups = TTLCache(ttl=300)
@@ -0,0 +1,114 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" metrics.py
+
+    Process-wide counters and histograms for the simpleexampleservice synchronizer. Metrics are identified by a name
+    and an optional set of labels, for example registry.inc("events_noop_total", topic="SimpleExampleEvent").
+
+    Values that are already kept elsewhere, such as cache statistics, are read when the metrics are exported by
+    collectors; see add_collector().
+"""
+
+import bisect
+import threading
+
+
+class Histogram(object):
+    """ Counts observations into buckets with the given upper bounds, plus one bucket for everything larger. """
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ Return a list of (upper bound, number of observations <= upper bound), ending with ("+Inf", count). """
+        result = []
+        total = 0
+        for (bound, count) in zip(self.buckets + ["+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def get(self, name, **labels):
+        with self.lock:
+            return self.counters.get(self.key(name, labels), 0)
+
+    def observe(self, name, value, buckets, **labels):
+        """ Add `value` to a histogram. `buckets` is only used the first time the histogram is seen. """
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def get_histogram(self, name, **labels):
+        with self.lock:
+            return self.histograms.get(self.key(name, labels))
+
+    def snapshot(self):
+        """ Return a list of (name, labels, value) for every counter. """
+        with self.lock:
+            return [(name, dict(labels), value) for ((name, labels), value) in sorted(self.counters.items())]
+
+    def histogram_snapshot(self):
+        """ Return a list of (name, labels, cumulative buckets, sum, count) for every histogram. """
+        with self.lock:
+            return [(name, dict(labels), histogram.cumulative(), histogram.sum, histogram.count)
+                    for ((name, labels), histogram) in sorted(self.histograms.items())]
+
+    def add_collector(self, name, func):
+        """ Register func, which returns a list of (name, labels, value), to be called whenever the metrics are
+            exported. A collector registered under the same name is replaced.
+        """
+        with self.lock:
+            self.collectors[name] = func
+
+    def get_collectors(self):
+        with self.lock:
+            return sorted(self.collectors.items())
+
+    def clear(self):
+        """ Reset the counters and histograms. Collectors stay registered. """
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,173 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" metrics_server.py
+
+    Serve the metrics registry over HTTP in the Prometheus text format, at /metrics. The server is started by the
+    synchronizer when the `metrics` section of config.yaml has `enabled: True`:
+
+        metrics:
+          enabled: True
+          port: 9100
+
+    Metric names are prefixed with "simpleexampleservice_". Collected values whose name ends in "_total" are
+    exported as counters, and all others as gauges.
+"""
+
+import re
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+from fingerprints import index_fingerprints, service_fingerprints
+from fragment_cache import embedded_image_lists, index_fragments
+from instance_index import service_instance_index
+from lookup_cache import service_lookups
+from metrics import registry
+from secret_data import secret_fingerprints
+
+log = create_logger(Config().get('logging'))
+
+PREFIX = "simpleexampleservice_"
+DEFAULT_PORT = 9100
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+CACHES = [("service_lookups", service_lookups),
+          ("service_instance_index", service_instance_index),
+          ("index_fingerprints", index_fingerprints),
+          ("service_fingerprints", service_fingerprints),
+          ("secret_fingerprints", secret_fingerprints),
+          ("index_fragments", index_fragments),
+          ("embedded_image_lists", embedded_image_lists)]
+
+
+def collect_caches():
+    samples = []
+    for (cache_name, cache) in CACHES:
+        stats = cache.stats()
+        samples.append(("cache_hits_total", {"cache": cache_name}, stats["hits"]))
+        samples.append(("cache_misses_total", {"cache": cache_name}, stats["misses"]))
+        samples.append(("cache_size", {"cache": cache_name}, stats["size"]))
+        if "bytes" in stats:
+            samples.append(("cache_bytes", {"cache": cache_name}, stats["bytes"]))
+        samples.append(("cache_hit_rate", {"cache": cache_name}, stats["hit_rate"]))
+    return samples
+
+
+registry.add_collector("caches", collect_caches)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+               for (k, v) in sorted(labels.items())]
+    return "{" + ",".join(['%s="%s"' % (k, v) for (k, v) in escaped]) + "}"
+
+
+def format_value(value):
+    if value == "+Inf":
+        return value
+    return repr(float(value))
+
+
+def metric_name(name):
+    return PREFIX + re.sub("[^a-zA-Z0-9_]", "_", name)
+
+
+def render_metrics(registry):
+    """ Return the contents of `registry` in the Prometheus text format. """
+    lines = []
+    typed = set()
+
+    def add(name, kind, labels, value):
+        name = metric_name(name)
+        if name not in typed:
+            lines.append("# TYPE %s %s" % (name, kind))
+            typed.add(name)
+        lines.append("%s%s %s" % (name, format_labels(labels), format_value(value)))
+
+    for (name, labels, value) in registry.snapshot():
+        add(name, "counter", labels, value)
+
+    for (collector_name, func) in registry.get_collectors():
+        try:
+            samples = func()
+        except Exception:
+            log.exception("Metrics collector failed", collector=collector_name)
+            continue
+        for (name, labels, value) in sorted(samples, key=lambda sample: (sample[0], sorted(sample[1].items()))):
+            add(name, "counter" if name.endswith("_total") else "gauge", labels, value)
+
+    for (name, labels, buckets, total, count) in registry.histogram_snapshot():
+        full_name = metric_name(name)
+        if full_name not in typed:
+            lines.append("# TYPE %s histogram" % full_name)
+            typed.add(full_name)
+        for (bound, bucket_count) in buckets:
+            bucket_labels = dict(labels)
+            bucket_labels["le"] = bound if bound == "+Inf" else format_value(bound)
+            lines.append("%s_bucket%s %s" % (full_name, format_labels(bucket_labels), format_value(bucket_count)))
+        lines.append("%s_sum%s %s" % (full_name, format_labels(labels), format_value(total)))
+        lines.append("%s_count%s %s" % (full_name, format_labels(labels), format_value(count)))
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+
+        body = render_metrics(registry).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; don't write a line to stderr for each one
+        pass
+
+
+class MetricsHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_metrics_server(port=DEFAULT_PORT, address=""):
+    """ Serve the metrics on a daemon thread, and return the server. """
+    server = MetricsHTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server")
+    thread.daemon = True
+    thread.start()
+    log.info("Started metrics server", address=address, port=server.server_address[1])
+    return server
+
+
+def start_from_config():
+    """ Start the metrics server if config.yaml enables it. Returns the server, or None. """
+    metrics_config = Config.get("metrics") or {}
+    if not metrics_config.get("enabled"):
+        return None
+    return start_metrics_server(metrics_config.get("port", DEFAULT_PORT), metrics_config.get("address", ""))
@@ -0,0 +1,46 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+from django.db import migrations
+
+# xproto can only put an index on a single field of the service's own models, so these indexes are created with
+# SQL. They are not part of the model state, and later generated migrations leave them alone. Only the service's
+# own tables are indexed here; the core's tables belong to the core's migrations.
+#
+# Images are fetched by instance, in ranges of ids (see index_page.py); the foreign key index alone leaves the
+# database to sort the images of each instance.
+#
+# The indexes are built concurrently, so that the tables can still be written while a large deployment is
+# migrated. PostgreSQL can't do that inside a transaction, hence atomic = False.
+INDEXES = [
+    ("simpleexampleservice_embeddedimagenew_serviceinstance_id_id", "simpleexampleservice_embeddedimagenew",
+     "serviceinstance_id, id"),
+]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('simpleexampleservice', '0004_auto_20190409_1927'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s (%s)" % (name, table, columns),
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS %s" % name,
+        ) for (name, table, columns) in INDEXES
+    ]
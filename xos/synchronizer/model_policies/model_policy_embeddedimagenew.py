@@ -0,0 +1,34 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from xossynchronizer.model_policies.policy import Policy
+
+import index_page
+
+
+class EmbeddedImageNewPolicy(Policy):
+    model_name = "EmbeddedImageNew"
+
+    # The images of an instance are cached against their ids, which do not change when an image is edited. Drop
+    # the cached images of the instance whenever one of its images changes.
+
+    def handle_create(self, image):
+        self.handle_update(image)
+
+    def handle_update(self, image):
+        if image.serviceinstance_id:
+            index_page.forget_images(image.serviceinstance_id)
+
+    def handle_delete(self, image):
+        self.handle_update(image)
@@ -0,0 +1,78 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from xossynchronizer.model_policies.policy import Policy
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+from accessor_trace import traced
+from fingerprints import compute_fingerprint, service_fingerprints
+from lookup_cache import service_lookups
+from reconciler import Reconciler, reconciled_services
+from secret_data import secret_digest
+from teardown import Teardown
+
+log = create_logger(Config().get('logging'))
+
+teardown_config = Config.get("teardown") or {}
+
+
+class SimpleExampleServicePolicy(Policy):
+    model_name = "SimpleExampleService"
+
+    # When the service is deleted, the objects of teardown_batch_size of its instances are deleted on each pass of
+    # the policy engine, so that the other policies are not held up. Set in the `teardown` section of config.yaml.
+    teardown_batch_size = teardown_config.get("batch_size", 10)
+
+    @traced("SimpleExampleServicePolicy.handle_create")
+    def handle_create(self, service):
+        self.handle_update(service)
+
+    @traced("SimpleExampleServicePolicy.handle_update")
+    def handle_update(self, service):
+        fingerprint = compute_fingerprint(service.service_message, secret_digest(service.service_secret or ""))
+        if service_fingerprints.matches(service.id, fingerprint):
+            log.debug("service settings unchanged", service=service.id)
+            return
+
+        # Anything cached about the service may be out of date now
+        service_lookups.invalidate(service.id)
+
+        # The service_message is part of every instance's page and the service_secret is part of every instance's
+        # secret. The writes of the instances that changed, and their resyncs, are rate-limited by the resync
+        # scheduler.
+        counts = Reconciler(self.model_accessor).reconcile(service, secrets=True)
+        reconciled_services.add(service.id)
+
+        if counts["failed"]:
+            # Leave the fingerprint alone so that the policy engine's retry rewrites the remaining instances
+            raise Exception("failed to update %d instances of service %s" % (counts["failed"], service.id))
+
+        service_fingerprints.set(service.id, fingerprint)
+
+    @traced("SimpleExampleServicePolicy.handle_delete")
+    def handle_delete(self, service):
+        service_fingerprints.discard(service.id)
+        service_lookups.invalidate(service.id)
+
+        # Tear down all the instances at once, rather than leaving each to its own handle_delete, which then finds
+        # nothing left to delete
+        instances = list(self.model_accessor.SimpleExampleServiceInstance.objects.filter(owner_id=service.id))
+        if instances:
+            teardown = Teardown(self.model_accessor, max_instances=self.teardown_batch_size)
+            teardown.teardown(instances)
+            if teardown.remaining:
+                # Not marked as policed, so the policy engine runs this again on its next pass
+                raise Exception("%d instances of service %s are left to tear down" % (teardown.remaining, service.id))
@@ -13,114 +13,229 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import base64
-import jinja2
-import json
-import os
 from xossynchronizer.model_policies.policy import Policy
 
 from xosconfig import Config
 from multistructlog import create_logger
 
+import index_page
+from accessor_trace import traced
+from fingerprints import index_fingerprints
+from instance_index import service_instance_index
+from lookup_cache import service_lookups
+from object_graph import ObjectGraphBuilder
+from reconciler import Reconciler, reconciled_services
+from resync_scheduler import PRIORITY_UPDATE, admit_new_tenant, resync
+from secret_data import make_secret_data, secret_digest, secret_fingerprints, write_secret
+from shared_config import CONFIG_MAP_NAME, SharedConfigMaps, is_shared_config_map
+from teardown import Teardown
+
 log = create_logger(Config().get('logging'))
 
+policy_config = Config.get("model_policies") or {}
+
 
 class SimpleExampleServiceInstancePolicy(Policy):
     model_name = "SimpleExampleServiceInstance"
 
+    # After a restart the fingerprint cache is empty, and every instance would be compared one at a time. Instead,
+    # the first update of an instance reconciles all instances of its service with a few bulk queries. Set in the
+    # `model_policies` section of config.yaml.
+    reconcile_on_first_update = policy_config.get("reconcile_on_first_update", True)
+
+    # With shared_config_maps, instances whose pages are identical mount one config map named after a hash of the
+    # page, instead of each having a config map of their own. See shared_config.py. Turning this off does not move
+    # instances off shared config maps, but they are still never modified in place. Set in the `model_policies`
+    # section of config.yaml.
+    shared_config_maps = policy_config.get("shared_config_maps", False)
+
+    @traced("SimpleExampleServiceInstancePolicy.handle_create")
     def handle_create(self, service_instance):
         self.handle_update(service_instance)
 
-    def render_index(self, service_instance):
-        service = service_instance.owner.leaf_model
-
-        fields = {}
-        fields['tenant_message'] = service_instance.tenant_message
-        fields['service_message'] = service.service_message
+    def get_index_fields(self, service_instance):
+        return index_page.get_index_fields(service_instance, self.model_accessor)
 
-        if service_instance.foreground_color:
-            fields["foreground_color"] = service_instance.foreground_color.html_code
+    def get_index_fingerprint(self, service_instance, fields):
+        service = service_instance.owner.leaf_model
+        compute_instance_id = service_instance.compute_instance.id if service_instance.compute_instance else None
+        return index_page.get_index_fingerprint(service, compute_instance_id, fields)
 
-        if service_instance.background_color:
-            fields["background_color"] = service_instance.background_color.html_code
+    def render_index(self, service_instance, fields=None):
+        service = service_instance.owner.leaf_model
 
-        images = []
-        for image in service_instance.embedded_images.all():
-            images.append({"name": image.name,
-                           "url": image.url})
-        fields["images"] = images
+        if fields is None:
+            fields = self.get_index_fields(service_instance)
 
-        template_fn = os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))), "index.html.j2")
-        template = jinja2.Template(open(template_fn).read())
+        return index_page.render_index(service, fields)
 
-        return template.render(fields)
+    def reconcile_service(self, exampleservice, force=False):
+        """ Bring the config maps and secrets of the instances of `exampleservice` that this replica owns up to date
+            using bulk queries.
+        """
+        reconciled_services.add(exampleservice.id)
+        reconciler = Reconciler(self.model_accessor, shared_config_maps=self.shared_config_maps, owned_only=True)
+        return reconciler.reconcile(exampleservice, force=force, secrets=True)
 
-    def handle_update(self, service_instance):
-        if not service_instance.compute_instance:
+    def get_compute_resources(self, exampleservice):
+        """ Return the compute service, its service instance class, and the slice and image to use for compute
+            instances of `exampleservice`. These rarely change, so they are cached per service.
+        """
+        def load():
             # TODO: Break dependency
             compute_service = self.model_accessor.KubernetesService.objects.first()
             compute_service_instance_class = self.model_accessor.Service.objects.get(
                 id=compute_service.id
             ).get_service_instance_class()
 
-            exampleservice = service_instance.owner.leaf_model
-
             # TODO: What if there is the wrong number of slices?
             slice = exampleservice.slices.first()
 
             # TODO: What if there is no default image?
             image = slice.default_image
 
-            name = "simpleexampleserviceinstance-%s" % service_instance.id
-            compute_service_instance = compute_service_instance_class(
-                slice=slice, owner=compute_service, image=image, name=name, no_sync=True)
-            compute_service_instance.save()
-
-            # Create a configmap and attach it to the compute instance
-            data = {"index.html": self.render_index(service_instance)}
-            cfmap = self.model_accessor.KubernetesConfigMap(
-                name="simpleexampleserviceinstance-map-%s" %
-                service_instance.id, trust_domain=slice.trust_domain, data=json.dumps(data))
-            cfmap.save()
-            cfmap_mnt = self.model_accessor.KubernetesConfigVolumeMount(config=cfmap,
-                                                                        service_instance=compute_service_instance,
-                                                                        mount_path="/usr/local/apache2/htdocs")
-            cfmap_mnt.save()
-
-            # Create a secret and attach it to the compute instance
-            data = {"service_secret.txt": base64.b64encode(str(exampleservice.service_secret)),
-                    "tenant_secret.txt": base64.b64encode(str(service_instance.tenant_secret))}
-            secret = self.model_accessor.KubernetesSecret(
-                name="simpleexampleserviceinstance-secret-%s" %
-                service_instance.id, trust_domain=slice.trust_domain, data=json.dumps(data))
-            secret.save()
-            secret_mnt = self.model_accessor.KubernetesSecretVolumeMount(
-                secret=secret,
-                service_instance=compute_service_instance,
-                mount_path="/usr/local/apache2/secrets")
-            secret_mnt.save()
-
-            compute_service_instance.no_sync = False
-            compute_service_instance.save(update_fields=["no_sync"])
-
-            service_instance.compute_instance = compute_service_instance
-            service_instance.save(update_fields=["compute_instance"])
+            log.debug("loaded compute resources", service=exampleservice.id, **service_lookups.stats())
+            return (compute_service, compute_service_instance_class, slice, image)
+
+        return service_lookups.get(exampleservice.id, load)
+
+    @traced("SimpleExampleServiceInstancePolicy.handle_update")
+    def handle_update(self, service_instance):
+        # Keep the name index used by the event step current
+        service_instance_index.update(service_instance)
+
+        if not service_instance.compute_instance:
+            exampleservice = service_instance.owner.leaf_model
+
+            (compute_service, compute_service_instance_class, slice, image) = \
+                self.get_compute_resources(exampleservice)
+
+            # Render everything before creating any objects, so that a template error leaves nothing behind
+            fields = self.get_index_fields(service_instance)
+            cfmap_data = index_page.make_config_data(exampleservice, fields)
+            secret_data = make_secret_data(exampleservice, service_instance)
+
+            shared = SharedConfigMaps(self.model_accessor) if self.shared_config_maps else None
+            cfmap = None
+
+            # If any save fails, the objects created so far are deleted again
+            try:
+                with ObjectGraphBuilder() as graph:
+                    name = "simpleexampleserviceinstance-%s" % service_instance.id
+                    compute_service_instance = compute_service_instance_class(
+                        slice=slice, owner=compute_service, image=image, name=name, no_sync=True)
+                    graph.create(compute_service_instance)
+
+                    # Create a configmap, or find the shared one, and attach it to the compute instance. The shared
+                    # one may belong to another replica, which leaves this instance with its own.
+                    if shared:
+                        cfmap = shared.acquire(slice.trust_domain.id, cfmap_data)
+                    if not cfmap:
+                        cfmap = self.model_accessor.KubernetesConfigMap(
+                            name=CONFIG_MAP_NAME % service_instance.id, trust_domain=slice.trust_domain,
+                            data=cfmap_data)
+                        graph.create(cfmap)
+                        index_page.count_config_write(cfmap_data)
+                    cfmap_mnt = self.model_accessor.KubernetesConfigVolumeMount(
+                        config=cfmap,
+                        service_instance=compute_service_instance,
+                        mount_path="/usr/local/apache2/htdocs")
+                    graph.create(cfmap_mnt)
+
+                    # Create a secret and attach it to the compute instance
+                    secret = self.model_accessor.KubernetesSecret(
+                        name="simpleexampleserviceinstance-secret-%s" %
+                        service_instance.id, trust_domain=slice.trust_domain, data=secret_data)
+                    graph.create(secret)
+                    secret_mnt = self.model_accessor.KubernetesSecretVolumeMount(
+                        secret=secret,
+                        service_instance=compute_service_instance,
+                        mount_path="/usr/local/apache2/secrets")
+                    graph.create(secret_mnt)
+
+                    compute_service_instance.no_sync = False
+                    graph.save(compute_service_instance, update_fields=["no_sync"])
+
+                    service_instance.compute_instance = compute_service_instance
+                    graph.save(service_instance, update_fields=["compute_instance"])
+            except Exception:
+                # The cached slice or image may have gone stale; look them up again when the policy is retried
+                service_lookups.invalidate(exampleservice.id)
+                # A shared config map is not rolled back with the rest, since other instances may be using it
+                if shared and cfmap and is_shared_config_map(cfmap):
+                    shared.release(cfmap)
+                raise
+
+            # Saving the compute instance with no_sync cleared has already triggered its first sync
+            admit_new_tenant()
+            index_fingerprints.set(service_instance.id, self.get_index_fingerprint(service_instance, fields),
+                                   getattr(service_instance, "updated", None))
+            secret_fingerprints.set(service_instance.id, secret_digest(secret_data))
         else:
+            exampleservice = service_instance.owner.leaf_model
+            if self.reconcile_on_first_update and (exampleservice.id not in reconciled_services):
+                try:
+                    self.reconcile_service(exampleservice)
+                except Exception:
+                    # Reconciling is only an optimization; fall back to updating this instance by itself
+                    log.exception("Failed to reconcile service", service=exampleservice.id)
+
+            # A changed tenant_secret is written to the secret; Kubernetes updates it in the pod without a resync
+            self.update_secret(exampleservice, service_instance)
+
+            # Most updates are re-saves that do not change anything on the page. If the inputs to the page are the
+            # same as the last time we wrote the config map, then skip rendering and fetching the config map.
+            fields = self.get_index_fields(service_instance)
+            fingerprint = self.get_index_fingerprint(service_instance, fields)
+            index_fingerprints.verify(service_instance.id, getattr(service_instance, "updated", None))
+            if index_fingerprints.matches(service_instance.id, fingerprint):
+                log.debug("index unchanged, skipping config map update", service_instance=service_instance)
+                return
+
             compute_instance = service_instance.compute_instance
             mnt = compute_instance.leaf_model.kubernetes_config_volume_mounts.first()
             config = mnt.config
-            new_data = json.dumps({"index.html": self.render_index(service_instance)})
-            if (new_data != config.data):
-                config.data = new_data
-                config.save(always_update_timestamp=True)
+            new_data = index_page.make_config_data(exampleservice, fields)
+            if self.shared_config_maps or is_shared_config_map(config):
+                changed = SharedConfigMaps(self.model_accessor).update_mount(mnt, config, new_data,
+                                                                             service_instance.id)
+            else:
+                changed = (new_data != config.data)
+                if changed:
+                    config.data = new_data
+                    config.save(always_update_timestamp=True)
+                    index_page.count_config_write(new_data)
+            if changed:
                 # Force the Kubernetes syncstep
-                compute_instance.save(always_update_timestamp=True)
+                resync(compute_instance, PRIORITY_UPDATE)
+
+            index_fingerprints.set(service_instance.id, fingerprint, getattr(service_instance, "updated", None))
+
+    def update_secret(self, exampleservice, service_instance):
+        """ Rewrite the secret of `service_instance` if its data changed. Returns True if it was written. """
+        new_data = make_secret_data(exampleservice, service_instance)
+        digest = secret_digest(new_data)
+        if secret_fingerprints.matches(service_instance.id, digest):
+            return False
+
+        compute_instance = service_instance.compute_instance
+        mnt = self.model_accessor.KubernetesSecretVolumeMount.objects.filter(service_instance_id=compute_instance.id)
+        if not mnt:
+            return False
+
+        changed = write_secret(mnt[0].secret, new_data)
+        secret_fingerprints.set(service_instance.id, digest)
+        return changed
 
+    @traced("SimpleExampleServiceInstancePolicy.handle_delete")
     def handle_delete(self, service_instance):
         log.info("handle_delete")
+        index_fingerprints.discard(service_instance.id)
+        secret_fingerprints.discard(service_instance.id)
+        service_instance_index.remove(service_instance.id)
         if service_instance.compute_instance:
             log.info("has a compute_instance")
-            service_instance.compute_instance.delete()
+            Teardown(self.model_accessor).teardown([service_instance])
             service_instance.compute_instance = None
             # TODO: I'm not sure we can save things that are being deleted...
             service_instance.save(update_fields=["compute_instance"])
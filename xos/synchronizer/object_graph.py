@@ -0,0 +1,75 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" object_graph.py
+
+    Save a group of related objects as a unit.
+
+    The model accessor has neither a bulk save nor transactions, and a foreign key takes the id of its target when
+    it is assigned, so objects must still be saved one at a time and in dependency order. What the builder adds is
+    all-or-nothing behavior: if any save fails, the objects that were created through the builder are deleted again
+    in reverse order, so that a failed create does not leave orphaned config maps, secrets or mounts behind. The
+    policy engine will then retry the create from scratch.
+
+    Usage:
+
+        with ObjectGraphBuilder() as graph:
+            graph.create(parent)
+            graph.create(Child(parent=parent))
+            graph.save(parent, update_fields=["no_sync"])
+"""
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+log = create_logger(Config().get('logging'))
+
+
+class ObjectGraphBuilder(object):
+    def __init__(self):
+        self.created = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            log.error("Failed to save object graph, rolling back", created=len(self.created), error=exc_value)
+            self.rollback()
+        else:
+            self.created = []
+        # never swallow the exception
+        return False
+
+    def create(self, obj):
+        """ Save the new object `obj` and remember it, so it can be deleted if a later save fails. """
+        obj.save()
+        self.created.append(obj)
+        return obj
+
+    def save(self, obj, **save_kwargs):
+        """ Save changes to `obj`. Objects saved this way are not deleted on rollback. """
+        obj.save(**save_kwargs)
+        return obj
+
+    def rollback(self):
+        """ Delete the objects that were created by this builder, newest first. Errors are logged and ignored so
+            that one failed delete does not prevent the rest of the cleanup.
+        """
+        while self.created:
+            obj = self.created.pop()
+            try:
+                obj.delete()
+            except Exception:
+                log.exception("Failed to delete object during rollback", obj=obj)
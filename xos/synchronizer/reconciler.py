@@ -0,0 +1,267 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" reconciler.py
+
+    Bring the config maps and secrets of every SimpleExampleServiceInstance of a service up to date in one pass.
+
+    The model policy handles one instance at a time and follows each instance's relations to find its colors,
+    images, compute instance and config map, which costs several round trips to the core per instance. The
+    reconciler instead fetches each of those models with a few queries, joins them locally, renders the pages and
+    secrets, and writes only the ones whose content changed. The queries ask only for the ranges of ids that the
+    service's instances refer to. Ids are allocated across all services, so other services' objects may fall in
+    those ranges; see filter_by_ids() for how many.
+
+    The reconciler does not pause between writes, since it runs in the policy engine's only thread. Instead it
+    hands the writes of each out-of-date instance's config map and secret to the resync scheduler (see
+    resync_scheduler.py), which makes them together with the resync of the compute instance, at the bulk priority
+    and behind the updates of single instances. An instance's fingerprints are set once its writes have been made.
+
+    With shared_config_maps, pages are written by pointing the instance's mount at the content-addressed config map
+    for the new page rather than by modifying the config map in place; see shared_config.py. Config maps that are
+    already shared are never modified in place, even with shared_config_maps turned off.
+
+    A secret that changed is saved, but unlike a page it does not make the compute instance resync: Kubernetes
+    updates mounted secrets in running pods by itself, so rotating secrets does not recreate pods. Only the secrets
+    whose digest shows that they may have changed are fetched. The digests do not survive a restart (see
+    secret_data.py), so the first reconcile after one compares every secret; the instances are therefore
+    reconciled secret_fetch_size at a time, with the secrets of each batch fetched by ranges of ids. A secret is
+    dropped once it has been compared, or if it changed, once the resync scheduler has written it.
+
+    Instances that do not have a compute instance yet are skipped; creating one is left to the model policy. With
+    owned_only, so are instances that another replica owns when the synchronizer is sharded (see sharding.py).
+"""
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+import index_page
+import sharding
+from fingerprints import index_fingerprints
+from fragment_cache import embedded_image_lists
+from resync_scheduler import PRIORITY_BULK, resync
+from secret_data import make_secret_data, secret_digest, secret_fingerprints, secret_matches, write_secret
+from shared_config import SharedConfigMaps, is_shared_config_map, shared_config_map_name
+
+log = create_logger(Config().get('logging'))
+
+# ids of the services that have been reconciled since this process started
+reconciled_services = set()
+
+
+def forget_partition():
+    # Instances that this replica has just taken over may have changed while another replica owned them
+    reconciled_services.clear()
+    embedded_image_lists.clear()
+
+
+sharding.on_rebalance(forget_partition)
+
+
+def group_by(objs, attr):
+    groups = {}
+    for obj in objs:
+        groups.setdefault(getattr(obj, attr), []).append(obj)
+    return groups
+
+
+# filter_by_ids starts a new range where two ids are further apart than this
+id_range_gap = 64
+
+# Number of instances whose secrets are fetched together
+secret_fetch_size = 100
+
+
+def id_ranges(ids):
+    """ Split the sorted list `ids` into (first, last) ranges, wherever two ids are more than id_range_gap apart. """
+    ranges = []
+    for id in ids:
+        if ranges and (id - ranges[-1][1] <= id_range_gap):
+            ranges[-1][1] = id
+        else:
+            ranges.append([id, id])
+    return [tuple(r) for r in ranges]
+
+
+def filter_by_ids(manager, attr, ids):
+    """ Return the objects of `manager` whose `attr` is one of `ids`. The ORM can only filter on a value or a
+        range, so this asks for the ranges that cover `ids`, with one query each, and drops the objects in them that
+        were not asked for. The ids of one service's objects are interleaved with other services', so a range is
+        only stretched over gaps of up to id_range_gap: at most that many unwanted ids are fetched per wanted id,
+        and the objects of a service created together are still fetched with one query.
+    """
+    ids = set([id for id in ids if id is not None])
+    objs = []
+    for (first, last) in id_ranges(sorted(ids)):
+        kwargs = {attr + "__gte": first, attr + "__lte": last}
+        objs.extend([obj for obj in manager.filter(**kwargs) if getattr(obj, attr) in ids])
+    return objs
+
+
+class Reconciler(object):
+    def __init__(self, model_accessor, shared_config_maps=False, owned_only=False):
+        self.model_accessor = model_accessor
+        self.owned_only = owned_only
+        self.shared_config_maps = shared_config_maps
+
+    def fetch(self, service, secrets=False):
+        """ Fetch everything needed to render the pages of `service`, using a query per model and range of ids.
+            Only the objects that the instances of `service` refer to are kept.
+        """
+        ma = self.model_accessor
+        self.instances = ma.SimpleExampleServiceInstance.objects.filter(owner_id=service.id)
+        instances = self.instances
+        if self.owned_only:
+            instances = sharding.owned_instances(instances)
+
+        color_ids = [si.foreground_color_id for si in instances] + [si.background_color_id for si in instances]
+        self.colors = dict([(c.id, c.html_code) for c in filter_by_ids(ma.ColorNew.objects, "id", color_ids)])
+        self.images = group_by(filter_by_ids(ma.EmbeddedImageNew.objects, "serviceinstance_id",
+                                             [si.id for si in instances]), "serviceinstance_id")
+        self.compute_instances = dict([(c.id, c) for c in filter_by_ids(ma.KubernetesServiceInstance.objects, "id",
+                                                                        [si.compute_instance_id for si in instances])])
+        self.config_mounts = group_by(filter_by_ids(ma.KubernetesConfigVolumeMount.objects, "service_instance_id",
+                                                    self.compute_instances.keys()), "service_instance_id")
+        config_ids = [mount.config_id for mounts in self.config_mounts.values() for mount in mounts]
+        self.config_maps = dict([(c.id, c) for c in filter_by_ids(ma.KubernetesConfigMap.objects, "id", config_ids)])
+        self.shared = SharedConfigMaps(ma, config_maps=self.config_maps.values())
+        if secrets:
+            self.secret_mounts = group_by(filter_by_ids(ma.KubernetesSecretVolumeMount.objects, "service_instance_id",
+                                                        self.compute_instances.keys()), "service_instance_id")
+
+    def get_fields(self, service, service_instance):
+        # embedded_images.all() returns images in id order; keep the same order so pages render identically
+        images = sorted(self.images.get(service_instance.id, []), key=lambda image: image.id)
+        index_page.remember_images(service_instance.id, images)
+        return index_page.make_index_fields(service, service_instance.tenant_message,
+                                            foreground_color=self.colors.get(service_instance.foreground_color_id),
+                                            background_color=self.colors.get(service_instance.background_color_id),
+                                            images=images)
+
+    def reconcile_page(self, service, service_instance, compute_instance, force):
+        """ Compare the config map of one instance. Returns a function that writes it, or None if it is up to date.
+        """
+        mounts = self.config_mounts.get(compute_instance.id)
+        if not mounts:
+            return None
+
+        fields = self.get_fields(service, service_instance)
+        fingerprint = index_page.get_index_fingerprint(service, compute_instance.id, fields)
+        updated = getattr(service_instance, "updated", None)
+        index_fingerprints.verify(service_instance.id, updated)
+        if (not force) and index_fingerprints.matches(service_instance.id, fingerprint):
+            return None
+
+        config = self.config_maps[mounts[0].config_id]
+        new_data = index_page.make_config_data(service, fields)
+        shared = self.shared_config_maps or is_shared_config_map(config)
+        if shared:
+            changed = (config.name != shared_config_map_name(new_data))
+        else:
+            changed = (new_data != config.data)
+        if not changed:
+            index_fingerprints.set(service_instance.id, fingerprint, updated)
+            return None
+
+        def write():
+            if shared:
+                self.shared.update_mount(mounts[0], config, new_data, service_instance.id)
+            else:
+                config.data = new_data
+                config.save(always_update_timestamp=True)
+                index_page.count_config_write(new_data)
+            index_fingerprints.set(service_instance.id, fingerprint, updated)
+        return write
+
+    def fetch_secrets(self, service, batch, force):
+        """ Return the secrets of the (service instance, compute instance) pairs in `batch` that may have changed,
+            keyed by id.
+        """
+        ids = []
+        for (service_instance, compute_instance) in batch:
+            digest = secret_digest(make_secret_data(service, service_instance))
+            mounts = self.secret_mounts.get(compute_instance.id)
+            if mounts and (force or not secret_fingerprints.matches(service_instance.id, digest)):
+                ids.append(mounts[0].secret_id)
+        return dict([(s.id, s) for s in filter_by_ids(self.model_accessor.KubernetesSecret.objects, "id", ids)])
+
+    def reconcile_secret(self, service, service_instance, compute_instance, force, secrets):
+        """ Compare the secret of one instance, which is in `secrets` if fetch_secrets() found that it may have
+            changed. Returns a function that writes it, or None if it is up to date.
+        """
+        new_data = make_secret_data(service, service_instance)
+        digest = secret_digest(new_data)
+        if (not force) and secret_fingerprints.matches(service_instance.id, digest):
+            return None
+
+        mounts = self.secret_mounts.get(compute_instance.id)
+        secret = secrets.get(mounts[0].secret_id) if mounts else None
+        if not secret:
+            return None
+        if secret_matches(secret, new_data):
+            secret_fingerprints.set(service_instance.id, digest)
+            return None
+
+        def write():
+            write_secret(secret, new_data)
+            secret_fingerprints.set(service_instance.id, digest)
+        return write
+
+    def reconcile(self, service, force=False, secrets=False):
+        """ Rewrite the config maps, and if `secrets` is True also the secrets, of `service`'s instances that are out
+            of date. If `force` is False, instances whose fingerprint shows an unchanged page are not compared.
+
+            Returns a dictionary of counts.
+        """
+        self.fetch(service, secrets=secrets)
+
+        counts = {"instances": len(self.instances), "skipped": 0, "unchanged": 0, "updated": 0, "failed": 0,
+                  "not_owned": 0}
+        pairs = []
+        for service_instance in self.instances:
+            if self.owned_only and not sharding.owns_instance(service_instance.id):
+                counts["not_owned"] += 1
+                continue
+            compute_instance = self.compute_instances.get(service_instance.compute_instance_id)
+            if not compute_instance:
+                counts["skipped"] += 1
+                continue
+            pairs.append((service_instance, compute_instance))
+
+        for start in range(0, len(pairs), secret_fetch_size):
+            batch = pairs[start:start + secret_fetch_size]
+            fetched_secrets = self.fetch_secrets(service, batch, force) if secrets else {}
+            for (service_instance, compute_instance) in batch:
+                try:
+                    page_write = self.reconcile_page(service, service_instance, compute_instance, force)
+                    secret_write = None
+                    if secrets:
+                        secret_write = self.reconcile_secret(service, service_instance, compute_instance, force,
+                                                             fetched_secrets)
+
+                    writes = [(key, write) for (key, write) in [(("page", service_instance.id), page_write),
+                                                                (("secret", service_instance.id), secret_write)]
+                              if write]
+                    if writes:
+                        # A changed page forces the Kubernetes syncstep; a changed secret is picked up by itself
+                        resync(compute_instance, PRIORITY_BULK, writes=writes, touch=bool(page_write))
+                        counts["updated"] += 1
+                    else:
+                        counts["unchanged"] += 1
+                except Exception:
+                    log.exception("Failed to reconcile service instance", service_instance=service_instance)
+                    counts["failed"] += 1
+
+        log.info("Reconciled service", service=service.id, **counts)
+        return counts
@@ -0,0 +1,303 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" resync_scheduler.py
+
+    When the config map of an instance changes, its compute instance is saved so that the Kubernetes synchronizer
+    picks up the change. By default that save is made at once. With `rate` set in the `resync` section of
+    config.yaml, resyncs go through a scheduler instead. A resync may carry the writes of the instance's config map
+    and secret that it is for, which are then made by the scheduler just before the compute instance is saved, so
+    that reconciling a whole service does not write every config map and secret at once. The scheduler:
+
+      * debounces them: a compute instance is resynced `debounce` seconds after the first request, and further
+        requests for it in the meantime are folded into that one resync;
+      * limits them to `rate` per second, with bursts of up to `burst`, using a token bucket;
+      * makes them in priority order. New tenants, whose compute instances are synced as they are created, take
+        their token at once and ahead of the queue; queued updates of single instances go before those from
+        reconciling a whole service.
+
+    The number of queued resyncs is exported as the resync_queue_depth metric. At exit, queued resyncs are made
+    for up to drain_timeout seconds without regard to the rate.
+"""
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+import shutdown
+from metrics import registry
+
+log = create_logger(Config().get('logging'))
+
+PRIORITY_NEW = 0
+PRIORITY_UPDATE = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = {PRIORITY_NEW: "new", PRIORITY_UPDATE: "update", PRIORITY_BULK: "bulk"}
+
+# Resyncs per second. None makes every resync at once. These are read from config.yaml by start_from_config().
+rate = None
+burst = 10
+debounce = 2.0
+drain_timeout = 10
+max_attempts = 3
+
+
+class Resync(object):
+    def __init__(self, compute_instance, priority, writes=None, touch=True):
+        self.compute_instance = compute_instance
+        self.priority = priority
+        # Functions that write the objects the resync is for, keyed so that a later write of the same object
+        # replaces one that has not been made yet. With touch False, only the writes are made.
+        self.writes = collections.OrderedDict(writes or [])
+        self.touch = touch
+        self.ready = False
+        self.attempts = 0
+
+    def merge(self, writes, touch):
+        self.writes.update(writes or [])
+        self.touch = self.touch or touch
+
+
+class ResyncScheduler(object):
+    def __init__(self, rate, burst, debounce, clock=time.time):
+        self.rate = float(rate)
+        self.burst = burst
+        self.debounce = debounce
+        self.clock = clock
+
+        self.tokens = float(burst)
+        self.refilled = clock()
+
+        # Resync by compute instance id. An entry waits in `delayed` until its debounce window is over, and then
+        # in `ready` until there is a token for it. Heap items are left behind when an entry is made or its
+        # priority raised; they are skipped when they no longer match the entry.
+        self.pending = {}
+        self.delayed = []
+        self.ready = []
+        self.seq = itertools.count()
+
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="resync-scheduler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def request(self, compute_instance, priority=PRIORITY_UPDATE, writes=None, touch=True):
+        """ Queue a resync of compute_instance, or fold it into the one that is already queued. """
+        with self.cond:
+            entry = self.pending.get(compute_instance.id)
+            if entry:
+                registry.inc("resyncs_debounced_total")
+                entry.compute_instance = compute_instance
+                entry.merge(writes, touch)
+                if priority < entry.priority:
+                    entry.priority = priority
+                    if entry.ready:
+                        heapq.heappush(self.ready, (priority, next(self.seq), entry))
+                return
+
+            entry = self.pending[compute_instance.id] = Resync(compute_instance, priority, writes, touch)
+            heapq.heappush(self.delayed, (self.clock() + self.debounce, next(self.seq), entry))
+            self.cond.notify()
+
+    def admit(self):
+        """ Take a token for a resync that is made at once, such as the first sync of a new tenant. Queued resyncs
+            wait for the bucket to refill.
+        """
+        with self.cond:
+            self.refill(self.clock())
+            self.tokens = max(self.tokens - 1, -self.burst)
+
+    def dispatch(self):
+        """ Remove and return the queued resyncs that may be made now, taking a token for each. """
+        with self.cond:
+            now = self.clock()
+            self.refill(now)
+
+            while self.delayed and (self.delayed[0][0] <= now):
+                (_, _, entry) = heapq.heappop(self.delayed)
+                if self.pending.get(entry.compute_instance.id) is entry:
+                    entry.ready = True
+                    heapq.heappush(self.ready, (entry.priority, next(self.seq), entry))
+
+            due = []
+            while self.ready and (self.tokens >= 1):
+                (priority, _, entry) = heapq.heappop(self.ready)
+                if (self.pending.get(entry.compute_instance.id) is not entry) or (entry.priority != priority):
+                    continue
+                del self.pending[entry.compute_instance.id]
+                self.tokens -= 1
+                due.append(entry)
+            return due
+
+    def wait_time(self):
+        """ Return how long until dispatch() may return something, or None if nothing is queued. """
+        waits = []
+        if self.delayed:
+            waits.append(self.delayed[0][0] - self.clock())
+        if self.ready:
+            waits.append((1 - self.tokens) / self.rate)
+        if not waits:
+            return None
+        return max(0.0, min(waits))
+
+    def resync(self, entry):
+        try:
+            while entry.writes:
+                (key, write) = next(iter(entry.writes.items()))
+                write()
+                del entry.writes[key]
+            if entry.touch:
+                # Only bump the timestamp; the object was read some time ago and its other fields may be stale
+                entry.compute_instance.save(update_fields=["updated"], always_update_timestamp=True)
+                registry.inc("resyncs_total", priority=PRIORITY_NAMES[entry.priority])
+        except Exception:
+            log.exception("Failed to resync compute instance", compute_instance=entry.compute_instance.id)
+            registry.inc("resync_failures_total")
+            entry.attempts += 1
+            if entry.attempts < max_attempts:
+                self.requeue(entry)
+
+    def requeue(self, entry):
+        with self.cond:
+            queued = self.pending.get(entry.compute_instance.id)
+            if queued:
+                # Writes that were queued since are newer than the ones that failed
+                writes = entry.writes
+                writes.update(queued.writes)
+                queued.writes = writes
+                queued.touch = queued.touch or entry.touch
+                return
+            entry.ready = False
+            self.pending[entry.compute_instance.id] = entry
+            heapq.heappush(self.delayed, (self.clock() + self.debounce, next(self.seq), entry))
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            for entry in self.dispatch():
+                self.resync(entry)
+            with self.cond:
+                if self.stopped:
+                    return
+                self.cond.wait(self.wait_time())
+
+    def queue_depth(self):
+        with self.cond:
+            depths = dict([(name, 0) for name in PRIORITY_NAMES.values()])
+            for entry in self.pending.values():
+                depths[PRIORITY_NAMES[entry.priority]] += 1
+            return depths
+
+    def collect(self):
+        return [("resync_queue_depth", {"priority": name}, depth) for (name, depth) in self.queue_depth().items()]
+
+    def shutdown(self, timeout=None):
+        """ Stop the scheduler, and make the queued resyncs for up to `timeout` seconds. Returns True if they were
+            all made.
+        """
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        if self.thread:
+            self.thread.join(timeout)
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            entries = sorted(self.pending.values(), key=lambda entry: entry.priority)
+            self.pending = {}
+        for (i, entry) in enumerate(entries):
+            if (deadline is not None) and (time.time() > deadline):
+                log.warning("Resync scheduler did not drain before timeout", dropped=len(entries) - i)
+                return False
+            entry.attempts = max_attempts
+            self.resync(entry)
+        return True
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_resync_scheduler():
+    """ Return the process-wide ResyncScheduler, creating it on first use, or None if `rate` is not set. """
+    global _scheduler
+    if not rate:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            scheduler = ResyncScheduler(rate, burst, debounce)
+            scheduler.start()
+            shutdown.register(scheduler.shutdown, drain_timeout)
+            registry.add_collector("resync_scheduler", scheduler.collect)
+            _scheduler = scheduler
+    return _scheduler
+
+
+def reset_resync_scheduler():
+    """ Stop and discard the process-wide ResyncScheduler. Mostly useful for unit tests. """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.shutdown(timeout=0)
+            _scheduler = None
+
+
+def start_from_config():
+    """ Read the settings of the scheduler from config.yaml, and start it if they set a rate. Returns the
+        scheduler, or None.
+    """
+    global rate, burst, debounce, drain_timeout
+    resync_config = Config.get("resync") or {}
+    rate = resync_config.get("rate", rate)
+    burst = resync_config.get("burst", burst)
+    debounce = resync_config.get("debounce", debounce)
+    drain_timeout = resync_config.get("drain_timeout", drain_timeout)
+    return get_resync_scheduler()
+
+
+def resync(compute_instance, priority=PRIORITY_UPDATE, writes=None, touch=True):
+    """ Make the Kubernetes synchronizer resync compute_instance, at once or through the scheduler. `writes` are
+        (key, function) pairs that write the instance's config map or secret, and are called before the resync.
+        With touch False they are made without resyncing the compute instance.
+    """
+    scheduler = get_resync_scheduler()
+    if scheduler is None:
+        for (_, write) in (writes or []):
+            write()
+        if touch:
+            compute_instance.save(always_update_timestamp=True)
+            registry.inc("resyncs_total", priority=PRIORITY_NAMES[priority])
+    else:
+        scheduler.request(compute_instance, priority, writes, touch)
+
+
+def admit_new_tenant():
+    """ Account for the first sync of a new tenant, which is triggered when its compute instance is created. """
+    scheduler = get_resync_scheduler()
+    if scheduler is not None:
+        scheduler.admit()
+    registry.inc("resyncs_total", priority=PRIORITY_NAMES[PRIORITY_NEW])
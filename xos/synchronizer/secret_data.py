@@ -0,0 +1,66 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" secret_data.py
+
+    Build the data of the KubernetesSecret that is mounted into each SimpleExampleServiceInstance's container, and
+    keep track of which secrets are up to date.
+
+    The synchronizer remembers a digest of each secret's data rather than the data itself, so that an update which
+    does not change the secret costs no queries and leaves no plaintext behind. The digests are keyed with a
+    random key that is made when the process starts, so they cannot be checked against guessed secrets outside the
+    process, and are never written anywhere. After a restart no digest is known, so the first reconcile of each
+    service compares every secret, fetching them in batches (see reconciler.py).
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+
+from fingerprints import FingerprintCache
+from metrics import registry
+
+_digest_key = os.urandom(32)
+
+# Digests of the secret data of each SimpleExampleServiceInstance, keyed by instance id
+secret_fingerprints = FingerprintCache()
+
+
+def make_secret_data(service, service_instance):
+    return json.dumps({"service_secret.txt": base64.b64encode(str(service.service_secret)),
+                       "tenant_secret.txt": base64.b64encode(str(service_instance.tenant_secret))})
+
+
+def secret_digest(data):
+    """ Return a keyed digest of the secret data `data`. """
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return hmac.new(_digest_key, data, hashlib.sha256).hexdigest()
+
+
+def secret_matches(secret, data):
+    """ Return True if `secret` holds `data`. """
+    return hmac.compare_digest(secret_digest(secret.data or ""), secret_digest(data))
+
+
+def write_secret(secret, data):
+    """ Save `data` to `secret` if it holds something else. Returns True if it was written. """
+    if secret_matches(secret, data):
+        return False
+    secret.data = data
+    secret.save(always_update_timestamp=True)
+    registry.inc("secret_writes_total")
+    return True
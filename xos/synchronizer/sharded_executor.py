@@ -0,0 +1,95 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" sharded_executor.py
+
+    A pool of worker threads where each task is routed by a key. Tasks with the same key always go to the same
+    worker and therefore run in the order they were submitted, while tasks with different keys run concurrently.
+
+    Each worker has a bounded queue. When a worker's queue is full, submit() blocks, which pushes back on the
+    producer (for example the Kafka consumer thread) instead of buffering without limit.
+"""
+
+import threading
+import time
+import zlib
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+log = create_logger(Config().get('logging'))
+
+
+class ShardedExecutor(object):
+    def __init__(self, workers, queue_size=100, name="worker"):
+        self.queues = [queue.Queue(maxsize=queue_size) for i in range(workers)]
+        self.threads = []
+        self.stopped = False
+        for (i, q) in enumerate(self.queues):
+            thread = threading.Thread(target=self.run_worker, args=(q,), name="%s-%d" % (name, i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def shard(self, key):
+        return (zlib.crc32(key.encode("utf-8")) & 0xffffffff) % len(self.queues)
+
+    def submit(self, key, func, *args):
+        """ Run func(*args) on the worker that owns `key`, blocking while that worker's queue is full. """
+        if self.stopped:
+            raise Exception("executor has been shut down")
+        self.queues[self.shard(key)].put((func, args))
+
+    def run_worker(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is None:
+                    return
+                (func, args) = item
+                try:
+                    func(*args)
+                except Exception:
+                    log.exception("Exception in sharded task")
+            finally:
+                q.task_done()
+
+    def queue_depth(self):
+        return sum([q.qsize() for q in self.queues])
+
+    def shutdown(self, timeout=None):
+        """ Stop accepting tasks and wait up to `timeout` seconds for the queued ones to finish. Returns True if
+            every worker drained its queue.
+        """
+        self.stopped = True
+        deadline = None if timeout is None else time.time() + timeout
+        for q in self.queues:
+            try:
+                q.put(None, True, None if deadline is None else max(0, deadline - time.time()))
+            except queue.Full:
+                # The worker is still busy with a full queue; it is reported below as not drained
+                pass
+
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(0, deadline - time.time()))
+
+        drained = not any([thread.is_alive() for thread in self.threads])
+        if not drained:
+            log.warning("Sharded executor did not drain before timeout", queue_depth=self.queue_depth())
+        return drained
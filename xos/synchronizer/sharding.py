@@ -0,0 +1,402 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" sharding.py
+
+    Optional sharding of the synchronizer's work across several replicas. Each replica is a member of a group kept
+    by a coordinator, and the members are placed on a consistent-hash ring. A replica only runs the model policies
+    of the services and service instances whose key falls in its part of the ring, and only applies the events for
+    the instances that fall in it. When a replica joins or leaves, only the keys on its part of the ring move.
+
+    Model policies are filtered in the policy engine (see install()). An object that another replica owns is left
+    as it is, without being marked as policed, so its owner still finds it. Embedded images go with the instance
+    they belong to. Events are filtered by the event step, which resolves the instance name in an event to the
+    instance's id, so that an instance's events and its policies go to the same replica. That needs every replica
+    to see every event, so each replica gets its own Kafka consumer group, named after the synchronizer and the
+    member, and every replica reads the whole topic. Member names should be stable across restarts, like the pod
+    names of a StatefulSet, so that a restarted replica resumes where it stopped. A new group starts from the
+    newest event: events carry absolute values, and replaying old ones would undo later edits.
+
+    Each replica checks the members of the group every `refresh_interval` seconds, so replicas may briefly
+    disagree about who owns a key. For `handoff` seconds after its part of the ring changes, a replica keeps
+    handling the keys it owned before as well as the ones it owns now, so that updates are not dropped. That is
+    only safe for updates, which write nothing unless it changed. Policies that create or delete objects in the
+    core need exactly one owner, so they are only run by a replica that owns the key exclusively: it owns the key
+    in its current ring, and either owned it before the last change or has waited long enough, at least
+    refresh_interval seconds, for every other replica to have noticed the change. Until then the object is left
+    unpoliced, and its policies run on a later pass. Shared config maps are keyed by their name, and are only
+    created, mounted and deleted by their exclusive owner, which makes their reference counting safe.
+
+    Coordinators have three methods: join(member), leave(member) and members(), which returns the names of the
+    live members. MemoryCoordinator keeps the group in memory, for tests and for several shards in one process.
+    FileLockCoordinator keeps it in a directory, with a file per member that is locked for as long as the member is
+    alive, so members on one host, or sharing a volume that supports flock, see each other.
+"""
+
+import bisect
+import errno
+import fcntl
+import hashlib
+import os
+import socket
+import threading
+import time
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+import shutdown
+from metrics import registry
+
+log = create_logger(Config().get('logging'))
+
+DEFAULT_VNODES = 64
+DEFAULT_REFRESH_INTERVAL = 5
+
+
+def hash_key(key):
+    # Instance names may be unicode, which md5 only takes once encoded
+    if not isinstance(key, bytes):
+        key = (u"%s" % key).encode("utf-8")
+    return int(hashlib.md5(key).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """ A consistent-hash ring, with `vnodes` points per member so that the keys are spread evenly. """
+
+    def __init__(self, members, vnodes=DEFAULT_VNODES):
+        self.members = sorted(members)
+        points = sorted([(hash_key("%s#%d" % (member, i)), member) for member in self.members
+                         for i in range(vnodes)])
+        self.hashes = [h for (h, member) in points]
+        self.owners = [member for (h, member) in points]
+
+    def owner(self, key):
+        """ Return the member that owns `key`, or None if the ring is empty. """
+        if not self.owners:
+            return None
+        i = bisect.bisect(self.hashes, hash_key(key)) % len(self.hashes)
+        return self.owners[i]
+
+
+class MemoryCoordinator(object):
+    def __init__(self):
+        self.live = set()
+        self.lock = threading.Lock()
+
+    def join(self, member):
+        with self.lock:
+            self.live.add(member)
+
+    def leave(self, member):
+        with self.lock:
+            self.live.discard(member)
+
+    def members(self):
+        with self.lock:
+            return sorted(self.live)
+
+
+class FileLockCoordinator(object):
+    SUFFIX = ".member"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, member):
+        return os.path.join(self.directory, member + self.SUFFIX)
+
+    def join(self, member):
+        f = open(self.path(member), "a")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            f.close()
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                raise Exception("another replica is already using the name %s" % member)
+            raise
+        self.files[member] = f
+
+    def leave(self, member):
+        f = self.files.pop(member, None)
+        if f:
+            # Removed while still locked, so that no other process can have taken the name yet
+            os.remove(self.path(member))
+            f.close()
+
+    def is_alive(self, member):
+        if member in self.files:
+            return True
+        try:
+            f = open(self.path(member), "r")
+        except IOError:
+            return False
+        try:
+            # A member holds its lock for as long as it lives. The files of dead members are left alone: removing
+            # one could race with a new member that has opened it but not yet locked it.
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+            return False
+        except IOError:
+            return True
+        finally:
+            f.close()
+
+    def members(self):
+        names = [name[:-len(self.SUFFIX)] for name in os.listdir(self.directory) if name.endswith(self.SUFFIX)]
+        return sorted([member for member in names if self.is_alive(member)])
+
+
+class Shard(object):
+    def __init__(self, coordinator, member, refresh_interval=DEFAULT_REFRESH_INTERVAL, handoff=None,
+                 vnodes=DEFAULT_VNODES, clock=time.time):
+        self.coordinator = coordinator
+        self.member = member
+        self.refresh_interval = refresh_interval
+        self.handoff = refresh_interval if handoff is None else handoff
+        self.vnodes = vnodes
+        self.clock = clock
+        self.ring = HashRing([], vnodes)
+        self.previous_ring = None
+        self.handoff_until = 0
+        self.exclusive_after = 0
+        self.next_refresh = 0
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.coordinator.join(self.member)
+        self.refresh(force=True)
+
+    def stop(self):
+        self.coordinator.leave(self.member)
+
+    def add_listener(self, listener):
+        """ Call `listener()` whenever the members of the group change. """
+        self.listeners.append(listener)
+
+    def refresh(self, force=False):
+        """ Check the members of the group, at most every refresh_interval seconds unless `force` is set, and
+            rebuild the ring if they changed.
+        """
+        with self.lock:
+            now = self.clock()
+            if not force and now < self.next_refresh:
+                return
+            self.next_refresh = now + self.refresh_interval
+
+            try:
+                members = self.coordinator.members()
+                if self.member not in members:
+                    # Lost, for example after the coordinator was restarted; owning nothing would leave our keys
+                    # to nobody
+                    self.coordinator.join(self.member)
+                    members = self.coordinator.members()
+            except Exception:
+                log.exception("Failed to check the members of the shard group; keeping the last ring")
+                registry.inc("shard_refresh_failures_total")
+                return
+
+            if members == self.ring.members:
+                return
+            log.info("Shard group changed", member=self.member, members=members, previous=self.ring.members)
+            self.previous_ring = self.ring
+            self.handoff_until = now + self.handoff
+            # By then every other replica has refreshed since the change, and has seen it
+            self.exclusive_after = now + max(self.handoff, self.refresh_interval)
+            self.ring = HashRing(members, self.vnodes)
+            if not self.previous_ring.members:
+                # Joining; there is nothing to hand off yet
+                return
+            listeners = list(self.listeners)
+        registry.inc("shard_rebalances_total")
+
+        for listener in listeners:
+            try:
+                listener()
+            except Exception:
+                log.exception("Shard rebalance listener failed", listener=listener)
+
+    def owns(self, key, exclusive=False):
+        """ Return True if this replica should handle `key`. With `exclusive`, only return True if no other replica
+            may be handling it, as needed to create or delete objects.
+        """
+        self.refresh()
+        previous_ring = self.previous_ring
+        previous_owner = previous_ring.owner(key) if previous_ring else None
+        if self.ring.owner(key) == self.member:
+            return (not exclusive) or self.clock() >= self.exclusive_after or previous_owner == self.member
+        return (not exclusive) and self.clock() < self.handoff_until and previous_owner == self.member
+
+    def collect(self):
+        members = self.ring.members
+        return [("shard_members", {}, len(members)),
+                ("shard_member_index", {"member": self.member},
+                 members.index(self.member) if self.member in members else -1)]
+
+
+# The shard of this replica; None when sharding is disabled and this replica does everything
+shard = None
+shard_lock = threading.Lock()
+rebalance_listeners = []
+
+
+def set_shard(new_shard):
+    """ Make `new_shard` the shard of this replica, or disable sharding if it is None. """
+    global shard
+    with shard_lock:
+        shard = new_shard
+        if new_shard:
+            for listener in rebalance_listeners:
+                new_shard.add_listener(listener)
+
+
+def on_rebalance(listener):
+    """ Call `listener()` whenever the part of the ring that this replica owns may have changed. Modules with
+        caches that can go stale while another replica owns an instance register here.
+    """
+    with shard_lock:
+        rebalance_listeners.append(listener)
+        if shard:
+            shard.add_listener(listener)
+
+
+def enabled():
+    return shard is not None
+
+
+def owns(key, exclusive=False):
+    current = shard
+    return current is None or current.owns(key, exclusive)
+
+
+def owns_service(service_id, exclusive=False):
+    return owns("service:%s" % service_id, exclusive)
+
+
+def owns_instance(service_instance_id, exclusive=False):
+    return owns("instance:%s" % service_instance_id, exclusive)
+
+
+def owns_instance_name(service_instance_name):
+    return owns(u"name:%s" % service_instance_name)
+
+
+def owns_shared_config_map(name, trust_domain_id):
+    """ Return True if this replica may create, mount and delete the shared config map `name` (see
+        shared_config.py). Only one replica does, so it is owned exclusively.
+    """
+    return owns("config_map:%s:%s" % (name, trust_domain_id), exclusive=True)
+
+
+def owned_instances(service_instances):
+    """ Return those of `service_instances` that this replica owns. Names are not unique, so the instances with
+        one name may belong to different replicas.
+    """
+    return [obj for obj in service_instances if owns_instance(obj.id)]
+
+
+# How the policy engine finds the key of an object; objects of other models are handled by every replica
+SHARD_KEYS = {
+    "SimpleExampleService": lambda obj: "service:%s" % obj.id,
+    "SimpleExampleServiceInstance": lambda obj: "instance:%s" % obj.id,
+    "EmbeddedImageNew": lambda obj: "instance:%s" % obj.serviceinstance_id,
+}
+
+
+def owns_object(model_name, obj, exclusive=False):
+    key = SHARD_KEYS.get(model_name)
+    return key is None or owns(key(obj), exclusive)
+
+
+def needs_exclusive(model_name, obj, action):
+    """ Return True if running the `action` policies of `obj` may create or delete objects in the core. An instance
+        is given its compute instance, config map and secret by its first update that finds none.
+    """
+    if action != "update":
+        return True
+    return model_name == "SimpleExampleServiceInstance" and not obj.compute_instance_id
+
+
+def make_sharded_execute_model_policy(execute_model_policy):
+    def sharded_execute_model_policy(engine, instance, action):
+        model_name = getattr(instance, "model_name", instance.__class__.__name__)
+        if not owns_object(model_name, instance, needs_exclusive(model_name, instance, action)):
+            registry.inc("policies_not_owned_total", model=model_name)
+            return
+        return execute_model_policy(engine, instance, action)
+
+    sharded_execute_model_policy.sharded = True
+    return sharded_execute_model_policy
+
+
+def make_sharded_create_kafka_consumer(member):
+    def create_kafka_consumer(thread):
+        from xossynchronizer import event_engine
+
+        # Every replica needs to see every event, so each has its own consumer group
+        consumer_config = {
+            "group.id": "%s-%s" % (Config().get("name"), member),
+            "bootstrap.servers": ",".join(thread.bootstrap_servers),
+            # A new group starts from the newest event; see the module docstring
+            "default.topic.config": {"auto.offset.reset": "largest"},
+        }
+        return event_engine.confluent_kafka.Consumer(**consumer_config)
+
+    return create_kafka_consumer
+
+
+def install(member):
+    """ Make the policy engine and the event engine of the XOS framework work on a shard. Safe to call more than
+        once.
+    """
+    from xossynchronizer.event_engine import XOSKafkaThread
+    from xossynchronizer.model_policy_loop import XOSPolicyEngine
+
+    if not getattr(XOSPolicyEngine.execute_model_policy, "sharded", False):
+        XOSPolicyEngine.execute_model_policy = make_sharded_execute_model_policy(
+            XOSPolicyEngine.execute_model_policy)
+    XOSKafkaThread.create_kafka_consumer = make_sharded_create_kafka_consumer(member)
+
+
+def make_coordinator(sharding_config):
+    backend = sharding_config.get("backend", "file")
+    if backend == "memory":
+        return MemoryCoordinator()
+    if backend == "file":
+        if not sharding_config.get("path"):
+            raise Exception("sharding with the file backend needs a path")
+        return FileLockCoordinator(sharding_config["path"])
+    raise Exception("unknown sharding backend %s" % backend)
+
+
+def start_from_config():
+    """ Join the shard group if config.yaml enables sharding. Returns the shard, or None. """
+    sharding_config = Config.get("sharding") or {}
+    if not sharding_config.get("enabled"):
+        return None
+
+    member = sharding_config.get("member") or socket.gethostname()
+    new_shard = Shard(make_coordinator(sharding_config), member,
+                      refresh_interval=sharding_config.get("refresh_interval", DEFAULT_REFRESH_INTERVAL),
+                      handoff=sharding_config.get("handoff"))
+    new_shard.start()
+    shutdown.register(new_shard.stop)
+    set_shard(new_shard)
+    registry.add_collector("sharding", new_shard.collect)
+    install(member)
+    log.info("Sharding enabled", member=member, members=new_shard.ring.members)
+    return new_shard
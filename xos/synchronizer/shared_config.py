@@ -0,0 +1,127 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" shared_config.py
+
+    Content-addressed config maps. Instead of one KubernetesConfigMap per SimpleExampleServiceInstance, instances
+    whose pages render to the same data mount the same config map, named after a hash of that data. A shared config
+    map is never modified; when an instance's page changes, its mount is pointed at the config map for the new data.
+
+    The reference count of a config map is the number of KubernetesConfigVolumeMounts that point at it. When the
+    last mount goes away the config map is deleted.
+
+    Looking up or counting the mounts and then acting on the result is not atomic, so when the synchronizer is
+    sharded, mounts are only pointed at a shared config map, and it is only created or deleted, by the replica that
+    owns its name (see sharding.owns_shared_config_map). A replica that does not own the config map for a page
+    gives the instance a config map of its own instead, as if shared_config_maps were off; the instance moves to
+    the shared one on a later page change that its replica may make. A replica never deletes a shared config map
+    that it does not own, so one left unreferenced after the ring changed stays until its owner next needs it.
+"""
+
+import hashlib
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+import sharding
+from index_page import count_config_write
+
+log = create_logger(Config().get('logging'))
+
+SHARED_CONFIG_MAP_PREFIX = "simpleexampleservice-map-"
+
+# The name of the config map of one instance, when it does not use a shared one
+CONFIG_MAP_NAME = "simpleexampleserviceinstance-map-%s"
+
+
+def shared_config_map_name(data):
+    return SHARED_CONFIG_MAP_PREFIX + hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def is_shared_config_map(config):
+    return config.name.startswith(SHARED_CONFIG_MAP_PREFIX)
+
+
+class SharedConfigMaps(object):
+    def __init__(self, model_accessor, config_maps=None):
+        """ `config_maps` optionally holds KubernetesConfigMaps that have already been fetched, so that looking up
+            an existing config map does not need a query.
+        """
+        self.model_accessor = model_accessor
+        self.by_name = {}
+        for config in (config_maps or []):
+            if is_shared_config_map(config):
+                self.by_name[(config.name, config.trust_domain_id)] = config
+
+    def acquire(self, trust_domain_id, data):
+        """ Return the config map in the trust domain that holds `data`, creating it if it does not exist. Returns
+            None if another replica owns it.
+        """
+        name = shared_config_map_name(data)
+        if not sharding.owns_shared_config_map(name, trust_domain_id):
+            return None
+        key = (name, trust_domain_id)
+        config = self.by_name.get(key)
+        if config is None:
+            configs = self.model_accessor.KubernetesConfigMap.objects.filter(name=name,
+                                                                             trust_domain_id=trust_domain_id)
+            if configs:
+                config = configs[0]
+            else:
+                config = self.model_accessor.KubernetesConfigMap(name=name, trust_domain_id=trust_domain_id, data=data)
+                config.save()
+                count_config_write(data)
+                log.info("Created shared config map", name=name)
+            self.by_name[key] = config
+        return config
+
+    def release(self, config):
+        """ Delete `config` if no mounts refer to it anymore, unless it is a shared config map that another
+            replica owns. Returns True if it was deleted.
+        """
+        if is_shared_config_map(config) and not sharding.owns_shared_config_map(config.name, config.trust_domain_id):
+            return False
+        if self.model_accessor.KubernetesConfigVolumeMount.objects.filter(config_id=config.id):
+            return False
+        self.by_name.pop((config.name, config.trust_domain_id), None)
+        config.delete()
+        log.info("Deleted unused config map", name=config.name)
+        return True
+
+    def update_mount(self, mount, config, data, service_instance_id):
+        """ Point `mount`, which currently mounts `config`, at the shared config map for `data`. The previous config
+            map is released, and the new one is created in the same trust domain. If another replica owns the shared
+            config map, the page goes to the config map of service instance `service_instance_id` instead. Returns
+            True if the mount or its config map changed.
+        """
+        if config.name == shared_config_map_name(data):
+            return False
+
+        new_config = self.acquire(config.trust_domain_id, data)
+        if new_config is None:
+            if not is_shared_config_map(config):
+                if config.data == data:
+                    return False
+                config.data = data
+                config.save(always_update_timestamp=True)
+                count_config_write(data)
+                return True
+            new_config = self.model_accessor.KubernetesConfigMap(name=CONFIG_MAP_NAME % service_instance_id,
+                                                                 trust_domain_id=config.trust_domain_id, data=data)
+            new_config.save()
+            count_config_write(data)
+        mount.config = new_config
+        mount.save(update_fields=["config"], always_update_timestamp=True)
+        self.release(config)
+        return True
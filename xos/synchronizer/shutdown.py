@@ -0,0 +1,68 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" shutdown.py
+
+    Drain and stop the synchronizer's background components when it exits. Kubernetes stops a pod with SIGTERM,
+    which the XOS backend does not handle, and the policy engine's thread is not a daemon, so atexit handlers do
+    not run when a pod is stopped. Components register their drain or flush here instead, and install() runs the
+    handlers on SIGTERM as well as at a normal exit.
+
+    Handlers run most recently registered first, like atexit handlers, and each runs at most once.
+"""
+
+import atexit
+import os
+import signal
+import threading
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+log = create_logger(Config().get('logging'))
+
+handlers = []
+handlers_lock = threading.Lock()
+
+
+def register(func, *args):
+    """ Call `func(*args)` when the synchronizer exits. """
+    with handlers_lock:
+        handlers.append((func, args))
+
+
+def run():
+    """ Run the registered handlers. """
+    while True:
+        with handlers_lock:
+            if not handlers:
+                return
+            (func, args) = handlers.pop()
+        try:
+            func(*args)
+        except Exception:
+            log.exception("Shutdown handler failed", handler=func)
+
+
+def on_sigterm(signum, frame):
+    log.info("Received SIGTERM, draining before exit")
+    run()
+    # The backend's threads can't be stopped, and would keep the process alive
+    os._exit(0)
+
+
+def install():
+    """ Run the handlers when the process receives SIGTERM or exits. Must be called from the main thread. """
+    signal.signal(signal.SIGTERM, on_sigterm)
+    atexit.register(run)
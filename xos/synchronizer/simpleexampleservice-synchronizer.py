@@ -14,18 +14,61 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# Runs the standard XOS synchronizer
+# Runs the standard XOS synchronizer. With startup_profile enabled in config.yaml, each phase of its start is timed
+# (see startup_profile.py).
 
 import os
-from xossynchronizer import Synchronizer
-from xosconfig import Config
+import time
+started = time.time()
 
 base_config_file = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/config.yaml')
 mounted_config_file = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + '/mounted_config.yaml')
+# This synchronizer's own settings, which are added to the standard schema
+config_schema = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) +
+                                '/simpleexampleservice-config-schema.yaml')
 
+from config_schema import init_config
 if os.path.isfile(mounted_config_file):
-    Config.init(base_config_file, 'synchronizer-config-schema.yaml', mounted_config_file)
+    init_config(base_config_file, config_schema, mounted_config_file)
 else:
-    Config.init(base_config_file, 'synchronizer-config-schema.yaml')
+    init_config(base_config_file, config_schema)
 
+import startup_profile
+from startup_profile import phase
+startup_profile.start_from_config(started)
+
+import index_page
+index_page.read_config()
+
+# Kubernetes stops the pod with SIGTERM; drain the components that registered with shutdown.py before exiting
+import shutdown
+shutdown.install()
+
+with phase("instrumentation"):
+    # Count the calls each model policy and event step makes to the core
+    import accessor_trace
+    accessor_trace.install()
+
+    import metrics_server
+    metrics_server.start_from_config()
+
+# Rate-limit resyncs of compute instances, if config.yaml sets a rate
+with phase("resync_scheduler"):
+    import resync_scheduler
+    resync_scheduler.start_from_config()
+
+# Restore the caches from the last snapshot, if snapshots are enabled, before any policy runs
+with phase("snapshot"):
+    import snapshot
+    snapshot.start_from_config()
+
+# Join the other replicas, if sharding is enabled, before the policy and event engines start
+with phase("sharding"):
+    import sharding
+    sharding.start_from_config()
+
+if startup_profile.enabled():
+    from startup_profile import ProfiledSynchronizer as Synchronizer
+else:
+    from xossynchronizer import Synchronizer
 Synchronizer().run()
@@ -0,0 +1,162 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" snapshot.py
+
+    Optional on-disk snapshot of the synchronizer's caches, so that a restarted synchronizer does not start from
+    nothing. It holds the page fingerprints of the instances, each tagged with the instance's `updated` timestamp,
+    and the id and name of every instance in the name index.
+
+    The snapshot is written every `interval` seconds and at exit, to a temporary file that is then renamed over
+    the old one, so a crash never leaves a partial snapshot behind. It is read once at startup. A snapshot that
+    is older than `max_age` seconds, or that was written by a different version of index_page.py, is ignored.
+
+    Restored entries are checked as they are used rather than all at once at startup: a fingerprint is only
+    trusted once the reconciler or the model policy sees that its instance has the same `updated` timestamp (see
+    fingerprints.py), and a name is only trusted once the instance has been fetched by id and still has that name
+    (see instance_index.py).
+
+    Not everything is saved. Secret digests are keyed with a key that only lives as long as the process (see
+    secret_data.py). The service lookups are live objects from the core, and rebuilding them takes a handful of
+    calls per service.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+import shutdown
+from fingerprints import index_fingerprints
+from instance_index import service_instance_index
+from metrics import registry
+
+log = create_logger(Config().get('logging'))
+
+VERSION = 1
+DEFAULT_INTERVAL = 60
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+
+def code_version():
+    """ Return a digest of index_page.py. Fingerprints made by another version of it may not match the pages that
+        this version renders.
+    """
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_page.py"), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def collect():
+    """ Return the contents of a snapshot of the caches, as a json-serializable dictionary. """
+    return {"version": VERSION,
+            "code_version": code_version(),
+            "written": time.time(),
+            "index_fingerprints": [[id, fingerprint, tag] for (id, (fingerprint, tag))
+                                   in index_fingerprints.snapshot().items()],
+            "instance_names": [[id, name] for (id, name) in service_instance_index.snapshot().items()]}
+
+
+def write_snapshot(path):
+    """ Write a snapshot of the caches to `path`, replacing the previous one atomically. """
+    data = json.dumps(collect())
+    tmp_path = "%s.tmp.%d" % (path, os.getpid())
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    registry.inc("snapshot_writes_total")
+    registry.inc("snapshot_bytes_written_total", len(data))
+
+
+def read_snapshot(path, max_age=DEFAULT_MAX_AGE):
+    """ Restore the caches from the snapshot at `path`. Returns True if the snapshot was used. """
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except IOError:
+        log.info("No snapshot to restore", path=path)
+        return False
+    except ValueError:
+        log.warning("Ignoring unreadable snapshot", path=path)
+        return False
+
+    if snapshot.get("version") != VERSION or snapshot.get("code_version") != code_version():
+        log.info("Ignoring snapshot from another version", path=path)
+        return False
+    age = time.time() - snapshot.get("written", 0)
+    if age > max_age:
+        log.info("Ignoring old snapshot", path=path, age=age)
+        return False
+
+    index_fingerprints.restore(dict([(id, (fingerprint, tag))
+                                     for (id, fingerprint, tag) in snapshot["index_fingerprints"]]))
+    service_instance_index.restore(dict([(id, name) for (id, name) in snapshot["instance_names"]]))
+    log.info("Restored snapshot", path=path, age=age, fingerprints=len(snapshot["index_fingerprints"]),
+             instance_names=len(snapshot["instance_names"]))
+    return True
+
+
+class SnapshotWriter(object):
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="snapshot-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self):
+        # The periodic write and the one at exit may overlap; only one of them may use the temporary file
+        with self.lock:
+            try:
+                write_snapshot(self.path)
+            except Exception:
+                log.exception("Failed to write snapshot", path=self.path)
+                registry.inc("snapshot_failures_total")
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.stopped.set()
+        self.write()
+
+
+def start_from_config():
+    """ Restore the caches and start writing snapshots if config.yaml enables it. Returns the writer, or None. """
+    snapshot_config = Config.get("snapshot") or {}
+    path = snapshot_config.get("path")
+    if not path:
+        return None
+
+    read_snapshot(path, snapshot_config.get("max_age", DEFAULT_MAX_AGE))
+    writer = SnapshotWriter(path, snapshot_config.get("interval", DEFAULT_INTERVAL))
+    writer.start()
+    shutdown.register(writer.stop)
+    return writer
@@ -0,0 +1,154 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" startup_profile.py
+
+    Measure where the synchronizer spends its time while starting: reading the config, loading the models from the
+    core, and discovering the sync steps, event steps and model policies. Once the model policies are loaded, the
+    time of each phase is logged and exported as the startup_phase_seconds metric. Phases may overlap; the model
+    upload, for example, is part of making the model accessor.
+
+    Profiling is off unless it is enabled in the `startup_profile` section of config.yaml, in which case
+    ProfiledSynchronizer is run instead of the standard Synchronizer. It times the steps of Synchronizer.run by
+    overriding the methods that run calls, and the framework methods that discover the steps and policies by
+    wrapping each of them until its first call returns.
+"""
+
+import contextlib
+import threading
+import time
+
+from xosconfig import Config
+from multistructlog import create_logger
+from xossynchronizer import Synchronizer
+
+from metrics import registry
+
+
+class StartupProfile(object):
+    def __init__(self, clock=time.time, start=None):
+        self.clock = clock
+        self.start = clock() if start is None else start
+        self.phases = []
+        self.reported = False
+        self.total = None
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases.append((name, self.clock() - start))
+
+    def wrap(self, cls, method_name, phase_name, finish=False):
+        """ Time the first call of cls.method_name as `phase_name`, which puts the method back as it was. With
+            `finish`, report() once it returns.
+        """
+        method = getattr(cls, method_name)
+        original = cls.__dict__.get(method_name)
+        profile = self
+
+        def wrapper(*args, **kwargs):
+            if original is None:
+                delattr(cls, method_name)
+            else:
+                setattr(cls, method_name, original)
+            with profile.phase(phase_name):
+                result = method(*args, **kwargs)
+            if finish:
+                profile.report()
+            return result
+
+        setattr(cls, method_name, wrapper)
+
+    def collect(self):
+        with self.lock:
+            return ([("startup_seconds", {}, self.total)] +
+                    [("startup_phase_seconds", {"phase": name}, seconds) for (name, seconds) in self.phases])
+
+    def report(self):
+        """ Log the time of each phase and export them as metrics. Only the first call does anything. """
+        with self.lock:
+            if self.reported:
+                return
+            self.reported = True
+            phases = list(self.phases)
+            total = self.total = self.clock() - self.start
+
+        registry.add_collector("startup_profile", self.collect)
+        create_logger(Config().get('logging')).info("Startup profile", total_seconds=round(total, 3),
+                                                    **dict([(name, round(seconds, 3)) for (name, seconds) in phases]))
+
+
+# Set by start_from_config() if profiling is enabled
+profile = None
+
+
+def enabled():
+    return profile is not None
+
+
+@contextlib.contextmanager
+def phase(name):
+    """ Time the enclosed block as `name`, if profiling is enabled. """
+    if profile is None:
+        yield
+    else:
+        with profile.phase(name):
+            yield
+
+
+def start_from_config(started):
+    """ Start profiling if config.yaml enables it. `started` is the time the synchronizer started, before it read
+        the config, which is counted as the first phase. Returns the profile, or None.
+    """
+    global profile
+    if not (Config.get("startup_profile") or {}).get("enabled"):
+        return None
+    profile = StartupProfile(start=started)
+    with profile.lock:
+        profile.phases.append(("config", profile.clock() - started))
+
+    # Connecting to the core includes uploading this synchronizer's models to it
+    from xossynchronizer.loadmodels import ModelLoadClient
+    profile.wrap(ModelLoadClient, "upload_models", "upload_models")
+    return profile
+
+
+class ProfiledSynchronizer(Synchronizer):
+    """ The standard XOS Synchronizer, with each phase of its start timed. """
+
+    def create_model_accessor(self):
+        with phase("model_accessor"):
+            super(ProfiledSynchronizer, self).create_model_accessor()
+
+    def wait_for_ready(self):
+        with phase("wait_for_core"):
+            super(ProfiledSynchronizer, self).wait_for_ready()
+
+        # Synchronizer.run imports the backend next; it may only be imported once the model accessor is ready
+        with phase("import_backend"):
+            from xossynchronizer.backend import Backend
+            from xossynchronizer.event_engine import XOSEventEngine
+            from xossynchronizer.model_policy_loop import XOSPolicyEngine
+
+        profile.wrap(Backend, "load_sync_step_modules", "sync_step_discovery")
+        profile.wrap(XOSEventEngine, "load_event_step_modules", "event_step_discovery")
+        # The model policies are loaded last, just before the synchronizer starts working
+        profile.wrap(XOSPolicyEngine, "load_model_policies", "model_policy_discovery", finish=True)
+        if not Config.get("model_policies_dir"):
+            profile.report()
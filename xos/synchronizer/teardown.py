@@ -0,0 +1,146 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" teardown.py
+
+    Delete everything that was created for a set of SimpleExampleServiceInstances: the volume mounts, the config
+    map and secret, and the compute instance.
+
+    The objects are collected first and then deleted in the reverse of the order they were created in, the same
+    order ObjectGraphBuilder rolls back in. When there are many instances, each model is fetched by the ranges of
+    ids that the instances refer to (see reconciler.filter_by_ids) rather than with a query per instance. The
+    model accessor has no bulk delete, so each object is still one call. Teardown runs in the policy engine's only
+    thread, so it does not pause between deletes; with max_instances, it tears down only that many instances and
+    leaves the rest, counted in `remaining`, to be torn down on a later policy pass.
+
+    Teardown is idempotent. The compute instance goes last, so it is still there to find the rest by, and an
+    instance whose compute instance is gone has nothing left. A config map or secret whose mount was deleted by a
+    teardown that failed part way is found by name, so a retry finds what is left. A shared config map is only
+    deleted when no mount outside the teardown refers to it, and by the replica that owns it (see shared_config.py).
+
+    With dry_run, nothing is deleted and the report says what would have been.
+"""
+
+from xosconfig import Config
+from multistructlog import create_logger
+
+import sharding
+from reconciler import filter_by_ids, group_by
+from shared_config import CONFIG_MAP_NAME, is_shared_config_map
+
+log = create_logger(Config().get('logging'))
+
+SECRET_NAME = "simpleexampleserviceinstance-secret-%s"
+
+# (stage, model) in the order the stages are deleted
+STAGES = [("secret_mounts", "KubernetesSecretVolumeMount"),
+          ("config_mounts", "KubernetesConfigVolumeMount"),
+          ("secrets", "KubernetesSecret"),
+          ("config_maps", "KubernetesConfigMap"),
+          ("compute_instances", "KubernetesServiceInstance")]
+
+
+class Teardown(object):
+    # Above this many instances, each model is fetched by ranges of ids instead of being filtered per instance
+    bulk_threshold = 20
+
+    def __init__(self, model_accessor, max_instances=None, dry_run=False):
+        self.model_accessor = model_accessor
+        self.max_instances = max_instances
+        self.dry_run = dry_run
+        # Instances left for a later pass by max_instances
+        self.remaining = 0
+
+    def find(self, model_name, field, values, bulk):
+        """ Return the objects of `model_name` whose `field` is one of the ids in `values`. """
+        manager = getattr(self.model_accessor, model_name).objects
+        if bulk:
+            return filter_by_ids(manager, field, values)
+        return [obj for value in set(values) if value is not None for obj in manager.filter(**{field: value})]
+
+    def find_by_name(self, model_name, name):
+        return list(getattr(self.model_accessor, model_name).objects.filter(name=name))
+
+    def collect(self, service_instances):
+        """ Return a dictionary that maps each stage to the objects it would delete, in deletion order. """
+        bulk = len(service_instances) > self.bulk_threshold
+        if bulk:
+            computes = dict([(c.id, c) for c in self.find("KubernetesServiceInstance", "id",
+                                                          [si.compute_instance_id for si in service_instances], True)])
+        else:
+            computes = dict([(si.compute_instance_id, si.compute_instance) for si in service_instances
+                             if si.compute_instance])
+        # Instances whose compute instance is gone have already been torn down
+        service_instances = [si for si in service_instances if si.compute_instance_id in computes]
+        if self.max_instances is not None:
+            self.remaining = max(0, len(service_instances) - self.max_instances)
+            service_instances = service_instances[:self.max_instances]
+        computes = dict([(si.compute_instance_id, computes[si.compute_instance_id]) for si in service_instances])
+
+        compute_ids = list(computes.keys())
+        config_mounts = group_by(self.find("KubernetesConfigVolumeMount", "service_instance_id", compute_ids, bulk),
+                                 "service_instance_id")
+        secret_mounts = group_by(self.find("KubernetesSecretVolumeMount", "service_instance_id", compute_ids, bulk),
+                                 "service_instance_id")
+        plan = {"compute_instances": list(computes.values()),
+                "config_mounts": [mnt for mnts in config_mounts.values() for mnt in mnts],
+                "secret_mounts": [mnt for mnts in secret_mounts.values() for mnt in mnts]}
+        configs = self.find("KubernetesConfigMap", "id", [mnt.config_id for mnt in plan["config_mounts"]], bulk)
+        secrets = self.find("KubernetesSecret", "id", [mnt.secret_id for mnt in plan["secret_mounts"]], bulk)
+
+        for si in service_instances:
+            if si.compute_instance_id not in config_mounts:
+                configs.extend(self.find_by_name("KubernetesConfigMap", CONFIG_MAP_NAME % si.id))
+            if si.compute_instance_id not in secret_mounts:
+                secrets.extend(self.find_by_name("KubernetesSecret", SECRET_NAME % si.id))
+
+        shared = [config.id for config in configs if is_shared_config_map(config) and
+                  sharding.owns_shared_config_map(config.name, config.trust_domain_id)]
+        if shared:
+            deleted_mounts = set([mnt.id for mnt in plan["config_mounts"]])
+            mounts = group_by(self.find("KubernetesConfigVolumeMount", "config_id", shared, bulk), "config_id")
+            shared = [config_id for config_id in shared
+                      if all([mnt.id in deleted_mounts for mnt in mounts.get(config_id, [])])]
+        configs = [config for config in configs if (not is_shared_config_map(config)) or (config.id in shared)]
+        plan["config_maps"] = configs
+        plan["secrets"] = secrets
+
+        return dict([(stage, sorted(dict([(obj.id, obj) for obj in plan[stage]]).values(), key=lambda obj: obj.id))
+                     for (stage, _) in STAGES])
+
+    def teardown(self, service_instances):
+        """ Delete the objects of `service_instances`. Returns a report that maps each stage to the ids of the
+            objects that were deleted, or that would be with dry_run. If any delete fails, the stage is finished
+            and an exception is raised before the objects that depend on it are touched.
+        """
+        plan = self.collect(service_instances)
+        report = dict([(stage, [obj.id for obj in plan[stage]]) for (stage, _) in STAGES])
+        if self.dry_run:
+            log.info("Teardown dry run", instances=len(service_instances), **report)
+            return report
+
+        for (stage, model_name) in STAGES:
+            failed = 0
+            for obj in plan[stage]:
+                try:
+                    obj.delete()
+                except Exception:
+                    log.exception("Failed to delete object", model=model_name, id=obj.id)
+                    failed += 1
+            if failed:
+                raise Exception("failed to delete %d of %d %s" % (failed, len(plan[stage]), stage))
+
+        log.info("Tore down service instances", instances=len(plan["compute_instances"]), remaining=self.remaining,
+                 **report)
+        return report
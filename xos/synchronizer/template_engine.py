@@ -0,0 +1,94 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" template_engine.py
+
+    Process-wide jinja2 environment used to render the pages served by SimpleExampleServiceInstances.
+
+    Templates are compiled once and kept in the environment's cache. With auto_reload enabled, jinja2 compares the
+    mtime of the template file on each lookup and recompiles only when the file has changed. Compiled bytecode is
+    also written to a FileSystemBytecodeCache so that a restarted synchronizer does not need to recompile.
+
+    A service may override a template by placing a file named <service_name>/<template_name> in the override
+    directory. Looking for an override that does not exist means searching the template directories, so a missing
+    override is remembered for override_check_interval seconds before it is looked for again.
+
+    jinja2 is imported when the first TemplateEngine is made rather than when this module is, so that it does not
+    slow down the start of the synchronizer.
+"""
+
+import os
+import time
+
+jinja2 = None
+
+SYNCHRONIZER_DIR = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+DEFAULT_TEMPLATE_DIR = os.path.join(SYNCHRONIZER_DIR, "model_policies")
+DEFAULT_OVERRIDE_DIR = os.path.join(SYNCHRONIZER_DIR, "templates")
+
+
+class TemplateEngine(object):
+    override_check_interval = 10
+
+    def __init__(self, template_dirs=None, bytecode_cache_dir=None, auto_reload=True, clock=time.time):
+        global jinja2
+        import jinja2
+
+        if template_dirs is None:
+            template_dirs = [DEFAULT_OVERRIDE_DIR, DEFAULT_TEMPLATE_DIR]
+
+        # bytecode_cache_dir=None lets jinja2 pick a per-user directory under the system temp dir
+        self.env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dirs),
+                                      bytecode_cache=jinja2.FileSystemBytecodeCache(bytecode_cache_dir),
+                                      auto_reload=auto_reload)
+        self.clock = clock
+        # (service_name, name) of overrides that were not found, and when to look for them again
+        self.missing_overrides = {}
+
+    def get_template(self, name, service_name=None):
+        """ Return the compiled template `name`, preferring a per-service override if one exists. """
+        if service_name:
+            key = (service_name, name)
+            now = self.clock()
+            if self.missing_overrides.get(key, 0) <= now:
+                try:
+                    return self.env.get_template(os.path.join(service_name, name))
+                except jinja2.TemplateNotFound:
+                    self.missing_overrides[key] = now + self.override_check_interval
+        return self.env.get_template(name)
+
+    def get_version(self, name, service_name=None):
+        """ Return a string that changes whenever the template that would be used for `name` changes. """
+        template = self.get_template(name, service_name)
+        return "%s:%s" % (template.filename, os.path.getmtime(template.filename))
+
+    def render(self, name, fields, service_name=None):
+        return self.get_template(name, service_name).render(fields)
+
+
+_engine = None
+
+
+def get_template_engine():
+    """ Return the process-wide TemplateEngine, creating it on first use. """
+    global _engine
+    if _engine is None:
+        _engine = TemplateEngine()
+    return _engine
+
+
+def reset_template_engine():
+    """ Discard the process-wide TemplateEngine. Mostly useful for unit tests. """
+    global _engine
+    _engine = None
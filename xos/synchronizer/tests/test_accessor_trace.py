@@ -0,0 +1,90 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+import accessor_trace
+from metrics import registry
+
+
+def invoke(stub, name, request):
+    return "%s(%s)" % (name, request)
+
+
+class TestAccessorTrace(unittest.TestCase):
+
+    def setUp(self):
+        registry.clear()
+        self.stub = object()
+        self.invoke = accessor_trace.make_traced_invoke(invoke)
+
+    def test_traced(self):
+        @accessor_trace.traced("op")
+        def handler():
+            self.invoke(self.stub, "GetThing", 1)
+            self.invoke(self.stub, "GetThing", 2)
+            return self.invoke(self.stub, "ListThing", None)
+
+        self.assertEqual(handler(), "ListThing(None)")
+
+        calls = registry.get_histogram("accessor_calls", operation="op")
+        self.assertEqual(calls.count, 1)
+        self.assertEqual(calls.sum, 3)
+        self.assertEqual(registry.get("accessor_calls_total", operation="op", rpc="GetThing"), 2)
+        self.assertEqual(registry.get("accessor_calls_total", operation="op", rpc="ListThing"), 1)
+        self.assertEqual(accessor_trace.current_trace(), None)
+
+    def test_nested(self):
+        @accessor_trace.traced("inner")
+        def inner():
+            self.invoke(self.stub, "GetThing", 1)
+
+        @accessor_trace.traced("outer")
+        def outer():
+            inner()
+            self.invoke(self.stub, "GetThing", 2)
+
+        outer()
+
+        self.assertEqual(registry.get_histogram("accessor_calls", operation="outer").sum, 2)
+        self.assertEqual(registry.get_histogram("accessor_calls", operation="inner"), None)
+
+    def test_exception(self):
+        @accessor_trace.traced("op")
+        def handler():
+            self.invoke(self.stub, "GetThing", 1)
+            raise Exception("failed")
+
+        with self.assertRaises(Exception):
+            handler()
+
+        self.assertEqual(registry.get_histogram("accessor_calls", operation="op").sum, 1)
+        self.assertEqual(accessor_trace.current_trace(), None)
+
+    def test_untraced(self):
+        self.invoke(self.stub, "GetThing", 1)
+        self.assertEqual(registry.get("accessor_calls_total", operation="untraced", rpc="GetThing"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
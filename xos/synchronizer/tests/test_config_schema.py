@@ -0,0 +1,62 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import tempfile
+import unittest
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+
+from config_schema import extend_schema, init_config
+
+SYNCHRONIZER_DIR = os.path.join(test_path, "..")
+EXTENSION_SCHEMA = os.path.join(SYNCHRONIZER_DIR, "simpleexampleservice-config-schema.yaml")
+
+
+class TestConfigSchema(unittest.TestCase):
+
+    def tearDown(self):
+        Config.clear()
+
+    def test_init_config(self):
+        Config.clear()
+        init_config(os.path.join(SYNCHRONIZER_DIR, "config.yaml"), EXTENSION_SCHEMA)
+        # A standard setting and one of the synchronizer's own
+        self.assertEqual(Config.get("name"), "simpleexampleservice")
+        self.assertEqual(Config.get("teardown.batch_size"), 10)
+
+    def test_unknown_section(self):
+        Config.clear()
+        with tempfile.NamedTemporaryFile(suffix=".yaml") as config_file:
+            config_file.write(b"name: simpleexampleservice\nno_such_section:\n  enabled: True\n")
+            config_file.flush()
+            with self.assertRaises(Exception):
+                init_config(config_file.name, EXTENSION_SCHEMA)
+
+    def test_extend_schema(self):
+        schema = {"map": {"name": {"type": "str"}}}
+        extended = extend_schema(schema, {"map": {"teardown": {"type": "map"}}})
+        self.assertEqual(sorted(extended["map"].keys()), ["name", "teardown"])
+        self.assertEqual(sorted(schema["map"].keys()), ["name"])
+
+        with self.assertRaises(Exception):
+            extend_schema(schema, {"map": {"name": {"type": "int"}}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,262 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Tests for the SimpleExampleEvent event step
+
+import json
+import os
+import sys
+import unittest
+from mock import patch, MagicMock
+from unit_test_common import setup_sync_unit_test
+
+
+class TestSimpleExampleEventStep(unittest.TestCase):
+
+    def setUp(self):
+        self.unittest_setup = setup_sync_unit_test(os.path.abspath(os.path.dirname(os.path.realpath(__file__))),
+                                                   globals(),
+                                                   [("simpleexampleservice", "simpleexampleservice.xproto"),
+                                                    ("kubernetes-service", "kubernetes.xproto")] )
+
+        self.model_accessor = self.unittest_setup["model_accessor"]
+
+        sys.path.append(os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))), ".."))
+        sys.path.append(os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))), "../event_steps"))
+
+        from simpleexampleevent import SimpleExampleEventStep
+        self.event_step_class = SimpleExampleEventStep
+        self.event_step_class.batcher = None
+        self.event_step_class.executor = None
+
+        from instance_index import service_instance_index
+        self.service_instance_index = service_instance_index
+        self.service_instance_index.clear()
+
+        from metrics import registry
+        self.registry = registry
+        self.registry.clear()
+
+        self.log = MagicMock()
+
+        self.service = SimpleExampleService(service_message="hello", service_secret="p@ssw0rd")
+        self.si1 = SimpleExampleServiceInstance(name="instance1", id=1112, owner=self.service,
+                                                tenant_message="world")
+        self.si2 = SimpleExampleServiceInstance(name="instance2", id=1113, owner=self.service,
+                                                tenant_message="world")
+
+    def tearDown(self):
+        self.event_step_class.batcher = None
+        if self.event_step_class.executor:
+            self.event_step_class.executor.shutdown(timeout=10)
+            self.event_step_class.executor = None
+        sys.path = self.unittest_setup["sys_path_save"]
+
+    def make_event(self, name, tenant_message):
+        event = MagicMock()
+        event.topic = "SimpleExampleEvent"
+        event.value = json.dumps({"service_instance": name, "tenant_message": tenant_message})
+        return event
+
+    def test_process_event(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save:
+            sesi_objects.return_value = [self.si1, self.si2]
+
+            step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+            step.process_event(self.make_event("instance1", "earth"))
+
+            self.assertEqual(sesi_save.call_count, 1)
+            self.assertEqual(sesi_save.call_args[0][0], self.si1)
+            self.assertEqual(sesi_save.call_args[1]["update_fields"], ["tenant_message"])
+            self.assertEqual(self.si1.tenant_message, "earth")
+            self.assertEqual(self.si2.tenant_message, "world")
+
+    def test_process_event_uses_index(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(SimpleExampleServiceInstance.objects, "filter") as sesi_filter, \
+                patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save:
+            sesi_objects.return_value = [self.si1, self.si2]
+
+            for tenant_message in ["mars", "earth"]:
+                step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+                step.process_event(self.make_event("instance2", tenant_message))
+
+            # The index was loaded once and no filter by name was needed
+            self.assertEqual(sesi_objects.call_count, 1)
+            self.assertEqual(sesi_filter.call_count, 0)
+            self.assertEqual(sesi_save.call_count, 2)
+            self.assertEqual(self.si2.tenant_message, "earth")
+
+    def test_process_event_index_miss(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save:
+            sesi_objects.return_value = [self.si1]
+
+            step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+            step.process_event(self.make_event("instance1", "mars"))
+
+            # instance2 was created after the index was loaded
+            sesi_objects.return_value = [self.si1, self.si2]
+            step.process_event(self.make_event("instance2", "earth"))
+
+            self.assertEqual(sesi_save.call_count, 2)
+            self.assertEqual(self.si2.tenant_message, "earth")
+            self.assertEqual(self.service_instance_index.get("instance2"), [self.si2])
+
+    def test_process_event_unchanged(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(SimpleExampleServiceInstance.objects, "filter") as sesi_filter, \
+                patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save:
+            sesi_objects.return_value = [self.si1, self.si2]
+            sesi_filter.return_value = [self.si1]
+
+            step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+            step.process_event(self.make_event("instance1", "world"))
+
+            # The message did not change in the core either, so nothing was written
+            sesi_filter.assert_called_once_with(id=self.si1.id)
+            self.assertEqual(sesi_save.call_count, 0)
+            self.assertEqual(self.registry.get("events_received_total", topic="SimpleExampleEvent"), 1)
+            self.assertEqual(self.registry.get("events_noop_total", topic="SimpleExampleEvent"), 1)
+            self.assertEqual(self.registry.get("events_written_total", topic="SimpleExampleEvent"), 0)
+
+            step.process_event(self.make_event("instance1", "earth"))
+            self.assertEqual(sesi_save.call_count, 1)
+            self.assertEqual(self.registry.get("events_written_total", topic="SimpleExampleEvent"), 1)
+
+    def test_process_event_stale_index(self):
+        changed = SimpleExampleServiceInstance(name="instance1", id=1112, owner=self.service, tenant_message="mars")
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(SimpleExampleServiceInstance.objects, "filter") as sesi_filter, \
+                patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save:
+            sesi_objects.return_value = [self.si1, self.si2]
+            # Changed through the API after the index was loaded
+            sesi_filter.return_value = [changed]
+
+            step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+            step.process_event(self.make_event("instance1", "world"))
+
+            self.assertEqual(sesi_save.call_count, 1)
+            self.assertEqual(sesi_save.call_args[0][0], changed)
+            self.assertEqual(changed.tenant_message, "world")
+            self.assertEqual(self.service_instance_index.get("instance1"), [changed])
+
+    def test_process_event_not_found(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save:
+            sesi_objects.return_value = [self.si1]
+
+            step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+            with self.assertRaises(Exception):
+                step.process_event(self.make_event("instance2", "earth"))
+
+            self.assertEqual(sesi_save.call_count, 0)
+
+    def test_process_event_batched(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save, \
+                patch.object(self.event_step_class, "batch_size", 10), \
+                patch.object(self.event_step_class, "batch_window", 60):
+            sesi_objects.return_value = [self.si1, self.si2]
+
+            for (name, tenant_message) in [("instance1", "mars"), ("instance2", "venus"),
+                                           ("instance1", "earth"), ("instance3", "pluto")]:
+                step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+                step.process_event(self.make_event(name, tenant_message))
+
+            # Nothing is written until the batch is flushed
+            self.assertEqual(sesi_save.call_count, 0)
+
+            batcher = self.event_step_class.batcher
+            batcher.flush()
+
+            # instance1 was coalesced into a single save with the last message, instance3 does not exist
+            self.assertEqual(sesi_save.call_count, 2)
+            self.assertEqual(self.si1.tenant_message, "earth")
+            self.assertEqual(self.si2.tenant_message, "venus")
+
+            stats = batcher.stats()
+            self.assertEqual(stats["received"], 4)
+            self.assertEqual(stats["coalesced"], 1)
+            self.assertEqual(stats["flushed"], 3)
+            self.assertEqual(stats["failed"], 1)
+
+    def test_process_event_batch_full(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save, \
+                patch.object(self.event_step_class, "batch_size", 2), \
+                patch.object(self.event_step_class, "batch_window", 60), \
+                patch.object(self.event_step_class, "bulk_lookup_threshold", 1):
+            sesi_objects.return_value = [self.si1, self.si2]
+
+            step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+            step.process_event(self.make_event("instance1", "earth"))
+            self.assertEqual(sesi_save.call_count, 0)
+
+            # The second distinct instance fills the batch, which is then flushed
+            step.process_event(self.make_event("instance2", "mars"))
+            self.assertEqual(sesi_save.call_count, 2)
+            self.assertEqual(self.si1.tenant_message, "earth")
+            self.assertEqual(self.si2.tenant_message, "mars")
+
+    def test_process_event_workers(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save, \
+                patch.object(self.event_step_class, "workers", 4):
+            sesi_objects.return_value = [self.si1, self.si2]
+
+            step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+            for i in range(10):
+                step.process_event(self.make_event("instance1", "one-%d" % i))
+                step.process_event(self.make_event("instance2", "two-%d" % i))
+            step.process_event(self.make_event("instance3", "three"))
+
+            self.assertTrue(self.event_step_class.executor.shutdown(timeout=10))
+            self.event_step_class.executor = None
+
+            # Updates to each instance were applied in order, so the last message wins
+            self.assertEqual(sesi_save.call_count, 20)
+            self.assertEqual(self.si1.tenant_message, "one-9")
+            self.assertEqual(self.si2.tenant_message, "two-9")
+            self.assertEqual(self.registry.get("events_failed_total", topic="SimpleExampleEvent"), 1)
+
+    def test_process_event_sharded(self):
+        import sharding
+        coordinator = sharding.MemoryCoordinator()
+        coordinator.join("other")
+        shard = sharding.Shard(coordinator, "mine", handoff=0)
+        shard.start()
+        # Give instance1 an id that this replica owns and instance2 one that it does not
+        self.si1.id = [id for id in range(1000) if shard.owns("instance:%s" % id)][0]
+        self.si2.id = [id for id in range(1000) if not shard.owns("instance:%s" % id)][0]
+        sharding.set_shard(shard)
+        try:
+            with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                    patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save:
+                sesi_objects.return_value = [self.si1, self.si2]
+
+                step = self.event_step_class(model_accessor=self.model_accessor, log=self.log)
+                step.process_event(self.make_event("instance1", "earth"))
+                step.process_event(self.make_event("instance2", "mars"))
+
+                self.assertEqual(sesi_save.call_count, 1)
+                self.assertEqual(self.si1.tenant_message, "earth")
+                self.assertEqual(self.si2.tenant_message, "world")
+                self.assertEqual(self.registry.get("events_not_owned_total", topic="SimpleExampleEvent"), 1)
+        finally:
+            sharding.set_shard(None)
+
+if __name__ == '__main__':
+    unittest.main()
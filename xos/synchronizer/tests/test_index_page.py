@@ -0,0 +1,224 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import sys
+import unittest
+from mock import MagicMock, patch
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+import index_page
+from fragment_cache import LRUCache, embedded_image_lists, index_fragments
+from template_engine import reset_template_engine
+
+EXPECTED_PAGE = """
+
+
+<html>
+<body style="background-color:#000000;">
+<font color="#ffffff">
+
+<h1>ExampleService</h1>
+
+<ul>
+<li>Service Message: "hello"</li>
+<li>Tenant Message: "world"</li>
+</ul>
+
+
+<h2>Some images</h2>
+
+<img name="logo" href="http://example.com/logo.png">
+
+
+
+</font>
+
+</body>
+</html>"""
+
+
+class Image(object):
+    def __init__(self, id, name, url):
+        self.id = id
+        self.name = name
+        self.url = url
+
+
+class TestIndexPage(unittest.TestCase):
+
+    def setUp(self):
+        reset_template_engine()
+        index_fragments.clear()
+        embedded_image_lists.clear()
+        self.service = MagicMock(service_message="hello")
+        self.service.name = "simpleexampleservice"
+
+    def make_fields(self, tenant_message="world", images=None):
+        if images is None:
+            images = [Image(1, "logo", "http://example.com/logo.png")]
+        return index_page.make_index_fields(self.service, tenant_message, foreground_color="#ffffff",
+                                            background_color="#000000", images=images)
+
+    def make_instance(self, images):
+        si = MagicMock(id=7, embedded_images_ids=[image.id for image in images])
+        si.embedded_images.all.return_value = images
+        return si
+
+    def test_render_index(self):
+        self.assertEqual(index_page.render_index(self.service, self.make_fields()), EXPECTED_PAGE)
+
+    def test_render_index_no_images(self):
+        page = index_page.render_index(self.service, self.make_fields(images=[]))
+        self.assertNotIn("Some images", page)
+        self.assertIn('Tenant Message: "world"', page)
+
+    def test_message_change_reuses_fragments(self):
+        index_page.render_index(self.service, self.make_fields())
+        self.assertEqual(index_fragments.stats()["misses"], 3)
+
+        page = index_page.render_index(self.service, self.make_fields(tenant_message="changed"))
+        # the header and the gallery were reused, and only the messages were rendered again
+        self.assertEqual(index_fragments.stats()["hits"], 2)
+        self.assertEqual(index_fragments.stats()["misses"], 4)
+        self.assertEqual(page, EXPECTED_PAGE.replace('"world"', '"changed"'))
+
+    def test_image_fields_cached_by_ids(self):
+        images = [Image(2, "b", "http://b"), Image(1, "a", "http://a")]
+        si = self.make_instance(images)
+
+        (first, total) = index_page.get_image_fields(si)
+        (second, total) = index_page.get_image_fields(si)
+        self.assertEqual(second, first)
+        self.assertEqual(total, 2)
+        self.assertEqual(si.embedded_images.all.call_count, 1)
+
+        # adding an image changes the ids, so the images are fetched again
+        images.append(Image(3, "c", "http://c"))
+        si.embedded_images_ids = [3, 1, 2]
+        self.assertEqual(len(index_page.get_image_fields(si)[0]), 3)
+        self.assertEqual(si.embedded_images.all.call_count, 2)
+
+        # an image edited in place keeps its id; the policy for EmbeddedImageNew forgets the cached images
+        images[0].url = "http://b2"
+        index_page.forget_images(si.id)
+        self.assertEqual(index_page.get_image_fields(si)[0][0]["url"], "http://b2")
+        self.assertEqual(si.embedded_images.all.call_count, 3)
+
+    def test_image_fields_without_ids(self):
+        si = self.make_instance([Image(1, "a", "http://a")])
+        del si.embedded_images_ids
+        index_page.get_image_fields(si)
+        index_page.get_image_fields(si)
+        self.assertEqual(si.embedded_images.all.call_count, 2)
+
+    def test_remember_images(self):
+        images = [Image(1, "a", "http://a")]
+        si = self.make_instance(images)
+        index_page.remember_images(si.id, images)
+        self.assertEqual(index_page.get_image_fields(si), ([{"name": "a", "url": "http://a"}], 1))
+        self.assertFalse(si.embedded_images.all.called)
+
+
+    def test_image_fields_fetched_in_chunks(self):
+        images = [Image(id, "image%d" % id, "http://%d" % id) for id in range(1, 8)]
+        si = self.make_instance(images)
+        model_accessor = MagicMock()
+        model_accessor.EmbeddedImageNew.objects.filter.side_effect = \
+            lambda serviceinstance_id, id__gte, id__lte: [i for i in images if id__gte <= i.id <= id__lte]
+
+        with patch.object(index_page, "image_fetch_size", 3), patch.object(index_page, "max_images", 5):
+            (fields, total) = index_page.get_image_fields(si, model_accessor)
+
+        self.assertEqual([image["name"] for image in fields], ["image1", "image2", "image3", "image4", "image5"])
+        self.assertEqual(total, 7)
+        self.assertEqual(model_accessor.EmbeddedImageNew.objects.filter.call_count, 2)
+        self.assertFalse(si.embedded_images.all.called)
+
+    def test_max_images(self):
+        images = [Image(id, "image%d" % id, "http://%d" % id) for id in range(1, 5)]
+        with patch.object(index_page, "max_images", 2):
+            fields = self.make_fields(images=images)
+        self.assertEqual(len(fields["images"]), 2)
+        self.assertEqual(fields["more_images"], 2)
+        page = index_page.render_index(self.service, fields)
+        self.assertIn("image2", page)
+        self.assertNotIn("image3", page)
+        self.assertIn("<p>2 more images are not shown</p>", page)
+
+    def test_images_per_page(self):
+        images = [Image(id, "image%d" % id, "http://%d" % id) for id in range(1, 6)]
+        with patch.object(index_page, "images_per_page", 2):
+            data = json.loads(index_page.make_config_data(self.service, self.make_fields(images=images)))
+
+        self.assertEqual(sorted(data.keys()), ["index-2.html", "index-3.html", "index.html"])
+        self.assertIn("image1", data["index.html"])
+        self.assertNotIn("image3", data["index.html"])
+        self.assertIn("image3", data["index-2.html"])
+        self.assertIn("image5", data["index-3.html"])
+        self.assertIn('<p>Page 2 of 3: <a href="index.html">1</a> <a href="index-2.html">2</a> '
+                      '<a href="index-3.html">3</a></p>', data["index-2.html"])
+
+    def test_images_per_page_single_page(self):
+        with patch.object(index_page, "images_per_page", 2):
+            data = json.loads(index_page.make_config_data(self.service, self.make_fields()))
+        self.assertEqual(data, {"index.html": EXPECTED_PAGE})
+
+    def test_read_config(self):
+        index_page_config = {"image_fetch_size": 10, "images_per_page": 20}
+        with patch.object(index_page, "image_fetch_size", 100), patch.object(index_page, "max_images", 1000), \
+                patch.object(index_page, "images_per_page", None), \
+                patch("index_page.Config.get", return_value=index_page_config):
+            index_page.read_config()
+            self.assertEqual((index_page.image_fetch_size, index_page.max_images, index_page.images_per_page),
+                             (10, 1000, 20))
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["size"], 2)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_evicts_by_bytes(self):
+        cache = LRUCache(max_entries=10, max_bytes=10)
+        cache.set("a", "12345")
+        cache.set("b", "12345")
+        self.assertEqual(cache.stats()["bytes"], 10)
+        cache.set("c", "123")
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.stats()["bytes"], 8)
+        # Replacing or dropping an entry gives back its bytes
+        cache.set("b", "1")
+        cache.discard("c")
+        self.assertEqual(cache.stats()["bytes"], 1)
+        # A value larger than the whole cache is not kept
+        cache.set("d", "12345678901")
+        self.assertEqual(cache.get("d"), None)
+        self.assertEqual(cache.get("b"), "1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+from mock import MagicMock
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from instance_index import NameIndex
+
+
+class TestNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = NameIndex()
+        self.obj1 = MagicMock(id=1)
+        self.obj1.name = "one"
+        self.obj2 = MagicMock(id=2)
+        self.obj2.name = "two"
+        self.obj3 = MagicMock(id=3)
+        self.obj3.name = "two"
+
+    def test_load(self):
+        self.assertFalse(self.index.loaded)
+        self.index.load([self.obj1, self.obj2, self.obj3])
+        self.assertTrue(self.index.loaded)
+        self.assertEqual(self.index.get("one"), [self.obj1])
+        self.assertEqual(self.index.get("two"), [self.obj2, self.obj3])
+        self.assertEqual(self.index.get("three"), None)
+        self.assertEqual(self.index.stats()["hits"], 2)
+        self.assertEqual(self.index.stats()["misses"], 1)
+
+    def test_update_rename(self):
+        self.index.load([self.obj1, self.obj2])
+        renamed = MagicMock(id=1)
+        renamed.name = "uno"
+        self.index.update(renamed)
+        self.assertEqual(self.index.get("one"), None)
+        self.assertEqual(self.index.get("uno"), [renamed])
+
+    def test_update_replaces_object(self):
+        self.index.load([self.obj1])
+        newer = MagicMock(id=1)
+        newer.name = "one"
+        self.index.update(newer)
+        self.assertEqual(self.index.get("one"), [newer])
+
+    def test_remove(self):
+        self.index.load([self.obj1, self.obj2, self.obj3])
+        self.index.remove(2)
+        self.assertEqual(self.index.get("two"), [self.obj3])
+        self.index.remove(3)
+        self.assertEqual(self.index.get("two"), None)
+        # removing an unknown id is not an error
+        self.index.remove(4)
+
+    def test_restore(self):
+        self.index.restore({2: "two", 3: "two", 4: "four"})
+        self.assertFalse(self.index.loaded)
+        self.assertEqual(self.index.get("two"), None)
+        self.assertEqual(sorted(self.index.pop_restored("two")), [2, 3])
+        self.assertEqual(self.index.pop_restored("two"), [])
+
+        # Restored ids stay in the snapshot until they are fetched or removed
+        self.index.update(self.obj1)
+        self.assertEqual(self.index.snapshot(), {1: "one", 4: "four"})
+        self.index.remove(4)
+        self.assertEqual(self.index.snapshot(), {1: "one"})
+        self.assertEqual(self.index.pop_restored("four"), [])
+
+    def test_load_replaces_restored(self):
+        self.index.restore({4: "four"})
+        self.index.load([self.obj1])
+        self.assertEqual(self.index.pop_restored("four"), [])
+        self.assertEqual(self.index.snapshot(), {1: "one"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+from mock import MagicMock
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from lookup_cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = TTLCache(ttl=10, clock=lambda: self.now)
+
+    def test_get_caches_value(self):
+        loader = MagicMock(return_value="value")
+        self.assertEqual(self.cache.get("key", loader), "value")
+        self.assertEqual(self.cache.get("key", loader), "value")
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertEqual(self.cache.stats()["hit_rate"], 0.5)
+
+    def test_get_expires(self):
+        loader = MagicMock(return_value="value")
+        self.cache.get("key", loader)
+        self.now += 11
+        self.cache.get("key", loader)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_invalidate(self):
+        loader = MagicMock(return_value="value")
+        self.cache.get("key1", loader)
+        self.cache.get("key2", loader)
+
+        self.cache.invalidate("key1")
+        self.cache.get("key1", loader)
+        self.cache.get("key2", loader)
+        self.assertEqual(loader.call_count, 3)
+
+        self.cache.invalidate()
+        self.cache.get("key2", loader)
+        self.assertEqual(loader.call_count, 4)
+
+    def test_loader_exception_is_not_cached(self):
+        loader = MagicMock(side_effect=[Exception("failed"), "value"])
+        with self.assertRaises(Exception):
+            self.cache.get("key", loader)
+        self.assertEqual(self.cache.get("key", loader), "value")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from metrics import MetricsRegistry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_inc(self):
+        self.registry.inc("events_total", topic="a")
+        self.registry.inc("events_total", 2, topic="a")
+        self.registry.inc("events_total", topic="b")
+        self.assertEqual(self.registry.get("events_total", topic="a"), 3)
+        self.assertEqual(self.registry.get("events_total", topic="b"), 1)
+        self.assertEqual(self.registry.get("events_total", topic="c"), 0)
+
+    def test_snapshot(self):
+        self.registry.inc("b_total")
+        self.registry.inc("a_total", kind="x", topic="t")
+        self.assertEqual(self.registry.snapshot(), [("a_total", {"kind": "x", "topic": "t"}, 1),
+                                                    ("b_total", {}, 1)])
+
+    def test_observe(self):
+        for value in [0, 1, 2, 5, 100]:
+            self.registry.observe("calls", value, [1, 5, 10], operation="op")
+        histogram = self.registry.get_histogram("calls", operation="op")
+        self.assertEqual(histogram.cumulative(), [(1, 2), (5, 4), (10, 4), ("+Inf", 5)])
+        self.assertEqual(histogram.sum, 108)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(self.registry.get_histogram("calls", operation="other"), None)
+
+    def test_histogram_snapshot(self):
+        self.registry.observe("seconds", 0.5, [1], operation="op")
+        self.assertEqual(self.registry.histogram_snapshot(),
+                         [("seconds", {"operation": "op"}, [(1, 1), ("+Inf", 1)], 0.5, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+import metrics_server
+from metrics import MetricsRegistry, registry
+
+
+class TestMetricsServer(unittest.TestCase):
+
+    def test_render_counters(self):
+        r = MetricsRegistry()
+        r.inc("events_received_total", 3, topic="SimpleExampleEvent")
+        self.assertEqual(metrics_server.render_metrics(r),
+                         "# TYPE simpleexampleservice_events_received_total counter\n"
+                         "simpleexampleservice_events_received_total{topic=\"SimpleExampleEvent\"} 3.0\n")
+
+    def test_render_histogram(self):
+        r = MetricsRegistry()
+        r.observe("operation_seconds", 0.5, [1], operation="handle_update")
+        self.assertEqual(metrics_server.render_metrics(r),
+                         "# TYPE simpleexampleservice_operation_seconds histogram\n"
+                         "simpleexampleservice_operation_seconds_bucket{le=\"1.0\",operation=\"handle_update\"} 1.0\n"
+                         "simpleexampleservice_operation_seconds_bucket{le=\"+Inf\",operation=\"handle_update\"} 1.0\n"
+                         "simpleexampleservice_operation_seconds_sum{operation=\"handle_update\"} 0.5\n"
+                         "simpleexampleservice_operation_seconds_count{operation=\"handle_update\"} 1.0\n")
+
+    def test_render_collectors(self):
+        r = MetricsRegistry()
+        r.add_collector("test", lambda: [("queue_depth", {}, 4), ("things_total", {"kind": "a"}, 2)])
+        r.add_collector("broken", lambda: 1 / 0)
+        self.assertEqual(metrics_server.render_metrics(r),
+                         "# TYPE simpleexampleservice_queue_depth gauge\n"
+                         "simpleexampleservice_queue_depth 4.0\n"
+                         "# TYPE simpleexampleservice_things_total counter\n"
+                         "simpleexampleservice_things_total{kind=\"a\"} 2.0\n")
+
+    def test_serve(self):
+        registry.clear()
+        registry.inc("events_noop_total", topic="SimpleExampleEvent")
+        server = metrics_server.start_metrics_server(0, "127.0.0.1")
+        try:
+            body = urlopen("http://127.0.0.1:%d/metrics" % server.server_address[1]).read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn("simpleexampleservice_events_noop_total{topic=\"SimpleExampleEvent\"} 1.0", body)
+        self.assertIn("simpleexampleservice_cache_hit_rate{cache=\"service_lookups\"}", body)
+
+    def test_start_from_config_disabled(self):
+        self.assertEqual(metrics_server.start_from_config(), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
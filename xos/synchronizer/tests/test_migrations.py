@@ -0,0 +1,81 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib
+import os
+import sys
+import unittest
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+try:
+    import django
+except ImportError:
+    django = None
+
+# Applying the migration needs PostgreSQL, as CREATE INDEX CONCURRENTLY is not portable; set this to a connection
+# string of a scratch database to run that test
+TEST_DSN = os.environ.get("XOS_TEST_DSN")
+
+
+@unittest.skipUnless(django, "needs Django")
+class TestQueryIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.migration = importlib.import_module("migrations.0005_query_indexes")
+
+    def test_not_atomic(self):
+        # PostgreSQL refuses to build an index concurrently inside a transaction
+        self.assertFalse(self.migration.Migration.atomic)
+        for operation in self.migration.Migration.operations:
+            self.assertIn("CONCURRENTLY", operation.sql)
+            self.assertIn("CONCURRENTLY", operation.reverse_sql)
+
+    def test_only_service_tables(self):
+        # The core's tables are left to the core's migrations
+        for (name, table, columns) in self.migration.INDEXES:
+            self.assertTrue(table.startswith("simpleexampleservice_"), table)
+
+    @unittest.skipUnless(TEST_DSN, "needs XOS_TEST_DSN")
+    def test_apply(self):
+        import psycopg2
+
+        conn = psycopg2.connect(TEST_DSN)
+        conn.autocommit = True
+        cursor = conn.cursor()
+        try:
+            cursor.execute("CREATE TABLE simpleexampleservice_embeddedimagenew "
+                           "(id integer primary key, serviceinstance_id integer)")
+            names = [name for (name, table, columns) in self.migration.INDEXES]
+            find = "SELECT indexname FROM pg_indexes WHERE indexname IN %s"
+
+            for operation in self.migration.Migration.operations:
+                cursor.execute(operation.sql)
+                # Applying it twice is harmless
+                cursor.execute(operation.sql)
+            cursor.execute(find, (tuple(names),))
+            self.assertEqual(sorted([row[0] for row in cursor.fetchall()]), sorted(names))
+
+            for operation in reversed(self.migration.Migration.operations):
+                cursor.execute(operation.reverse_sql)
+            cursor.execute(find, (tuple(names),))
+            self.assertEqual(cursor.fetchall(), [])
+        finally:
+            cursor.execute("DROP TABLE IF EXISTS simpleexampleservice_embeddedimagenew")
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
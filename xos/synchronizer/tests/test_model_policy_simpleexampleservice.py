@@ -0,0 +1,155 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Tests for SimpleExampleService model policies
+
+import base64
+import json
+import os
+import sys
+import unittest
+from mock import patch
+from unit_test_common import setup_sync_unit_test
+
+
+def filter_by_ids_in_memory(manager, attr, ids):
+    # The mock model accessor only filters on exact values
+    return [obj for obj in manager.all() if getattr(obj, attr) in ids]
+
+
+class TestSimpleExampleServicePolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.unittest_setup = setup_sync_unit_test(os.path.abspath(os.path.dirname(os.path.realpath(__file__))),
+                                                   globals(),
+                                                   [("simpleexampleservice", "simpleexampleservice.xproto"),
+                                                    ("kubernetes-service", "kubernetes.xproto")] )
+
+        self.MockObjectList = self.unittest_setup["MockObjectList"]
+        self.model_accessor = self.unittest_setup["model_accessor"]
+
+        sys.path.append(os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))), ".."))
+        sys.path.append(os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))),
+                                     "../model_policies"))
+
+        from model_policy_simpleexampleservice import SimpleExampleServicePolicy
+        self.policy_class = SimpleExampleServicePolicy
+
+        from fingerprints import index_fingerprints, service_fingerprints
+        index_fingerprints.clear()
+        service_fingerprints.clear()
+
+        from secret_data import secret_fingerprints
+        secret_fingerprints.clear()
+
+        self.service = SimpleExampleService(id=1000, name="simpleexampleservice", service_message="hello",
+                                            service_secret="p@ssw0rd")
+        self.k8s_service = KubernetesService(id=1111)
+        self.trust_domain = TrustDomain(owner=self.k8s_service, name="test-trust")
+
+        self.si = SimpleExampleServiceInstance(name="test-simple-instance", id=1112, owner=self.service,
+                                               owner_id=self.service.id, tenant_message="world",
+                                               tenant_secret="l3tm31n")
+        self.ksi = KubernetesServiceInstance(id=1113, owner=self.k8s_service, name="simpleexampleserviceinstance-1112")
+        self.si.compute_instance_id = self.ksi.id
+        self.cfm = KubernetesConfigMap(id=1114, trust_domain=self.trust_domain,
+                                       name="simpleexampleserviceinstance-map-1112", data="junk")
+        self.cfm_mnt = KubernetesConfigVolumeMount(config=self.cfm, config_id=self.cfm.id, service_instance=self.ksi,
+                                                   service_instance_id=self.ksi.id)
+        self.secret = KubernetesSecret(id=1115, trust_domain=self.trust_domain,
+                                       name="simpleexampleserviceinstance-secret-1112", data="junk")
+        self.secret_mnt = KubernetesSecretVolumeMount(secret=self.secret, secret_id=self.secret.id,
+                                                      service_instance=self.ksi, service_instance_id=self.ksi.id)
+
+    def tearDown(self):
+        sys.path = self.unittest_setup["sys_path_save"]
+
+    def test_policy_update_fanout(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(ColorNew.objects, "get_items") as color_objects, \
+                patch.object(EmbeddedImageNew.objects, "get_items") as image_objects, \
+                patch.object(KubernetesServiceInstance.objects, "get_items") as ksi_objects, \
+                patch.object(KubernetesConfigVolumeMount.objects, "get_items") as kcfm_mnt_objects, \
+                patch.object(KubernetesConfigMap.objects, "get_items") as kcfm_objects, \
+                patch.object(KubernetesSecretVolumeMount.objects, "get_items") as ksec_mnt_objects, \
+                patch.object(KubernetesSecret.objects, "get_items") as ksec_objects, \
+                patch.object(KubernetesServiceInstance, "save", autospec=True) as ksi_save, \
+                patch.object(KubernetesConfigMap, "save", autospec=True) as kcfm_save, \
+                patch.object(KubernetesSecret, "save", autospec=True) as ksec_save, \
+                patch("reconciler.filter_by_ids", side_effect=filter_by_ids_in_memory):
+            sesi_objects.return_value = [self.si]
+            color_objects.return_value = []
+            image_objects.return_value = []
+            ksi_objects.return_value = [self.ksi]
+            kcfm_mnt_objects.return_value = [self.cfm_mnt]
+            kcfm_objects.return_value = [self.cfm]
+            ksec_mnt_objects.return_value = [self.secret_mnt]
+            ksec_objects.return_value = [self.secret]
+
+            self.service.service_secret = "n3w-s3cr3t"
+
+            step = self.policy_class(model_accessor=self.model_accessor)
+            step.handle_update(self.service)
+
+            self.assertEqual(kcfm_save.call_count, 1)
+            self.assertIn("hello", json.loads(self.cfm.data)["index.html"])
+
+            self.assertEqual(ksec_save.call_count, 1)
+            secret_data = json.loads(self.secret.data)
+            self.assertEqual(base64.b64decode(secret_data["service_secret.txt"]), "n3w-s3cr3t")
+            self.assertEqual(base64.b64decode(secret_data["tenant_secret.txt"]), "l3tm31n")
+
+            # the compute instance is saved once, for both writes
+            self.assertEqual(ksi_save.call_count, 1)
+
+            # Nothing changed, so a second update does not query or write anything
+            sesi_objects.reset_mock()
+            step.handle_update(self.service)
+            sesi_objects.assert_not_called()
+            self.assertEqual(kcfm_save.call_count, 1)
+            self.assertEqual(ksec_save.call_count, 1)
+
+    def test_policy_update_failed(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(ColorNew.objects, "get_items") as color_objects, \
+                patch.object(EmbeddedImageNew.objects, "get_items") as image_objects, \
+                patch.object(KubernetesServiceInstance.objects, "get_items") as ksi_objects, \
+                patch.object(KubernetesConfigVolumeMount.objects, "get_items") as kcfm_mnt_objects, \
+                patch.object(KubernetesConfigMap.objects, "get_items") as kcfm_objects, \
+                patch.object(KubernetesSecretVolumeMount.objects, "get_items") as ksec_mnt_objects, \
+                patch.object(KubernetesSecret.objects, "get_items") as ksec_objects, \
+                patch.object(KubernetesConfigMap, "save", autospec=True) as kcfm_save, \
+                patch("reconciler.filter_by_ids", side_effect=filter_by_ids_in_memory):
+            sesi_objects.return_value = [self.si]
+            color_objects.return_value = []
+            image_objects.return_value = []
+            ksi_objects.return_value = [self.ksi]
+            kcfm_mnt_objects.return_value = [self.cfm_mnt]
+            kcfm_objects.return_value = [self.cfm]
+            ksec_mnt_objects.return_value = [self.secret_mnt]
+            ksec_objects.return_value = [self.secret]
+            kcfm_save.side_effect = Exception("save failed")
+
+            step = self.policy_class(model_accessor=self.model_accessor)
+            with self.assertRaises(Exception) as e:
+                step.handle_update(self.service)
+            self.assertEqual(e.exception.message, "failed to update 1 instances of service 1000")
+
+            # The fingerprint was not recorded, so the retry tries again
+            from fingerprints import service_fingerprints
+            self.assertEqual(len(service_fingerprints), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,6 +24,11 @@ from mock import patch, PropertyMock, ANY, MagicMock
 from unit_test_common import setup_sync_unit_test
 
 
+def filter_by_ids_in_memory(manager, attr, ids):
+    # The mock model accessor only filters on exact values
+    return [obj for obj in manager.all() if getattr(obj, attr) in ids]
+
+
 class TestSimpleExampleServiceInstancePolicy(unittest.TestCase):
 
     def setUp(self):
@@ -35,10 +40,28 @@ class TestSimpleExampleServiceInstancePolicy(unittest.TestCase):
         self.MockObjectList = self.unittest_setup["MockObjectList"]
         self.model_accessor = self.unittest_setup["model_accessor"]
 
+        sys.path.append(os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))), ".."))
         sys.path.append(os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))), "../model_policies"))
 
         from model_policy_simpleexampleserviceinstance import SimpleExampleServiceInstancePolicy
         self.policy_class = SimpleExampleServiceInstancePolicy
+        self.policy_class.reconcile_on_first_update = False
+        self.policy_class.shared_config_maps = False
+
+        from fingerprints import index_fingerprints
+        self.index_fingerprints = index_fingerprints
+        self.index_fingerprints.clear()
+
+        from secret_data import secret_fingerprints
+        secret_fingerprints.clear()
+
+        from lookup_cache import service_lookups
+        self.service_lookups = service_lookups
+        self.service_lookups.clear()
+
+        from fragment_cache import embedded_image_lists, index_fragments
+        index_fragments.clear()
+        embedded_image_lists.clear()
 
         self.service = SimpleExampleService(service_message="hello", service_secret="p@ssw0rd")
         self.k8s_service = KubernetesService(id=1111)
@@ -110,6 +133,161 @@ class TestSimpleExampleServiceInstancePolicy(unittest.TestCase):
             self.assertEqual(saved_sec_mnt.secret, saved_sec)
             self.assertEqual(saved_sec_mnt.service_instance, saved_ksi)
 
+    def test_policy_create_cached_lookups(self):
+        with patch.object(KubernetesService.objects, "get_items") as k8s_service_objects, \
+                patch.object(Service.objects, "get_items") as service_objects, \
+                patch.object(KubernetesServiceInstance, "save", autospec=True) as ksi_save, \
+                patch.object(KubernetesConfigMap, "save", autospec=True), \
+                patch.object(KubernetesConfigVolumeMount, "save", autospec=True), \
+                patch.object(KubernetesSecret, "save", autospec=True), \
+                patch.object(KubernetesSecretVolumeMount, "save", autospec=True):
+            k8s_service_objects.return_value = [self.k8s_service]
+            service_objects.return_value = [self.k8s_service, self.service]
+
+            step = self.policy_class(model_accessor=self.model_accessor)
+
+            for id in [1112, 1113]:
+                si = SimpleExampleServiceInstance(name="test-simple-instance-%d" % id,
+                                                  id=id,
+                                                  owner=self.service, tenant_message="world", tenant_secret="l3tm31n")
+                si.embedded_images = self.MockObjectList([])
+                step.handle_create(si)
+
+            # The second create should have been served from the cache
+            self.assertEqual(k8s_service_objects.call_count, 1)
+            self.assertEqual(self.service_lookups.stats()["hits"], 1)
+            self.assertEqual(self.service_lookups.stats()["misses"], 1)
+            self.assertEqual(ksi_save.call_count, 4)
+            self.assertEqual(ksi_save.call_args[0][0].slice, self.slice)
+            self.assertEqual(ksi_save.call_args[0][0].image, self.image)
+
+    def test_policy_create_rollback(self):
+        with patch.object(KubernetesService.objects, "get_items") as k8s_service_objects, \
+                patch.object(Service.objects, "get_items") as service_objects, \
+                patch.object(KubernetesServiceInstance, "save", autospec=True) as ksi_save, \
+                patch.object(KubernetesServiceInstance, "delete", autospec=True) as ksi_delete, \
+                patch.object(KubernetesConfigMap, "save", autospec=True) as kcfm_save, \
+                patch.object(KubernetesConfigMap, "delete", autospec=True) as kcfm_delete, \
+                patch.object(KubernetesConfigVolumeMount, "save", autospec=True) as kcfm_mnt_save, \
+                patch.object(KubernetesConfigVolumeMount, "delete", autospec=True) as kcfm_mnt_delete, \
+                patch.object(KubernetesSecret, "save", autospec=True) as ksec_save, \
+                patch.object(KubernetesSecretVolumeMount, "save", autospec=True) as ksec_mnt_save:
+            k8s_service_objects.return_value = [self.k8s_service]
+            service_objects.return_value = [self.k8s_service, self.service]
+            ksec_save.side_effect = Exception("core is unavailable")
+
+            si = SimpleExampleServiceInstance(name="test-simple-instance",
+                                              id=1112,
+                                              owner=self.service, tenant_message="world", tenant_secret="l3tm31n")
+            si.embedded_images = self.MockObjectList([])
+
+            step = self.policy_class(model_accessor=self.model_accessor)
+
+            with self.assertRaises(Exception):
+                step.handle_create(si)
+
+            # Everything that was created before the failing save should have been deleted again
+            self.assertEqual(ksi_delete.call_count, 1)
+            self.assertEqual(ksi_delete.call_args[0][0], ksi_save.call_args[0][0])
+            self.assertEqual(kcfm_delete.call_count, 1)
+            self.assertEqual(kcfm_delete.call_args[0][0], kcfm_save.call_args[0][0])
+            self.assertEqual(kcfm_mnt_delete.call_count, 1)
+            self.assertEqual(kcfm_mnt_delete.call_args[0][0], kcfm_mnt_save.call_args[0][0])
+
+            # The failure happened before the secret mount and the no_sync flip
+            self.assertEqual(ksec_mnt_save.call_count, 0)
+            self.assertEqual(ksi_save.call_count, 1)
+
+    def test_policy_create_shared_config_map(self):
+        with patch.object(KubernetesService.objects, "get_items") as k8s_service_objects, \
+                patch.object(Service.objects, "get_items") as service_objects, \
+                patch.object(KubernetesConfigMap.objects, "get_items") as kcfm_objects, \
+                patch.object(KubernetesServiceInstance, "save", autospec=True), \
+                patch.object(KubernetesConfigMap, "save", autospec=True) as kcfm_save, \
+                patch.object(KubernetesConfigVolumeMount, "save", autospec=True) as kcfm_mnt_save, \
+                patch.object(KubernetesSecret, "save", autospec=True), \
+                patch.object(KubernetesSecretVolumeMount, "save", autospec=True):
+            from shared_config import shared_config_map_name
+
+            k8s_service_objects.return_value = [self.k8s_service]
+            service_objects.return_value = [self.k8s_service, self.service]
+            self.policy_class.shared_config_maps = True
+
+            si = SimpleExampleServiceInstance(name="test-simple-instance",
+                                              id=1112,
+                                              owner=self.service, tenant_message="world", tenant_secret="l3tm31n")
+            si.embedded_images = self.MockObjectList([])
+
+            step = self.policy_class(model_accessor=self.model_accessor)
+
+            desired_data = json.dumps({"index.html": step.render_index(si)})
+
+            # Another instance already renders the same page
+            shared_cfm = KubernetesConfigMap(id=3000, trust_domain=self.trust_domain,
+                                             trust_domain_id=self.trust_domain.id,
+                                             name=shared_config_map_name(desired_data), data=desired_data)
+            kcfm_objects.return_value = [shared_cfm]
+
+            step.handle_create(si)
+
+            # The existing config map is mounted rather than a new one created
+            self.assertEqual(kcfm_save.call_count, 0)
+            self.assertEqual(kcfm_mnt_save.call_count, 1)
+            self.assertEqual(kcfm_mnt_save.call_args[0][0].config, shared_cfm)
+
+    def test_policy_update_shared_config_map(self):
+        with patch.object(KubernetesConfigMap.objects, "get_items") as kcfm_objects, \
+                patch.object(KubernetesConfigVolumeMount.objects, "get_items") as kcfm_mnt_objects, \
+                patch.object(KubernetesServiceInstance, "save", autospec=True) as ksi_save, \
+                patch.object(KubernetesConfigMap, "save", autospec=True) as kcfm_save, \
+                patch.object(KubernetesConfigMap, "delete", autospec=True) as kcfm_delete, \
+                patch.object(KubernetesConfigVolumeMount, "save", autospec=True) as kcfm_mnt_save:
+            from shared_config import shared_config_map_name
+
+            self.policy_class.shared_config_maps = True
+
+            si = SimpleExampleServiceInstance(name="test-simple-instance",
+                                              id=1112,
+                                              owner=self.service, tenant_message="world", tenant_secret="l3tm31n")
+            si.embedded_images = self.MockObjectList([])
+
+            ksi = KubernetesServiceInstance(owner=self.k8s_service, slice=self.slice, image=self.image,
+                                            name="simpleexampleserviceinstance-1112")
+
+            old_cfm = KubernetesConfigMap(id=3000, trust_domain=self.trust_domain,
+                                          trust_domain_id=self.trust_domain.id,
+                                          name=shared_config_map_name("old page"), data="old page")
+
+            cfm_mnt = KubernetesConfigVolumeMount(config=old_cfm, config_id=old_cfm.id, service_instance=ksi)
+
+            si.compute_instance = ksi
+            ksi.kubernetes_config_volume_mounts = self.MockObjectList([cfm_mnt])
+
+            # No config map holds the new page yet, and nothing else mounts the old one
+            kcfm_objects.return_value = [old_cfm]
+            kcfm_mnt_objects.return_value = []
+
+            step = self.policy_class(model_accessor=self.model_accessor)
+
+            desired_data = json.dumps({"index.html": step.render_index(si)})
+
+            step.handle_update(si)
+
+            # A new config map is created, and the old one is not modified
+            self.assertEqual(kcfm_save.call_count, 1)
+            saved_cfm = kcfm_save.call_args[0][0]
+            self.assertEqual(saved_cfm.name, shared_config_map_name(desired_data))
+            self.assertEqual(saved_cfm.data, desired_data)
+            self.assertEqual(old_cfm.data, "old page")
+
+            # The mount is moved to the new config map and the old one is garbage collected
+            self.assertEqual(kcfm_mnt_save.call_count, 1)
+            self.assertEqual(cfm_mnt.config, saved_cfm)
+            self.assertEqual(kcfm_delete.call_count, 1)
+            self.assertEqual(kcfm_delete.call_args[0][0], old_cfm)
+
+            self.assertEqual(ksi_save.call_count, 1)
+
     def test_policy_update(self):
         with patch.object(KubernetesService.objects, "get_items") as k8s_service_objects, \
                 patch.object(Service.objects, "get_items") as service_objects, \
@@ -195,6 +373,162 @@ class TestSimpleExampleServiceInstancePolicy(unittest.TestCase):
             self.assertEqual(ksec_save.call_count, 0)
             self.assertEqual(ksec_mnt_save.call_count, 0)
 
+    def test_policy_update_unchanged_fingerprint(self):
+        with patch.object(KubernetesServiceInstance, "save", autospec=True) as ksi_save, \
+                patch.object(KubernetesConfigMap, "save", autospec=True) as kcfm_save:
+            si = SimpleExampleServiceInstance(name="test-simple-instance",
+                                              id=1112,
+                                              owner=self.service, tenant_message="world", tenant_secret="l3tm31n")
+            si.embedded_images = self.MockObjectList([])
+
+            ksi = KubernetesServiceInstance(owner=self.k8s_service, slice=self.slice, image=self.image,
+                                            name="simpleexampleserviceinstance-1112")
+
+            cfm = KubernetesConfigMap(trust_domain=self.trust_domain, name="simpleexampleserviceinstance-map-1112",
+                                      data="junk")
+
+            cfm_mnt = KubernetesConfigVolumeMount(config=cfm, service_instance=ksi)
+
+            si.compute_instance = ksi
+            ksi.kubernetes_config_volume_mounts = MagicMock(wraps=self.MockObjectList([cfm_mnt]))
+
+            step = self.policy_class(model_accessor=self.model_accessor)
+
+            step.handle_update(si)
+            self.assertEqual(kcfm_save.call_count, 1)
+            self.assertEqual(ksi.kubernetes_config_volume_mounts.first.call_count, 1)
+
+            # Nothing changed, so the config map should not even be fetched
+            step.handle_update(si)
+            self.assertEqual(kcfm_save.call_count, 1)
+            self.assertEqual(ksi_save.call_count, 1)
+            self.assertEqual(ksi.kubernetes_config_volume_mounts.first.call_count, 1)
+
+            # Changing the tenant message causes the config map to be rewritten
+            si.tenant_message = "earth"
+            step.handle_update(si)
+            self.assertEqual(kcfm_save.call_count, 2)
+            self.assertEqual(ksi_save.call_count, 2)
+            self.assertIn("earth", json.loads(cfm.data)["index.html"])
+
+    def test_policy_update_secret(self):
+        with patch.object(KubernetesSecretVolumeMount.objects, "get_items") as ksec_mnt_objects, \
+                patch.object(KubernetesServiceInstance, "save", autospec=True) as ksi_save, \
+                patch.object(KubernetesConfigMap, "save", autospec=True) as kcfm_save, \
+                patch.object(KubernetesSecret, "save", autospec=True) as ksec_save:
+            si = SimpleExampleServiceInstance(name="test-simple-instance",
+                                              id=1112,
+                                              owner=self.service, tenant_message="world", tenant_secret="l3tm31n")
+            si.embedded_images = self.MockObjectList([])
+
+            step = self.policy_class(model_accessor=self.model_accessor)
+
+            ksi = KubernetesServiceInstance(id=1113, owner=self.k8s_service, slice=self.slice, image=self.image,
+                                            name="simpleexampleserviceinstance-1112")
+            cfm = KubernetesConfigMap(trust_domain=self.trust_domain, name="simpleexampleserviceinstance-map-1112",
+                                      data=json.dumps({"index.html": step.render_index(si)}))
+            cfm_mnt = KubernetesConfigVolumeMount(config=cfm, service_instance=ksi)
+            secret = KubernetesSecret(trust_domain=self.trust_domain, name="simpleexampleserviceinstance-secret-1112",
+                                      data="old")
+            secret_mnt = KubernetesSecretVolumeMount(secret=secret, service_instance=ksi, service_instance_id=ksi.id)
+
+            si.compute_instance = ksi
+            ksi.kubernetes_config_volume_mounts = self.MockObjectList([cfm_mnt])
+            ksec_mnt_objects.return_value = [secret_mnt]
+
+            step.handle_update(si)
+
+            # The secret is rewritten, and the compute instance is left alone
+            self.assertEqual(ksec_save.call_count, 1)
+            secret_data = json.loads(secret.data)
+            self.assertEqual(base64.b64decode(secret_data["tenant_secret.txt"]), "l3tm31n")
+            self.assertEqual(kcfm_save.call_count, 0)
+            self.assertEqual(ksi_save.call_count, 0)
+
+            # Nothing changed, so the secret should not even be fetched
+            ksec_mnt_objects.reset_mock()
+            step.handle_update(si)
+            ksec_mnt_objects.assert_not_called()
+            self.assertEqual(ksec_save.call_count, 1)
+
+            # Rotating the tenant secret rewrites it
+            si.tenant_secret = "n3w-t3n4nt"
+            step.handle_update(si)
+            self.assertEqual(ksec_save.call_count, 2)
+            self.assertEqual(base64.b64decode(json.loads(secret.data)["tenant_secret.txt"]), "n3w-t3n4nt")
+
+    def test_reconcile_service(self):
+        with patch.object(SimpleExampleServiceInstance.objects, "get_items") as sesi_objects, \
+                patch.object(ColorNew.objects, "get_items") as color_objects, \
+                patch.object(EmbeddedImageNew.objects, "get_items") as image_objects, \
+                patch.object(KubernetesServiceInstance.objects, "get_items") as ksi_objects, \
+                patch.object(KubernetesConfigVolumeMount.objects, "get_items") as kcfm_mnt_objects, \
+                patch.object(KubernetesConfigMap.objects, "get_items") as kcfm_objects, \
+                patch.object(KubernetesServiceInstance, "save", autospec=True) as ksi_save, \
+                patch.object(KubernetesConfigMap, "save", autospec=True) as kcfm_save, \
+                patch("reconciler.filter_by_ids", side_effect=filter_by_ids_in_memory):
+            self.service.id = 1000
+            red = ColorNew(id=2000, name="red", html_code="#FF0000")
+            image = EmbeddedImageNew(id=3000, name="cat", url="http://example.com/cat.png", serviceinstance_id=1112)
+
+            step = self.policy_class(model_accessor=self.model_accessor)
+
+            instances = []
+            ksis = []
+            cfms = []
+            mounts = []
+            for (id, tenant_message) in [(1112, "world"), (1113, "earth"), (1114, "mars")]:
+                si = SimpleExampleServiceInstance(name="test-simple-instance-%d" % id, id=id, owner=self.service,
+                                                  owner_id=self.service.id, tenant_message=tenant_message,
+                                                  foreground_color_id=red.id)
+                instances.append(si)
+                if id == 1114:
+                    # no compute instance yet
+                    continue
+                ksi = KubernetesServiceInstance(id=id + 10000, owner=self.k8s_service,
+                                                name="simpleexampleserviceinstance-%d" % id)
+                ksis.append(ksi)
+                si.compute_instance_id = ksi.id
+                cfm = KubernetesConfigMap(id=id + 20000, trust_domain=self.trust_domain,
+                                          name="simpleexampleserviceinstance-map-%d" % id, data="junk")
+                cfms.append(cfm)
+                mounts.append(KubernetesConfigVolumeMount(config=cfm, config_id=cfm.id, service_instance=ksi,
+                                                          service_instance_id=ksi.id))
+
+            # The page of 1113 is already up to date
+            si = instances[1]
+            si.foreground_color = red
+            si.embedded_images = self.MockObjectList([])
+            cfms[1].data = json.dumps({"index.html": step.render_index(si)})
+
+            sesi_objects.return_value = instances
+            color_objects.return_value = [red]
+            image_objects.return_value = [image]
+            ksi_objects.return_value = ksis
+            kcfm_mnt_objects.return_value = mounts
+            kcfm_objects.return_value = cfms
+
+            counts = step.reconcile_service(self.service)
+
+            self.assertEqual(counts["instances"], 3)
+            self.assertEqual(counts["updated"], 1)
+            self.assertEqual(counts["unchanged"], 1)
+            self.assertEqual(counts["skipped"], 1)
+
+            self.assertEqual(kcfm_save.call_count, 1)
+            self.assertEqual(kcfm_save.call_args[0][0], cfms[0])
+            self.assertEqual(ksi_save.call_count, 1)
+            self.assertEqual(ksi_save.call_args[0][0], ksis[0])
+
+            page = json.loads(cfms[0].data)["index.html"]
+            self.assertIn("#FF0000", page)
+            self.assertIn("http://example.com/cat.png", page)
+
+            # Reconciling again finds everything up to date by fingerprint alone
+            counts = step.reconcile_service(self.service)
+            self.assertEqual(counts["unchanged"], 2)
+            self.assertEqual(kcfm_save.call_count, 1)
+
     def test_policy_delete(self):
         with patch.object(KubernetesServiceInstance, "delete", autospec=True) as ksi_delete, \
                 patch.object(SimpleExampleServiceInstance, "save", autospec=True) as sesi_save:
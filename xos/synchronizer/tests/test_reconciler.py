@@ -0,0 +1,151 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+from mock import MagicMock, patch
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+import reconciler
+from reconciler import Reconciler, filter_by_ids
+from secret_data import secret_digest, secret_fingerprints
+
+
+class FakeManager(object):
+    """ Just enough of an ORM manager for filter_by_ids: filter() on ranges """
+
+    def __init__(self, objs):
+        self.objs = objs
+        self.queries = []
+
+    def filter(self, **kwargs):
+        self.queries.append(kwargs)
+        objs = self.objs
+        for (name, value) in kwargs.items():
+            (attr, op) = name.split("__")
+            if op == "gte":
+                objs = [obj for obj in objs if getattr(obj, attr) >= value]
+            else:
+                objs = [obj for obj in objs if getattr(obj, attr) <= value]
+        return objs
+
+
+class TestFilterByIds(unittest.TestCase):
+
+    def test_filter_by_ids(self):
+        manager = FakeManager([MagicMock(id=id) for id in range(100)])
+        objs = filter_by_ids(manager, "id", [40, 12, None, 30])
+
+        self.assertEqual(sorted([obj.id for obj in objs]), [12, 30, 40])
+        self.assertEqual(manager.queries, [{"id__gte": 12, "id__lte": 40}])
+
+    def test_split_at_gaps(self):
+        manager = FakeManager([MagicMock(id=id) for id in range(1000)])
+        with patch.object(reconciler, "id_range_gap", 10):
+            objs = filter_by_ids(manager, "id", [5, 1, 12, 500, 990, 995])
+
+        self.assertEqual(sorted([obj.id for obj in objs]), [1, 5, 12, 500, 990, 995])
+        self.assertEqual(manager.queries, [{"id__gte": 1, "id__lte": 12}, {"id__gte": 500, "id__lte": 500},
+                                           {"id__gte": 990, "id__lte": 995}])
+
+    def test_no_ids(self):
+        manager = FakeManager([MagicMock(id=1)])
+        self.assertEqual(filter_by_ids(manager, "id", [None]), [])
+        self.assertEqual(manager.queries, [])
+
+
+class TestReconcileSecret(unittest.TestCase):
+
+    def setUp(self):
+        secret_fingerprints.clear()
+        self.service = MagicMock(service_secret="p@ssw0rd")
+        self.service_instance = MagicMock(id=1, tenant_secret="l3tm31n")
+        self.compute_instance = MagicMock(id=10)
+        self.secret = MagicMock(id=20, data="junk")
+        self.model_accessor = MagicMock()
+        self.model_accessor.KubernetesSecret.objects.filter.return_value = [self.secret]
+
+        self.reconciler = Reconciler(self.model_accessor)
+        self.reconciler.secret_mounts = {10: [MagicMock(secret_id=20)]}
+
+    def reconcile_secret(self):
+        batch = [(self.service_instance, self.compute_instance)]
+        secrets = self.reconciler.fetch_secrets(self.service, batch, False)
+        return self.reconciler.reconcile_secret(self.service, self.service_instance, self.compute_instance, False,
+                                                secrets)
+
+    def test_fetched_by_id_range(self):
+        self.reconcile_secret()()
+        self.model_accessor.KubernetesSecret.objects.filter.assert_called_once_with(id__gte=20, id__lte=20)
+        self.model_accessor.KubernetesSecret.objects.all.assert_not_called()
+        self.secret.save.assert_called_once_with(always_update_timestamp=True)
+        # Nothing keeps the secret once it has been compared
+        self.assertFalse(hasattr(self.reconciler, "secrets"))
+
+    def test_not_fetched_when_unchanged(self):
+        self.reconcile_secret()()
+        self.model_accessor.KubernetesSecret.objects.filter.reset_mock()
+        self.assertEqual(self.reconcile_secret(), None)
+        self.model_accessor.KubernetesSecret.objects.filter.assert_not_called()
+
+    def test_batches(self):
+        """ After a restart no digest is known, so every secret is fetched, a batch of instances at a time """
+        self.model_accessor.KubernetesSecret.objects.filter.side_effect = \
+            lambda id__gte, id__lte: [MagicMock(id=id, data="junk") for id in range(id__gte, id__lte + 1)]
+        self.reconciler.instances = [MagicMock(id=i, compute_instance_id=100 + i, tenant_secret="s%d" % i)
+                                     for i in range(5)]
+        self.reconciler.compute_instances = dict([(100 + i, MagicMock(id=100 + i)) for i in range(5)])
+        self.reconciler.secret_mounts = dict([(100 + i, [MagicMock(secret_id=200 + i)]) for i in range(5)])
+        self.reconciler.fetch = MagicMock()
+        self.reconciler.reconcile_page = MagicMock(return_value=None)
+
+        with patch.object(reconciler, "secret_fetch_size", 2):
+            counts = self.reconciler.reconcile(self.service, secrets=True)
+
+        self.assertEqual(counts["updated"], 5)
+        self.assertEqual([c[1] for c in self.model_accessor.KubernetesSecret.objects.filter.call_args_list],
+                         [{"id__gte": 200, "id__lte": 201}, {"id__gte": 202, "id__lte": 203},
+                          {"id__gte": 204, "id__lte": 204}])
+
+    def test_written_through_scheduler(self):
+        self.reconciler.instances = [self.service_instance]
+        self.service_instance.compute_instance_id = 10
+        self.reconciler.compute_instances = {10: self.compute_instance}
+        self.reconciler.fetch = MagicMock()
+        self.reconciler.reconcile_page = MagicMock(return_value=None)
+
+        with patch("reconciler.resync") as resync:
+            counts = self.reconciler.reconcile(self.service, secrets=True)
+
+        self.assertEqual(counts["updated"], 1)
+        self.secret.save.assert_not_called()
+        (args, kwargs) = resync.call_args
+        self.assertEqual(args, (self.compute_instance, reconciler.PRIORITY_BULK))
+        self.assertFalse(kwargs["touch"])
+        self.assertEqual([key for (key, write) in kwargs["writes"]], [("secret", 1)])
+
+        kwargs["writes"][0][1]()
+        self.secret.save.assert_called_once_with(always_update_timestamp=True)
+        self.assertTrue(secret_fingerprints.matches(1, secret_digest(self.secret.data)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import unittest
+from mock import MagicMock, patch
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+import resync_scheduler
+from metrics import registry
+from resync_scheduler import PRIORITY_BULK, PRIORITY_UPDATE, ResyncScheduler
+
+
+class TestResyncScheduler(unittest.TestCase):
+
+    def setUp(self):
+        registry.clear()
+        self.now = 1000.0
+        self.scheduler = ResyncScheduler(rate=2, burst=2, debounce=1.0, clock=lambda: self.now)
+
+    def make_instance(self, id):
+        return MagicMock(id=id)
+
+    def dispatched(self):
+        return [entry.compute_instance.id for entry in self.scheduler.dispatch()]
+
+    def test_debounce(self):
+        first = self.make_instance(1)
+        self.scheduler.request(first)
+        self.scheduler.request(self.make_instance(1))
+        self.assertEqual(self.dispatched(), [])
+        self.assertEqual(self.scheduler.wait_time(), 1.0)
+
+        self.now += 1.0
+        self.assertEqual(self.dispatched(), [1])
+        self.assertEqual(self.dispatched(), [])
+        self.assertEqual(registry.get("resyncs_debounced_total"), 1)
+
+    def test_rate_limit(self):
+        for id in range(5):
+            self.scheduler.request(self.make_instance(id))
+        self.now += 1.0
+        # the bucket starts full, with two tokens
+        self.assertEqual(self.dispatched(), [0, 1])
+        self.assertEqual(self.dispatched(), [])
+        self.assertEqual(self.scheduler.wait_time(), 0.5)
+        self.now += 0.5
+        self.assertEqual(self.dispatched(), [2])
+        self.now += 10
+        self.assertEqual(self.dispatched(), [3, 4])
+
+    def test_priority(self):
+        self.scheduler.request(self.make_instance(1), PRIORITY_BULK)
+        self.scheduler.request(self.make_instance(2), PRIORITY_BULK)
+        self.scheduler.request(self.make_instance(3), PRIORITY_BULK)
+        self.scheduler.request(self.make_instance(4), PRIORITY_UPDATE)
+        # raising the priority of a queued resync moves it ahead
+        self.scheduler.request(self.make_instance(3), PRIORITY_UPDATE)
+        self.now += 1.0
+        self.assertEqual(self.dispatched(), [3, 4])
+        self.assertEqual(self.scheduler.queue_depth(), {"new": 0, "update": 0, "bulk": 2})
+
+    def test_admit_takes_tokens_first(self):
+        self.scheduler.request(self.make_instance(1))
+        for i in range(4):
+            self.scheduler.admit()
+        self.now += 1.0
+        # the four new tenants used the two tokens and two more, which have refilled since
+        self.assertEqual(self.dispatched(), [])
+        self.now += 0.5
+        self.assertEqual(self.dispatched(), [1])
+
+    def test_failed_resync_is_retried(self):
+        instance = self.make_instance(1)
+        instance.save.side_effect = [Exception("failed"), None]
+        self.scheduler.request(instance)
+        self.now += 1.0
+        self.scheduler.resync(self.scheduler.dispatch()[0])
+        self.assertEqual(registry.get("resync_failures_total"), 1)
+
+        self.now += 1.0
+        self.scheduler.resync(self.scheduler.dispatch()[0])
+        instance.save.assert_called_with(update_fields=["updated"], always_update_timestamp=True)
+        self.assertEqual(registry.get("resyncs_total", priority="update"), 1)
+        self.assertEqual(self.scheduler.queue_depth()["update"], 0)
+
+    def test_writes_before_resync(self):
+        calls = []
+        instance = self.make_instance(1)
+        instance.save.side_effect = lambda **kwargs: calls.append("resync")
+        self.scheduler.request(instance, PRIORITY_BULK, writes=[("page", lambda: calls.append("old page"))])
+        self.scheduler.request(instance, PRIORITY_BULK, writes=[("page", lambda: calls.append("page")),
+                                                                ("secret", lambda: calls.append("secret"))])
+        self.assertEqual(calls, [])
+
+        self.now += 1.0
+        self.scheduler.resync(self.scheduler.dispatch()[0])
+        self.assertEqual(calls, ["page", "secret", "resync"])
+
+    def test_writes_without_resync(self):
+        instance = self.make_instance(1)
+        write = MagicMock()
+        self.scheduler.request(instance, PRIORITY_BULK, writes=[("secret", write)], touch=False)
+        self.now += 1.0
+        self.scheduler.resync(self.scheduler.dispatch()[0])
+        write.assert_called_once_with()
+        instance.save.assert_not_called()
+
+    def test_failed_write_is_retried(self):
+        instance = self.make_instance(1)
+        page = MagicMock()
+        secret = MagicMock(side_effect=[Exception("failed"), None])
+        self.scheduler.request(instance, PRIORITY_BULK, writes=[("page", page), ("secret", secret)])
+        self.now += 1.0
+        self.scheduler.resync(self.scheduler.dispatch()[0])
+        instance.save.assert_not_called()
+
+        self.now += 1.0
+        self.scheduler.resync(self.scheduler.dispatch()[0])
+        self.assertEqual(page.call_count, 1)
+        self.assertEqual(secret.call_count, 2)
+        self.assertEqual(instance.save.call_count, 1)
+
+    def test_shutdown_drains_queue(self):
+        instances = [self.make_instance(id) for id in range(5)]
+        for instance in instances:
+            self.scheduler.request(instance)
+        self.assertTrue(self.scheduler.shutdown(timeout=10))
+        for instance in instances:
+            self.assertEqual(instance.save.call_count, 1)
+
+    def test_resync_without_scheduler(self):
+        instance = self.make_instance(1)
+        with patch.object(resync_scheduler, "rate", None):
+            resync_scheduler.resync(instance)
+        instance.save.assert_called_with(always_update_timestamp=True)
+
+    def test_writes_without_scheduler(self):
+        instance = self.make_instance(1)
+        write = MagicMock()
+        with patch.object(resync_scheduler, "rate", None):
+            resync_scheduler.resync(instance, writes=[("secret", write)], touch=False)
+        write.assert_called_once_with()
+        instance.save.assert_not_called()
+
+    def test_resync_with_scheduler(self):
+        instance = self.make_instance(1)
+        with patch.object(resync_scheduler, "rate", 100), patch.object(resync_scheduler, "debounce", 0):
+            try:
+                resync_scheduler.resync(instance)
+                scheduler = resync_scheduler.get_resync_scheduler()
+                collected = dict([(labels["priority"], value) for (name, labels, value) in scheduler.collect()])
+                self.assertEqual(sorted(collected.keys()), ["bulk", "new", "update"])
+                deadline = time.time() + 5
+                # call_args is set after called, from the scheduler's thread
+                while (instance.save.call_args is None) and (time.time() < deadline):
+                    time.sleep(0.01)
+            finally:
+                resync_scheduler.reset_resync_scheduler()
+        instance.save.assert_called_with(update_fields=["updated"], always_update_timestamp=True)
+
+
+    def test_start_from_config(self):
+        resync_config = {"rate": 5, "burst": 3, "debounce": 0.5}
+        with patch.object(resync_scheduler, "rate", None), patch.object(resync_scheduler, "burst", 10), \
+                patch.object(resync_scheduler, "debounce", 2.0), \
+                patch("resync_scheduler.Config.get", return_value=resync_config):
+            try:
+                scheduler = resync_scheduler.start_from_config()
+                self.assertEqual((scheduler.rate, scheduler.burst, scheduler.debounce), (5.0, 3, 0.5))
+            finally:
+                resync_scheduler.reset_resync_scheduler()
+
+    def test_start_from_config_disabled(self):
+        with patch.object(resync_scheduler, "rate", None):
+            self.assertEqual(resync_scheduler.start_from_config(), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import hashlib
+import json
+import os
+import sys
+import unittest
+from mock import MagicMock
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+from metrics import registry
+from secret_data import make_secret_data, secret_digest, write_secret
+
+
+class TestSecretData(unittest.TestCase):
+
+    def setUp(self):
+        registry.clear()
+        self.service = MagicMock(service_secret="p@ssw0rd")
+        self.service_instance = MagicMock(tenant_secret="l3tm31n")
+
+    def test_make_secret_data(self):
+        data = json.loads(make_secret_data(self.service, self.service_instance))
+        self.assertEqual(base64.b64decode(data["service_secret.txt"]), "p@ssw0rd")
+        self.assertEqual(base64.b64decode(data["tenant_secret.txt"]), "l3tm31n")
+
+    def test_secret_digest(self):
+        self.assertEqual(secret_digest("l3tm31n"), secret_digest(u"l3tm31n"))
+        self.assertNotEqual(secret_digest("l3tm31n"), secret_digest("l3tm31m"))
+        # The digest is keyed, so it can't be checked against a plain hash of a guessed secret
+        self.assertNotEqual(secret_digest("l3tm31n"), hashlib.sha256("l3tm31n").hexdigest())
+
+    def test_write_secret(self):
+        data = make_secret_data(self.service, self.service_instance)
+        secret = MagicMock(data=data)
+        self.assertFalse(write_secret(secret, data))
+        secret.save.assert_not_called()
+
+        self.service_instance.tenant_secret = "n3w-t3n4nt"
+        new_data = make_secret_data(self.service, self.service_instance)
+        self.assertTrue(write_secret(secret, new_data))
+        self.assertEqual(secret.data, new_data)
+        secret.save.assert_called_once_with(always_update_timestamp=True)
+        self.assertEqual(registry.get("secret_writes_total"), 1)
+
+    def test_write_empty_secret(self):
+        secret = MagicMock(data=None)
+        self.assertTrue(write_secret(secret, "{}"))
+        self.assertEqual(secret.data, "{}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+from sharded_executor import ShardedExecutor
+
+
+class TestShardedExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ShardedExecutor(4, queue_size=5)
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.executor.shutdown(timeout=10)
+
+    def record(self, key, value):
+        # sleep a little so that out-of-order execution would be visible
+        time.sleep(0.001)
+        with self.lock:
+            self.results.setdefault(key, []).append(value)
+
+    def test_order_per_key(self):
+        for i in range(20):
+            for key in ["a", "b", "c"]:
+                self.executor.submit(key, self.record, key, i)
+        self.assertTrue(self.executor.shutdown(timeout=10))
+        for key in ["a", "b", "c"]:
+            self.assertEqual(self.results[key], list(range(20)))
+
+    def test_same_key_same_shard(self):
+        self.assertEqual(self.executor.shard(u"instance1"), self.executor.shard("instance1"))
+
+    def test_exception_does_not_stop_worker(self):
+        def fail():
+            raise Exception("failed")
+        self.executor.submit("a", fail)
+        self.executor.submit("a", self.record, "a", 1)
+        self.assertTrue(self.executor.shutdown(timeout=10))
+        self.assertEqual(self.results["a"], [1])
+
+    def test_shutdown_with_full_queue(self):
+        blocked = threading.Event()
+        key = "a"
+        self.executor.submit(key, blocked.wait)
+        # The worker is busy, so its queue fills up and there is no room left for the stop sentinel
+        for i in range(5):
+            self.executor.submit(key, self.record, key, i)
+
+        start = time.time()
+        self.assertFalse(self.executor.shutdown(timeout=0.2))
+        self.assertTrue(time.time() - start < 5)
+
+        blocked.set()
+        self.assertTrue(self.executor.shutdown(timeout=10))
+        self.assertEqual(self.results[key], list(range(5)))
+
+    def test_submit_after_shutdown(self):
+        self.executor.shutdown(timeout=10)
+        with self.assertRaises(Exception):
+            self.executor.submit("a", self.record, "a", 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from mock import MagicMock
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+import sharding
+from metrics import registry
+from sharding import FileLockCoordinator, HashRing, MemoryCoordinator, Shard
+
+KEYS = ["instance:%d" % i for i in range(4000)]
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHashRing(unittest.TestCase):
+
+    def test_balance(self):
+        ring = HashRing(["a", "b", "c", "d"])
+        counts = {}
+        for key in KEYS:
+            counts[ring.owner(key)] = counts.get(ring.owner(key), 0) + 1
+        self.assertEqual(sorted(counts.keys()), ["a", "b", "c", "d"])
+        for count in counts.values():
+            self.assertTrue(600 < count < 1400, counts)
+
+    def test_join_moves_keys_only_to_the_new_member(self):
+        before = HashRing(["a", "b", "c", "d"])
+        after = HashRing(["a", "b", "c", "d", "e"])
+        moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+        self.assertTrue(all([after.owner(key) == "e" for key in moved]))
+        self.assertTrue(400 < len(moved) < 1200, len(moved))
+
+    def test_leave_moves_only_the_keys_of_the_member(self):
+        before = HashRing(["a", "b", "c", "d"])
+        after = HashRing(["a", "b", "d"])
+        for key in KEYS:
+            if before.owner(key) != "c":
+                self.assertEqual(before.owner(key), after.owner(key))
+
+    def test_unicode_key(self):
+        ring = HashRing(["a", "b"])
+        self.assertEqual(ring.owner(u"name:caf\xe9"), ring.owner(u"name:caf\xe9".encode("utf-8")))
+
+    def test_empty(self):
+        self.assertEqual(HashRing([]).owner("instance:1"), None)
+
+
+class TestFileLockCoordinator(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_members(self):
+        first = FileLockCoordinator(self.dir)
+        second = FileLockCoordinator(self.dir)
+        first.join("a")
+        second.join("b")
+        self.assertEqual(first.members(), ["a", "b"])
+
+        with self.assertRaises(Exception):
+            FileLockCoordinator(self.dir).join("a")
+
+        second.leave("b")
+        self.assertEqual(first.members(), ["a"])
+
+    def test_dead_member(self):
+        # A member in another process that exits without leaving. It locks its file as FileLockCoordinator.join
+        # does; importing sharding there would need the config.
+        path = os.path.join(self.dir, "b" + FileLockCoordinator.SUFFIX)
+        child = subprocess.Popen([sys.executable, "-c",
+                                  "import fcntl, sys; f = open(%r, 'a'); fcntl.flock(f.fileno(), fcntl.LOCK_EX); "
+                                  "sys.stdout.write('joined\\n'); sys.stdout.flush(); sys.stdin.read()" % path],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            self.assertEqual(child.stdout.readline().strip(), "joined")
+            coordinator = FileLockCoordinator(self.dir)
+            coordinator.join("a")
+            self.assertEqual(coordinator.members(), ["a", "b"])
+        finally:
+            child.stdin.close()
+            child.wait()
+
+        self.assertEqual(coordinator.members(), ["a"])
+        # The name of the dead member can be taken again
+        FileLockCoordinator(self.dir).join("b")
+
+
+class TestShard(unittest.TestCase):
+
+    def setUp(self):
+        registry.clear()
+        self.clock = Clock()
+        self.coordinator = MemoryCoordinator()
+
+    def make_shard(self, member, handoff=0):
+        shard = Shard(self.coordinator, member, refresh_interval=5, handoff=handoff, clock=self.clock)
+        shard.start()
+        return shard
+
+    def owned(self, shard):
+        return set([key for key in KEYS if shard.owns(key)])
+
+    def test_partition(self):
+        shards = [self.make_shard(member) for member in ["a", "b", "c"]]
+        for shard in shards:
+            shard.refresh(force=True)
+        owned = [self.owned(shard) for shard in shards]
+        self.assertEqual(sum([len(keys) for keys in owned]), len(KEYS))
+        self.assertEqual(set.union(*owned), set(KEYS))
+
+    def test_rebalance(self):
+        a = self.make_shard("a")
+        listener = MagicMock()
+        a.add_listener(listener)
+        self.assertEqual(self.owned(a), set(KEYS))
+
+        b = self.make_shard("b")
+        # Not noticed until the next refresh
+        self.assertEqual(self.owned(a), set(KEYS))
+        self.clock.now += 5
+        owned_a = self.owned(a)
+        self.assertEqual(owned_a | self.owned(b), set(KEYS))
+        self.assertEqual(owned_a & self.owned(b), set())
+        listener.assert_called_once_with()
+        self.assertEqual(registry.get("shard_rebalances_total"), 1)
+
+        b.stop()
+        self.clock.now += 5
+        self.assertEqual(self.owned(a), set(KEYS))
+
+    def test_handoff(self):
+        a = self.make_shard("a", handoff=10)
+        b = self.make_shard("b", handoff=10)
+        self.clock.now += 5
+        # a keeps the keys it had before b joined until the handoff is over, b takes its keys at once
+        self.assertEqual(self.owned(a), set(KEYS))
+        self.assertTrue(0 < len(self.owned(b)) < len(KEYS))
+        self.clock.now += 10
+        self.assertEqual(self.owned(a) & self.owned(b), set())
+
+    def test_exclusive(self):
+        a = self.make_shard("a", handoff=2)
+        # A new replica waits for the others to notice it before it creates anything
+        self.assertEqual(set([key for key in KEYS if a.owns(key, exclusive=True)]), set())
+        self.clock.now += 5
+        self.assertEqual(set([key for key in KEYS if a.owns(key, exclusive=True)]), set(KEYS))
+
+        b = self.make_shard("b", handoff=2)
+        moved = self.owned(b)
+        self.clock.now += 5
+        # a noticed b now, and hands over the moved keys for updates only; b does not create them yet
+        exclusive_a = set([key for key in KEYS if a.owns(key, exclusive=True)])
+        self.assertEqual(exclusive_a, set(KEYS) - moved)
+        self.assertEqual(self.owned(a), set(KEYS))
+        self.assertEqual(set([key for key in KEYS if b.owns(key, exclusive=True)]), moved)
+        for key in KEYS:
+            self.assertFalse(a.owns(key, exclusive=True) and b.owns(key, exclusive=True))
+
+    def test_exclusive_waits_for_refresh(self):
+        self.make_shard("a", handoff=0)
+        self.clock.now += 5
+        b = self.make_shard("b", handoff=0)
+        # a has not refreshed yet and still owns every key, so b must not create any of them
+        self.clock.now += 1
+        self.assertEqual(set([key for key in KEYS if b.owns(key, exclusive=True)]), set())
+        self.clock.now += 4
+        self.assertTrue(set([key for key in KEYS if b.owns(key, exclusive=True)]))
+
+    def test_rejoin(self):
+        a = self.make_shard("a")
+        self.coordinator.leave("a")
+        self.clock.now += 5
+        self.assertTrue(a.owns("instance:1"))
+        self.assertEqual(self.coordinator.members(), ["a"])
+
+
+class TestShardingDisabled(unittest.TestCase):
+
+    def tearDown(self):
+        sharding.set_shard(None)
+
+    def test_disabled(self):
+        self.assertEqual(sharding.start_from_config(), None)
+        self.assertTrue(sharding.owns_instance(1))
+        self.assertTrue(sharding.owns_instance_name("one"))
+
+    def test_owns_object(self):
+        coordinator = MemoryCoordinator()
+        coordinator.join("other")
+        shard = Shard(coordinator, "mine", handoff=0)
+        shard.start()
+        sharding.set_shard(shard)
+
+        ids = [id for id in range(100) if not sharding.owns_instance(id)]
+        self.assertTrue(ids)
+        instance = MagicMock(id=ids[0])
+        image = MagicMock(serviceinstance_id=ids[0])
+        self.assertFalse(sharding.owns_object("SimpleExampleServiceInstance", instance))
+        self.assertFalse(sharding.owns_object("EmbeddedImageNew", image))
+        self.assertTrue(sharding.owns_object("ColorNew", MagicMock()))
+        self.assertTrue(sharding.needs_exclusive("SimpleExampleServiceInstance", instance, "create"))
+        self.assertFalse(sharding.needs_exclusive("SimpleExampleServiceInstance", instance, "update"))
+        self.assertTrue(sharding.needs_exclusive("SimpleExampleServiceInstance",
+                                                 MagicMock(compute_instance_id=None), "update"))
+
+        execute = MagicMock()
+        sharded_execute = sharding.make_sharded_execute_model_policy(execute)
+        sharded_execute("engine", MagicMock(id=ids[0], model_name="SimpleExampleServiceInstance"), "update")
+        self.assertFalse(execute.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
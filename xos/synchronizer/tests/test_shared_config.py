@@ -0,0 +1,97 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+from mock import MagicMock, patch
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+from shared_config import CONFIG_MAP_NAME, SharedConfigMaps, shared_config_map_name
+
+
+class TestSharedConfigMaps(unittest.TestCase):
+
+    def setUp(self):
+        self.model_accessor = MagicMock()
+        self.model_accessor.KubernetesConfigMap.objects.filter.return_value = []
+        self.model_accessor.KubernetesConfigVolumeMount.objects.filter.return_value = []
+        self.shared = SharedConfigMaps(self.model_accessor)
+
+    def owned(self, owned):
+        return patch("sharding.owns_shared_config_map", return_value=owned)
+
+    def test_acquire(self):
+        with self.owned(True):
+            config = self.shared.acquire(1, "page")
+            self.assertEqual(self.shared.acquire(1, "page"), config)
+        self.model_accessor.KubernetesConfigMap.assert_called_once_with(name=shared_config_map_name("page"),
+                                                                        trust_domain_id=1, data="page")
+        config.save.assert_called_once_with()
+
+    def test_acquire_owned_by_another_replica(self):
+        with self.owned(False):
+            self.assertEqual(self.shared.acquire(1, "page"), None)
+        self.model_accessor.KubernetesConfigMap.objects.filter.assert_not_called()
+        self.model_accessor.KubernetesConfigMap.assert_not_called()
+
+    def test_release_owned_by_another_replica(self):
+        config = MagicMock(trust_domain_id=1)
+        config.name = shared_config_map_name("page")
+        with self.owned(False):
+            self.assertFalse(self.shared.release(config))
+        config.delete.assert_not_called()
+
+    def test_update_mount(self):
+        mount = MagicMock()
+        config = MagicMock(trust_domain_id=1)
+        config.name = shared_config_map_name("old page")
+        with self.owned(True):
+            self.assertTrue(self.shared.update_mount(mount, config, "page", 7))
+        self.assertEqual(mount.config, self.model_accessor.KubernetesConfigMap.return_value)
+        mount.save.assert_called_once_with(update_fields=["config"], always_update_timestamp=True)
+        config.delete.assert_called_once_with()
+
+    def test_update_mount_owned_by_another_replica(self):
+        # The instance gets a config map of its own, and the shared one is left to its owner
+        mount = MagicMock()
+        config = MagicMock(trust_domain_id=1)
+        config.name = shared_config_map_name("old page")
+        with self.owned(False):
+            self.assertTrue(self.shared.update_mount(mount, config, "page", 7))
+        self.model_accessor.KubernetesConfigMap.assert_called_once_with(name=CONFIG_MAP_NAME % 7, trust_domain_id=1,
+                                                                        data="page")
+        self.assertEqual(mount.config, self.model_accessor.KubernetesConfigMap.return_value)
+        config.delete.assert_not_called()
+
+    def test_update_own_config_map_owned_by_another_replica(self):
+        mount = MagicMock()
+        config = MagicMock(trust_domain_id=1, data="old page")
+        config.name = CONFIG_MAP_NAME % 7
+        with self.owned(False):
+            self.assertTrue(self.shared.update_mount(mount, config, "page", 7))
+            self.assertFalse(self.shared.update_mount(mount, config, "page", 7))
+        self.assertEqual(config.data, "page")
+        config.save.assert_called_once_with(always_update_timestamp=True)
+        mount.save.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
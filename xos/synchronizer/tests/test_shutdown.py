@@ -0,0 +1,92 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import unittest
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+import shutdown
+
+# Stands in for the synchronizer: a thread that never ends, like the policy engine's, and two components that
+# drain on exit
+CHILD = """
+import os, sys, threading, time
+sys.path.append(%(synchronizer_dir)r)
+from xosconfig import Config
+Config.init(%(config)r, "synchronizer-config-schema.yaml")
+import shutdown
+
+def drain(name):
+    with open(%(output)r, "a") as f:
+        f.write(name + "\\n")
+
+shutdown.install()
+shutdown.register(drain, "first")
+shutdown.register(drain, "second")
+threading.Thread(target=lambda: time.sleep(1000)).start()
+sys.stdout.write("ready\\n")
+sys.stdout.flush()
+time.sleep(1000)
+"""
+
+
+class TestShutdown(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        del shutdown.handlers[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_sigterm(self):
+        output = os.path.join(self.dir, "drained")
+        script = CHILD % {"synchronizer_dir": os.path.join(test_path, ".."),
+                          "config": os.path.join(test_path, "test_config.yaml"),
+                          "output": output}
+        child = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE)
+        try:
+            self.assertEqual(child.stdout.readline().strip(), "ready")
+            child.send_signal(signal.SIGTERM)
+            self.assertEqual(child.wait(), 0)
+        finally:
+            if child.poll() is None:
+                child.kill()
+                child.wait()
+
+        with open(output) as f:
+            self.assertEqual(f.read().split(), ["second", "first"])
+
+    def test_run_once(self):
+        calls = []
+        shutdown.register(calls.append, 1)
+        shutdown.register(lambda: 1 / 0)
+        shutdown.run()
+        shutdown.run()
+        self.assertEqual(calls, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from mock import MagicMock, patch
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+import snapshot
+from fingerprints import index_fingerprints
+from instance_index import service_instance_index
+from metrics import registry
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        index_fingerprints.clear()
+        service_instance_index.clear()
+        registry.clear()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "snapshot.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_instance(self, id, name):
+        obj = MagicMock(id=id)
+        obj.name = name
+        return obj
+
+    def test_round_trip(self):
+        index_fingerprints.set(1, "fp1", 1000.0)
+        index_fingerprints.set(2, "fp2", 2000.0)
+        # Fingerprints without a timestamp can't be verified later, so they are not saved
+        index_fingerprints.set(3, "fp3")
+        service_instance_index.load([self.make_instance(1, "one"), self.make_instance(2, "two")])
+
+        snapshot.write_snapshot(self.path)
+        self.assertEqual(os.listdir(self.dir), ["snapshot.json"])
+        self.assertEqual(registry.get("snapshot_writes_total"), 1)
+
+        index_fingerprints.clear()
+        service_instance_index.clear()
+        self.assertTrue(snapshot.read_snapshot(self.path))
+
+        # Restored fingerprints are only used once their instance is seen with the same timestamp
+        self.assertFalse(index_fingerprints.matches(1, "fp1"))
+        index_fingerprints.verify(1, 1000.0)
+        self.assertTrue(index_fingerprints.matches(1, "fp1"))
+        index_fingerprints.verify(2, 2500.0)
+        self.assertFalse(index_fingerprints.matches(2, "fp2"))
+        index_fingerprints.verify(3, None)
+        self.assertFalse(index_fingerprints.matches(3, "fp3"))
+
+        self.assertEqual(service_instance_index.pop_restored("one"), [1])
+        self.assertEqual(service_instance_index.pop_restored("two"), [2])
+
+    def test_unverified_entries_are_kept(self):
+        index_fingerprints.restore({1: ("fp1", 1000.0)})
+        snapshot.write_snapshot(self.path)
+        index_fingerprints.clear()
+        snapshot.read_snapshot(self.path)
+        index_fingerprints.verify(1, 1000.0)
+        self.assertTrue(index_fingerprints.matches(1, "fp1"))
+
+    def test_replace(self):
+        index_fingerprints.set(1, "fp1", 1000.0)
+        snapshot.write_snapshot(self.path)
+        index_fingerprints.set(1, "fp1b", 1001.0)
+        snapshot.write_snapshot(self.path)
+
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)["index_fingerprints"], [[1, "fp1b", 1001.0]])
+
+    def test_failed_write_keeps_old_snapshot(self):
+        index_fingerprints.set(1, "fp1", 1000.0)
+        snapshot.write_snapshot(self.path)
+
+        with patch("snapshot.os.fsync", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                snapshot.write_snapshot(self.path)
+
+        self.assertEqual(os.listdir(self.dir), ["snapshot.json"])
+        index_fingerprints.clear()
+        self.assertTrue(snapshot.read_snapshot(self.path))
+
+    def test_missing(self):
+        self.assertFalse(snapshot.read_snapshot(self.path))
+
+    def test_corrupt(self):
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        self.assertFalse(snapshot.read_snapshot(self.path))
+
+    def test_other_version(self):
+        snapshot.write_snapshot(self.path)
+        with patch("snapshot.code_version", return_value="different"):
+            self.assertFalse(snapshot.read_snapshot(self.path))
+
+    def test_too_old(self):
+        snapshot.write_snapshot(self.path)
+        with patch("snapshot.time.time", return_value=snapshot.time.time() + 120):
+            self.assertFalse(snapshot.read_snapshot(self.path, max_age=60))
+            self.assertTrue(snapshot.read_snapshot(self.path, max_age=300))
+
+    def test_start_from_config_disabled(self):
+        self.assertEqual(snapshot.start_from_config(), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
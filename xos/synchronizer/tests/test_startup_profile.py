@@ -0,0 +1,110 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+from mock import patch
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+import startup_profile
+from metrics import registry
+from startup_profile import StartupProfile
+
+
+class Loader(object):
+    def load(self, clock, seconds):
+        clock.now += seconds
+        return "loaded"
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStartupProfile(unittest.TestCase):
+
+    def setUp(self):
+        registry.clear()
+        self.clock = Clock()
+        self.profile = StartupProfile(clock=self.clock)
+
+    def test_phase(self):
+        with self.profile.phase("config"):
+            self.clock.now += 0.5
+        with self.assertRaises(ValueError):
+            with self.profile.phase("broken"):
+                self.clock.now += 0.25
+                raise ValueError()
+        self.assertEqual(self.profile.phases, [("config", 0.5), ("broken", 0.25)])
+
+    def test_wrap_and_report(self):
+        class FirstLoader(Loader):
+            pass
+
+        class LastLoader(Loader):
+            pass
+
+        self.profile.wrap(FirstLoader, "load", "first_discovery")
+        self.profile.wrap(LastLoader, "load", "last_discovery", finish=True)
+
+        self.assertEqual(FirstLoader().load(self.clock, 1.0), "loaded")
+        self.assertFalse(self.profile.reported)
+        self.assertEqual(LastLoader().load(self.clock, 2.0), "loaded")
+        self.assertTrue(self.profile.reported)
+        # The methods are put back once they have been timed
+        self.assertNotIn("load", FirstLoader.__dict__)
+        self.assertNotIn("load", LastLoader.__dict__)
+
+        samples = dict([(labels.get("phase"), value) for (name, labels, value)
+                        in dict(registry.get_collectors())["startup_profile"]()])
+        self.assertEqual(samples, {None: 3.0, "first_discovery": 1.0, "last_discovery": 2.0})
+
+        # Only the first call is timed
+        LastLoader().load(self.clock, 2.0)
+        self.assertEqual(self.profile.total, 3.0)
+        self.assertEqual(len(self.profile.phases), 2)
+
+    def test_wrap_own_method(self):
+        class OwnLoader(Loader):
+            def load(self, clock, seconds):
+                return Loader.load(self, clock, seconds) + " here"
+
+        method = OwnLoader.__dict__["load"]
+        self.profile.wrap(OwnLoader, "load", "discovery")
+        self.assertEqual(OwnLoader().load(self.clock, 1.0), "loaded here")
+        self.assertEqual(OwnLoader.__dict__["load"], method)
+        self.assertEqual(self.profile.phases, [("discovery", 1.0)])
+
+    def test_disabled(self):
+        with patch("startup_profile.Config.get", return_value={"enabled": False}), \
+                patch.object(startup_profile, "profile", None):
+            self.assertEqual(startup_profile.start_from_config(0), None)
+            self.assertFalse(startup_profile.enabled())
+            with startup_profile.phase("config"):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+from mock import MagicMock, patch
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from xosconfig import Config
+Config.clear()
+Config.init(os.path.join(test_path, "test_config.yaml"), "synchronizer-config-schema.yaml")
+
+from shared_config import shared_config_map_name
+from teardown import Teardown
+
+
+class FakeObject(object):
+    def __init__(self, model, **kwargs):
+        self.model = model
+        self.__dict__.update(kwargs)
+
+    def delete(self):
+        if self.model.fail:
+            raise Exception("delete failed")
+        self.model.rows.remove(self)
+        self.model.deleted.append(self)
+
+
+class FakeManager(object):
+    def __init__(self, model):
+        self.model = model
+
+    def filter(self, **kwargs):
+        self.model.queries += 1
+        objs = self.model.rows
+        for (name, value) in kwargs.items():
+            if name.endswith("__gte"):
+                objs = [obj for obj in objs if getattr(obj, name[:-5]) >= value]
+            elif name.endswith("__lte"):
+                objs = [obj for obj in objs if getattr(obj, name[:-5]) <= value]
+            else:
+                objs = [obj for obj in objs if getattr(obj, name) == value]
+        self.model.fetched += len(objs)
+        return list(objs)
+
+
+class FakeModel(object):
+    """ Just enough of a model for Teardown: objects.filter() on values and ranges, and delete() """
+
+    def __init__(self, name, deleted):
+        self.name = name
+        self.rows = []
+        self.deleted = deleted
+        self.fail = False
+        self.queries = 0
+        self.fetched = 0
+        self.objects = FakeManager(self)
+
+    def create(self, **kwargs):
+        obj = FakeObject(self, **kwargs)
+        self.rows.append(obj)
+        return obj
+
+
+class TestTeardown(unittest.TestCase):
+
+    def setUp(self):
+        self.deleted = []
+        self.model_accessor = MagicMock()
+        for name in ["KubernetesServiceInstance", "KubernetesConfigMap", "KubernetesSecret",
+                     "KubernetesConfigVolumeMount", "KubernetesSecretVolumeMount"]:
+            setattr(self.model_accessor, name, FakeModel(name, self.deleted))
+        self.next_id = 1
+
+    def model(self, name):
+        return getattr(self.model_accessor, name)
+
+    def create(self, model_name, **kwargs):
+        kwargs["id"] = self.next_id
+        self.next_id += 1
+        return self.model(model_name).create(**kwargs)
+
+    def make_instance(self, id, config=None):
+        compute = self.create("KubernetesServiceInstance", name="simpleexampleserviceinstance-%s" % id)
+        if config is None:
+            config = self.create("KubernetesConfigMap", name="simpleexampleserviceinstance-map-%s" % id)
+        secret = self.create("KubernetesSecret", name="simpleexampleserviceinstance-secret-%s" % id)
+        self.create("KubernetesConfigVolumeMount", service_instance_id=compute.id, config_id=config.id)
+        self.create("KubernetesSecretVolumeMount", service_instance_id=compute.id, secret_id=secret.id)
+        return MagicMock(id=id, compute_instance=compute, compute_instance_id=compute.id)
+
+    def remaining(self, model_name):
+        return len(self.model(model_name).rows)
+
+    def test_teardown_order(self):
+        si = self.make_instance(1)
+        report = Teardown(self.model_accessor).teardown([si])
+
+        self.assertEqual([obj.model.name for obj in self.deleted],
+                         ["KubernetesSecretVolumeMount", "KubernetesConfigVolumeMount", "KubernetesSecret",
+                          "KubernetesConfigMap", "KubernetesServiceInstance"])
+        self.assertEqual(report["compute_instances"], [si.compute_instance.id])
+        self.assertEqual(sum([len(ids) for ids in report.values()]), 5)
+
+    def test_dry_run(self):
+        si = self.make_instance(1)
+        report = Teardown(self.model_accessor, dry_run=True).teardown([si])
+
+        self.assertEqual(self.deleted, [])
+        self.assertEqual(report["compute_instances"], [si.compute_instance.id])
+        self.assertEqual(len(report["config_maps"]), 1)
+        self.assertEqual(len(report["secret_mounts"]), 1)
+
+    def test_idempotent(self):
+        si = self.make_instance(1)
+        self.model("KubernetesConfigMap").fail = True
+        with self.assertRaises(Exception):
+            Teardown(self.model_accessor).teardown([si])
+
+        # The config map stage failed, so the compute instance was left to find the rest by
+        self.assertEqual(self.remaining("KubernetesServiceInstance"), 1)
+        self.assertEqual(self.remaining("KubernetesSecret"), 0)
+
+        self.model("KubernetesConfigMap").fail = False
+        report = Teardown(self.model_accessor).teardown([si])
+        self.assertEqual(len(report["config_maps"]), 1)
+        self.assertEqual(report["secrets"], [])
+        self.assertEqual(self.remaining("KubernetesConfigMap"), 0)
+        self.assertEqual(self.remaining("KubernetesServiceInstance"), 0)
+
+        # Once everything is gone, and handle_delete has cleared the compute instance, tearing down again does nothing
+        si.compute_instance = None
+        report = Teardown(self.model_accessor).teardown([si])
+        self.assertEqual(sum([len(ids) for ids in report.values()]), 0)
+
+    def test_shared_config_map(self):
+        shared = self.create("KubernetesConfigMap", name=shared_config_map_name("page"), trust_domain_id=1)
+        first = self.make_instance(1, config=shared)
+        second = self.make_instance(2, config=shared)
+
+        # Still mounted by the second instance
+        report = Teardown(self.model_accessor).teardown([first])
+        self.assertEqual(report["config_maps"], [])
+        self.assertEqual(self.remaining("KubernetesConfigMap"), 1)
+
+        report = Teardown(self.model_accessor).teardown([second])
+        self.assertEqual(report["config_maps"], [shared.id])
+        self.assertEqual(self.remaining("KubernetesConfigMap"), 0)
+
+    def test_shared_config_map_of_another_replica(self):
+        shared = self.create("KubernetesConfigMap", name=shared_config_map_name("page"), trust_domain_id=1)
+        si = self.make_instance(1, config=shared)
+
+        with patch("sharding.owns_shared_config_map", return_value=False):
+            report = Teardown(self.model_accessor).teardown([si])
+        self.assertEqual(report["config_maps"], [])
+        self.assertEqual(self.remaining("KubernetesConfigMap"), 1)
+
+    def test_bulk(self):
+        instances = [self.make_instance(id) for id in range(100)]
+        teardown = Teardown(self.model_accessor)
+        report = teardown.teardown(instances)
+
+        self.assertEqual(len(report["compute_instances"]), 100)
+        for model_name in ["KubernetesServiceInstance", "KubernetesConfigMap", "KubernetesSecret",
+                           "KubernetesConfigVolumeMount", "KubernetesSecretVolumeMount"]:
+            self.assertEqual(self.remaining(model_name), 0)
+            # Each model is fetched with one range of ids, rather than queried for every instance
+            self.assertEqual(self.model(model_name).queries, 1)
+
+    def test_bulk_only_fetches_the_instances(self):
+        others = [self.make_instance(id) for id in range(1000, 1100)]
+        instances = [self.make_instance(id) for id in range(100)]
+        Teardown(self.model_accessor).teardown(instances)
+
+        self.assertEqual(self.remaining("KubernetesServiceInstance"), len(others))
+        # None of the objects of the other instances were fetched
+        for model_name in ["KubernetesServiceInstance", "KubernetesConfigMap", "KubernetesSecret",
+                           "KubernetesConfigVolumeMount", "KubernetesSecretVolumeMount"]:
+            self.assertEqual(self.model(model_name).fetched, 100)
+
+    def test_max_instances(self):
+        instances = [self.make_instance(id) for id in range(30)]
+        teardown = Teardown(self.model_accessor, max_instances=25)
+        report = teardown.teardown(instances)
+        self.assertEqual(len(report["compute_instances"]), 25)
+        self.assertEqual(teardown.remaining, 5)
+
+        # The next pass skips the instances that were torn down, whose compute instances are gone
+        teardown = Teardown(self.model_accessor, max_instances=25)
+        report = teardown.teardown(instances)
+        self.assertEqual(len(report["compute_instances"]), 5)
+        self.assertEqual(teardown.remaining, 0)
+        self.assertEqual(self.remaining("KubernetesConfigMap"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
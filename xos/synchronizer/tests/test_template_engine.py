@@ -0,0 +1,91 @@
+# Copyright 2019-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+test_path = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(test_path, ".."))
+
+from template_engine import TemplateEngine
+
+
+class TestTemplateEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.template_dir = tempfile.mkdtemp()
+        self.override_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.write(self.template_dir, "index.html.j2", "default {{ msg }}")
+        self.engine = TemplateEngine(template_dirs=[self.override_dir, self.template_dir],
+                                     bytecode_cache_dir=self.cache_dir)
+
+    def tearDown(self):
+        for d in [self.template_dir, self.override_dir, self.cache_dir]:
+            shutil.rmtree(d)
+
+    def write(self, dir, name, text):
+        fn = os.path.join(dir, name)
+        if not os.path.exists(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        with open(fn, "w") as f:
+            f.write(text)
+        return fn
+
+    def test_render(self):
+        self.assertEqual(self.engine.render("index.html.j2", {"msg": "hello"}), "default hello")
+
+    def test_template_is_cached(self):
+        t1 = self.engine.get_template("index.html.j2")
+        t2 = self.engine.get_template("index.html.j2")
+        self.assertIs(t1, t2)
+
+    def test_reload_on_mtime_change(self):
+        t1 = self.engine.get_template("index.html.j2")
+        fn = self.write(self.template_dir, "index.html.j2", "changed {{ msg }}")
+        # make sure the mtime moves even on filesystems with coarse timestamps
+        later = time.time() + 10
+        os.utime(fn, (later, later))
+        t2 = self.engine.get_template("index.html.j2")
+        self.assertIsNot(t1, t2)
+        self.assertEqual(t2.render({"msg": "hello"}), "changed hello")
+
+    def test_service_override(self):
+        self.write(self.override_dir, "myservice/index.html.j2", "override {{ msg }}")
+        self.assertEqual(self.engine.render("index.html.j2", {"msg": "hello"}, service_name="myservice"),
+                         "override hello")
+        self.assertEqual(self.engine.render("index.html.j2", {"msg": "hello"}, service_name="otherservice"),
+                         "default hello")
+
+
+    def test_missing_override_rechecked_after_interval(self):
+        now = [1000.0]
+        engine = TemplateEngine(template_dirs=[self.override_dir, self.template_dir],
+                                bytecode_cache_dir=self.cache_dir, clock=lambda: now[0])
+        self.assertEqual(engine.render("index.html.j2", {"msg": "hello"}, service_name="myservice"), "default hello")
+
+        self.write(self.override_dir, "myservice/index.html.j2", "override {{ msg }}")
+        self.assertEqual(engine.render("index.html.j2", {"msg": "hello"}, service_name="myservice"), "default hello")
+
+        now[0] += engine.override_check_interval
+        self.assertEqual(engine.render("index.html.j2", {"msg": "hello"}, service_name="myservice"),
+                         "override hello")
+
+
+if __name__ == '__main__':
+    unittest.main()